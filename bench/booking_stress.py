@@ -0,0 +1,64 @@
+"""Fire parallel bookings at one doctor slot and check exactly one wins.
+
+    python bench/booking_stress.py [--threads 50]
+"""
+import datetime
+import os
+import sys
+import tempfile
+import threading
+
+import jwt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from hospital import create_app
+from hospital.extensions import db
+from hospital.models import Doctor, Patient, Role, User
+
+
+def main(threads=50):
+    path = os.path.join(tempfile.mkdtemp(), 'stress.db')
+    # rate limits and load shedding would answer some requests before they
+    # reach the database; the point here is the database's own check
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + path, 'RATE_LIMITS': {},
+                      'SHED_CLINICAL_MAX_IN_FLIGHT': threads, 'SHED_MAX_IN_FLIGHT': threads})
+
+    with app.app_context():
+        db.create_all()
+        role = Role(name='admin')
+        db.session.add(role)
+        db.session.flush()
+        db.session.add(User(username='admin', password='-', role_id=role.id))
+        db.session.add(Doctor(first_name='Ada', last_name='Doe', specialization='GP'))
+        db.session.add(Patient(first_name='Bob', last_name='Roe', date_of_birth=datetime.date(1980, 1, 1),
+                               gender='male', contact_number='0', email='b@example.com', address='-'))
+        db.session.commit()
+        token = jwt.encode({'id': 1, 'role_id': role.id, 'exp': datetime.datetime.utcnow() + datetime.timedelta(minutes=5)},
+                           app.config['SECRET_KEY'], algorithm='HS256')
+
+    statuses = []
+    barrier = threading.Barrier(threads)
+
+    def book():
+        client = app.test_client()
+        barrier.wait()
+        response = client.post('/appointments', headers={'Authorization': token},
+                               json={'patient_id': 1, 'doctor_id': 1, 'appointment_date': '2030-01-07', 'appointment_time': '09:00:00'})
+        statuses.append(response.status_code)
+
+    workers = [threading.Thread(target=book) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    created = statuses.count(200)
+    conflicts = statuses.count(409)
+    print('%d requests: %d created, %d conflicts, other %s' % (threads, created, conflicts, sorted(set(statuses) - {200, 409})))
+    return created == 1 and conflicts == threads - 1
+
+
+if __name__ == '__main__':
+    threads = int(sys.argv[sys.argv.index('--threads') + 1]) if '--threads' in sys.argv else 50
+    sys.exit(0 if main(threads) else 1)
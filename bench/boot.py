@@ -0,0 +1,101 @@
+"""Measure cold-start time and per-worker memory.
+
+    python bench/boot.py                 # cold start of create_app()
+    python bench/boot.py --workers PID ...  # RSS/PSS of running workers
+    python bench/boot.py --gunicorn CONFIG  # start gunicorn, warm it, RSS/PSS of its workers
+
+Compare preload on and off with a config that execs gunicorn.conf.py and
+then sets preload_app = False.
+"""
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+COLD_START = '''
+import time
+started = time.perf_counter()
+from hospital import create_app
+create_app()
+print(time.perf_counter() - started)
+'''
+
+
+def cold_start(runs=10):
+    timings = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', COLD_START])
+        timings.append(float(output))
+    timings.sort()
+    return timings[len(timings) // 2], timings[0], timings[-1]
+
+
+def memory(pid):
+    # PSS splits shared pages between the processes that map them, so it is
+    # the number that shows copy-on-write sharing
+    values = {}
+    with open('/proc/%s/smaps_rollup' % pid) as smaps:
+        for line in smaps:
+            name, _, rest = line.partition(':')
+            if name in ('Rss', 'Pss', 'Shared_Clean', 'Private_Dirty'):
+                values[name] = int(rest.split()[0])
+    return values
+
+
+# the worker pids of a gunicorn master, from /proc
+def children(pid):
+    pids = []
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open('/proc/%s/stat' % entry) as stat:
+                    if int(stat.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        pids.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    return sorted(pids)
+
+
+def get(url):
+    try:
+        urllib.request.urlopen(url, timeout=5).read()
+    except urllib.error.HTTPError:
+        pass
+
+
+def gunicorn(config, bind='127.0.0.1:8123', requests=200):
+    url = 'http://%s/analytics/patient-status' % bind
+    master = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', config, '-b', bind, 'wsgi:app'],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                get(url)
+                break
+            except OSError:
+                time.sleep(0.1)
+        # a few requests per worker, so each has touched its request path
+        for _ in range(requests):
+            get(url)
+        time.sleep(1)
+        return {pid: memory(pid) for pid in children(master.pid)}
+    finally:
+        master.terminate()
+        master.wait()
+
+
+def show(workers):
+    for pid, values in sorted(workers.items()):
+        print(pid, ' '.join('%s=%dkB' % item for item in sorted(values.items())))
+
+
+if __name__ == '__main__':
+    if '--gunicorn' in sys.argv:
+        show(gunicorn(sys.argv[sys.argv.index('--gunicorn') + 1]))
+    elif '--workers' in sys.argv:
+        show({pid: memory(pid) for pid in sys.argv[sys.argv.index('--workers') + 1:]})
+    else:
+        median, best, worst = cold_start()
+        print('create_app: median %.1f ms (min %.1f, max %.1f)' % (median * 1000, best * 1000, worst * 1000))
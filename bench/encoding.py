@@ -0,0 +1,76 @@
+"""Compare encode time and bytes on the wire for the main list payloads.
+
+    python bench/encoding.py [--rows 10000]
+
+Codecs whose library is not installed (msgpack, brotli) are skipped.
+"""
+import datetime
+import gzip
+import json
+import random
+import sys
+import time
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# payloads shaped like the /appointments and /patient-tests responses
+def appointments(rows):
+    start = datetime.datetime(2024, 1, 1, 8)
+    result = []
+    for id in range(1, rows + 1):
+        date_time = start + datetime.timedelta(minutes=15 * random.randrange(100000))
+        result.append({'id': id, 'patient_id': random.randrange(1, 50000), 'doctor_id': random.randrange(1, 300),
+                       'appointment_date': date_time.strftime('%Y-%m-%d'), 'appointment_time': date_time.strftime('%H:%M:%S'),
+                       'status': random.choice(['Confirmed', 'Completed', 'Cancelled'])})
+    return {'appointments': result}
+
+def patient_tests(rows):
+    result = []
+    for id in range(1, rows + 1):
+        result.append({'id': id, 'patient_id': random.randrange(1, 50000), 'test_date': '2024-%02d-%02d' % (random.randrange(1, 13), random.randrange(1, 29)),
+                       'test_name': random.choice(['Creatinine', 'HbA1c', 'Haemoglobin', 'Potassium', 'CRP']),
+                       'test_result': '%.1f' % random.uniform(0, 200)})
+    return {'patient_tests': result}
+
+
+def codecs():
+    yield 'json', lambda obj: json.dumps(obj, separators=(',', ':')).encode('utf-8')
+    yield 'json+gzip', lambda obj: gzip.compress(json.dumps(obj, separators=(',', ':')).encode('utf-8'), compresslevel=6)
+    if brotli:
+        yield 'json+br', lambda obj: brotli.compress(json.dumps(obj, separators=(',', ':')).encode('utf-8'), quality=4)
+    if msgpack:
+        yield 'msgpack', msgpack.packb
+        yield 'msgpack+gzip', lambda obj: gzip.compress(msgpack.packb(obj), compresslevel=6)
+        if brotli:
+            yield 'msgpack+br', lambda obj: brotli.compress(msgpack.packb(obj), quality=4)
+
+
+def measure(encode, payload, repeat=5):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        data = encode(payload)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(data)
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[sys.argv.index('--rows') + 1]) if '--rows' in sys.argv else 10000
+    random.seed(1)
+    for name, payload in (('appointments', appointments(rows)), ('patient-tests', patient_tests(rows))):
+        print('%s (%d rows)' % (name, rows))
+        baseline = None
+        for codec, encode in codecs():
+            elapsed, size = measure(encode, payload)
+            baseline = baseline or size
+            print('  %-14s %8.1f ms %10d bytes %6.1f%%' % (codec, elapsed * 1000, size, 100.0 * size / baseline))
@@ -0,0 +1,26 @@
+import gc
+
+bind = '0.0.0.0:8000'
+workers = 4
+
+# threads let a worker hold many open dashboard streams
+worker_class = 'gthread'
+threads = 64
+
+# load the app once in the master so workers share its memory copy-on-write
+preload_app = True
+
+
+def pre_fork(server, worker):
+    # move everything loaded so far out of the collector's reach, so a gc pass
+    # in a worker does not touch (and copy) the shared pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # connections opened by the master must not be shared with the workers
+    from hospital.extensions import db
+    from wsgi import app
+
+    with app.app_context():
+        db.engine.dispose(close=False)
@@ -0,0 +1,79 @@
+import importlib
+import sqlite3
+from flask import Flask, jsonify
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import configure_mappers
+
+from hospital import limits, negotiation, sharding
+from hospital.config import Config
+from hospital.extensions import db
+
+
+def create_app(config=None):
+    app = Flask(__name__, template_folder='../templates')
+    app.config.from_object(Config)
+    app.config.from_envvar('HOSPITAL_SETTINGS', silent=True)
+    if config:
+        app.config.from_mapping(config)
+
+    # shard binds have to be in the config before the engines are created
+    sharding.init_app(app)
+    db.init_app(app)
+
+    # msgpack or json by Accept, gzip/brotli by Accept-Encoding
+    negotiation.init_app(app)
+
+    # per-user token buckets and load shedding under overload
+    limits.init_app(app)
+
+    # model listeners run whichever blueprints are on: every write is recorded
+    # in the change log, admissions keep the census snapshots current,
+    # numeric test results are copied to the lab result store, patients
+    # keep their duplicate matching keys and their list summaries,
+    # appointments keep the doctors' booked slots, patients and their
+    # history entries keep their versions and commits invalidate the result
+    # cache
+    importlib.import_module('hospital.changes')
+    importlib.import_module('hospital.census')
+    importlib.import_module('hospital.labs')
+    importlib.import_module('hospital.matching')
+    importlib.import_module('hospital.utilization')
+    importlib.import_module('hospital.versions')
+    importlib.import_module('hospital.summaries')
+    importlib.import_module('hospital.cache')
+
+    # blueprints are only imported here, so importing the package stays cheap
+    for module_name in app.config['BLUEPRINTS']:
+        module = importlib.import_module(module_name)
+        app.register_blueprint(module.bp)
+
+    # build the mappers now so a preloading master does it once for every worker
+    configure_mappers()
+
+    register_error_handlers(app)
+
+    from hospital.archive import archive_cli
+    app.cli.add_command(archive_cli)
+
+    return app
+
+
+# WAL lets long readers, such as streaming exports, run alongside writers
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(connection, connection_record):
+    if isinstance(connection, sqlite3.Connection):
+        cursor = connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.close()
+
+
+# Error handling
+def register_error_handlers(app):
+    @app.errorhandler(404)
+    def page_not_found(e):
+        return jsonify({'message': 'The requested resource could not be found'}), 404
+
+    @app.errorhandler(500)
+    def internal_server_error(e):
+        return jsonify({'message': 'Internal server error'}), 500
@@ -0,0 +1,154 @@
+import datetime
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import and_, literal, or_, select, union_all
+
+from hospital.changes import prune_change_log
+from hospital.extensions import db
+from hospital.listing import conditions, limit_page, merge_rows, ordering, shard_window
+from hospital.models import (Admission, AdmissionArchive, Appointment, AppointmentArchive,
+                             ArchiveState, PatientTest, PatientTestArchive)
+from hospital.sharding import scatter, sharding_enabled
+
+
+# which records are closed, and old enough, to leave the hot table
+def closed_appointments(cutoff):
+    return and_(Appointment.status.in_(['Completed', 'Cancelled']), Appointment.date_time < cutoff)
+
+def closed_admissions(cutoff):
+    return or_(Admission.discharge_date_time < cutoff,
+               and_(Admission.status == 'Cancelled', Admission.registration_date_time < cutoff))
+
+def old_patient_tests(cutoff):
+    return PatientTest.test_date_time < cutoff
+
+
+# table name -> (hot model, archive model, time column, closed condition)
+ARCHIVES = {
+    'appointment': (Appointment, AppointmentArchive, 'date_time', closed_appointments),
+    'admission': (Admission, AdmissionArchive, 'registration_date_time', closed_admissions),
+    'patient_test': (PatientTest, PatientTestArchive, 'test_date_time', old_patient_tests),
+}
+
+
+def archive_horizon(table_name):
+    return db.session.query(ArchiveState.horizon).filter(ArchiveState.table_name == table_name).scalar()
+
+
+# move closed rows older than cutoff into the archive table, one batch per
+# transaction; an interrupted run just continues with the rows still left
+def archive_table(table_name, cutoff, batch_size):
+    model, archive_model, time_column, closed = ARCHIVES[table_name]
+    hot = model.__table__
+    archive = archive_model.__table__
+
+    # record the horizon first, so reads union the archive before any row moves
+    state = db.session.get(ArchiveState, table_name)
+    if state is None:
+        db.session.add(ArchiveState(table_name=table_name, horizon=cutoff))
+    elif state.horizon < cutoff:
+        state.horizon = cutoff
+    db.session.commit()
+
+    columns = [column.name for column in hot.columns]
+    moved = 0
+    while True:
+        ids = [id for id, in db.session.execute(
+            select(hot.c.id).where(closed(cutoff)).order_by(hot.c.id).limit(batch_size))]
+        if not ids:
+            break
+
+        now = datetime.datetime.utcnow()
+        rows = select(*[hot.c[name] for name in columns], literal(now)).where(hot.c.id.in_(ids))
+        db.session.execute(archive.insert().prefix_with('OR IGNORE').from_select(columns + ['archived_at'], rows))
+        db.session.execute(hot.delete().where(hot.c.id.in_(ids)))
+        db.session.commit()
+        moved += len(ids)
+
+    return moved
+
+
+def archive_all(horizon_days=None, batch_size=None):
+    horizon_days = horizon_days or current_app.config['ARCHIVE_HORIZON_DAYS']
+    batch_size = batch_size or current_app.config['ARCHIVE_BATCH_SIZE']
+    cutoff = datetime.datetime.combine(datetime.date.today() - datetime.timedelta(days=horizon_days), datetime.time())
+    # every shard archives its own rows
+    moved = scatter(lambda shard: {table_name: archive_table(table_name, cutoff, batch_size) for table_name in ARCHIVES})
+    return {table_name: sum(counts[table_name] for counts in moved) for table_name in ARCHIVES}
+
+
+def prune_old_changes(batch_size=None):
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=current_app.config['CHANGE_LOG_RETENTION_DAYS'])
+    return prune_change_log(cutoff, batch_size or current_app.config['ARCHIVE_BATCH_SIZE'])
+
+
+# rows of table_name with their time column in [start, end], narrowed by the
+# list criteria, in the given order and page (see hospital.listing). The
+# archive is only read when the range reaches back past its horizon; then
+# both tables are merged in one UNION ALL so sorting and paging span them
+def rows_in_range(table_name, start=None, end=None, columns=None, criteria=(), order=(), window=None):
+    model, archive_model, time_column, closed = ARCHIVES[table_name]
+    columns = columns or [getattr(model, column.key) for column in model.__table__.columns]
+
+    # the requested columns come first, so their positions match the projection
+    keys = []
+    for key in [column.key for column in columns] + [key for key, descending in order] + [time_column, 'id']:
+        if key not in keys:
+            keys.append(key)
+
+    order = list(order) or [(time_column, False)]
+
+    def select_from(source):
+        query = select(*[getattr(source, key).label(key) for key in keys]).where(*conditions(source, criteria))
+        if start:
+            query = query.where(getattr(source, time_column) >= start)
+        if end:
+            query = query.where(getattr(source, time_column) <= end)
+        return query
+
+    # each shard keeps its own horizon
+    def read(window):
+        selects = [select_from(model)]
+        horizon = archive_horizon(table_name)
+        if horizon is not None and (start is None or start < horizon):
+            selects.insert(0, select_from(archive_model))
+
+        rows = (union_all(*selects) if len(selects) > 1 else selects[0]).subquery()
+        query = select(rows).order_by(*ordering(rows.c, order))
+        return db.session.execute(limit_page(query, window)).all()
+
+    if not sharding_enabled():
+        return read(window)
+    return merge_rows(scatter(lambda shard: read(shard_window(window))), order, window)
+
+
+# a single row by id, from the hot table or else from the archive
+def get_row(table_name, id, columns=None):
+    model, archive_model, time_column, closed = ARCHIVES[table_name]
+
+    def lookup(source):
+        if columns:
+            return source.query.with_entities(*[getattr(source, column.key) for column in columns]) \
+                .filter(source.id == id).first()
+        return source.query.get(id)
+
+    def find(shard):
+        row = lookup(model)
+        if row is None and archive_horizon(table_name) is not None:
+            row = lookup(archive_model)
+        return row
+
+    return next((row for row in scatter(find) if row is not None), None)
+
+
+archive_cli = AppGroup('archive')
+
+# flask archive run [--horizon-days N] [--batch-size N]
+@archive_cli.command('run')
+@click.option('--horizon-days', type=int, default=None)
+@click.option('--batch-size', type=int, default=None)
+def run_archive_command(horizon_days, batch_size):
+    for table_name, moved in archive_all(horizon_days, batch_size).items():
+        click.echo('%s: %d rows archived' % (table_name, moved))
+    click.echo('change_log: %d rows pruned' % prune_old_changes(batch_size))
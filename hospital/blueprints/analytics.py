@@ -0,0 +1,300 @@
+import click
+import datetime
+import queue
+from flask import Blueprint, Response, current_app, jsonify, request
+from sqlalchemy import distinct, func, or_
+
+from hospital.cache import cached_result
+from hospital.census import census, rebuild_snapshots
+from hospital.dashboard import dashboard_stats, get_broadcaster
+from hospital.listing import parse_datetime_arg, plain
+from hospital.models import (Appointment, Doctor, DoctorAvailability, HospitalStaff, OperationTheatreBooking,
+                             Patient, PatientSummary, StaffAttendance, StaffAvailability)
+from hospital.permissions import permission_required, token_required
+from hospital.reports import hospital_revenues, patient_test_records
+from hospital.sharding import count_rows, scatter, sum_by_key
+from hospital.utilization import doctor_utilization, rebuild_bookings
+
+bp = Blueprint('analytics', __name__)
+
+
+################ ADMIN ##########
+#Admin Dashboard API
+@bp.route('/dashboard', methods=['GET'])
+@token_required
+@permission_required('dashboard:read')
+def admin_dashboard(current_user):
+
+    return jsonify(dashboard_stats())
+
+
+# API to stream hospital statistics to a dashboard as server-sent events
+@bp.route('/dashboard/stream', methods=['GET'])
+@token_required
+@permission_required('dashboard:read')
+def stream_dashboard(current_user):
+    broadcaster = get_broadcaster(current_app._get_current_object())
+    keepalive = current_app.config['DASHBOARD_KEEPALIVE']
+
+    def stream():
+        subscriber = broadcaster.subscribe()
+        try:
+            while True:
+                try:
+                    yield subscriber.get(timeout=keepalive)
+                except queue.Empty:
+                    # a comment line keeps proxies from closing an idle stream
+                    yield ': keep-alive\n\n'
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@bp.route('/analytics/patient-status', methods=['GET'])
+@token_required
+@permission_required('analytics:patient-status')
+def get_patient_status(current_user):
+    # answered from the result cache until one of these tables is written;
+    # the summaries are kept current by patient and admission writes
+    def compute():
+        # get the total number of patients
+        total_patients = count_rows(Patient)
+
+        # get the number of patients by the status of their latest admission
+        # (None for patients never admitted)
+        statuses = sum_by_key(scatter(lambda shard: PatientSummary.query.with_entities(PatientSummary.admission_status, func.count(PatientSummary.id)).group_by(PatientSummary.admission_status).all()))
+
+        # create a dictionary with the data
+        data = {
+            'total_patients': total_patients,
+            'statuses': [{'status': status, 'count': count} for status, count in statuses]
+        }
+
+        return data
+
+    return jsonify(cached_result(('patient', 'admission'), compute))
+
+
+# API to get hospital revenues, optionally filtered by date
+@bp.route('/analytics/hospital-revenues', methods=['GET'])
+@token_required
+@permission_required('analytics:hospital-revenues')
+def get_hospital_revenues(current_user):
+
+    # get the parameters from the query string
+    date_start = request.args.get('date_start')
+    date_end = request.args.get('date_end')
+
+    return jsonify(hospital_revenues(date_start, date_end))
+
+
+#API to get doctor availability and attendance
+@bp.route('/analytics/doctor-availability', methods=['GET'])
+@token_required
+@permission_required('analytics:doctor-availability')
+def get_doctor_availability(current_user):
+    # answered from the result cache until one of these tables is written
+    def compute():
+        # get the total number of doctors
+        total_doctors = Doctor.query.count()
+
+        # get the number of available doctors for each day of the week (0 is Monday)
+        availabilities = DoctorAvailability.query.with_entities(DoctorAvailability.day_of_week, func.count(distinct(DoctorAvailability.doctor_id))).group_by(DoctorAvailability.day_of_week).order_by(DoctorAvailability.day_of_week).all()
+
+        # get the number of appointments kept (not cancelled) for each doctor
+        attendances = sum_by_key(scatter(lambda shard: Appointment.query.with_entities(Appointment.doctor_id, func.count(Appointment.id)).filter(Appointment.status != 'Cancelled').group_by(Appointment.doctor_id).all()))
+
+        # create a dictionary with the data
+        data = {
+            'total_doctors': total_doctors,
+            'availabilities': [{'day_of_week': day_of_week, 'available_doctors': available_doctors} for day_of_week, available_doctors in availabilities],
+            'attendances': [{'doctor_id': doctor_id, 'attended_appointments': attended_appointments} for doctor_id, attended_appointments in attendances]
+        }
+
+        return data
+
+    return jsonify(cached_result(('doctor', 'doctor_availability', 'appointment'), compute))
+
+
+# API to get how much of each doctor's available time is booked, e.g.
+# /analytics/doctor-utilization?start=2024-01-01&end=2024-12-31&group=week&doctor_id=1,2
+@bp.route('/analytics/doctor-utilization', methods=['GET'])
+@token_required
+@permission_required('analytics:doctor-utilization')
+def get_doctor_utilization(current_user):
+
+    # get the parameters from the query string; the last four weeks by default
+    try:
+        end = datetime.datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else datetime.date.today()
+        start = datetime.datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start') else end - datetime.timedelta(days=27)
+        doctor_ids = [int(id) for id in request.args.get('doctor_id', '').split(',') if id.strip()]
+    except ValueError:
+        return jsonify({'message': 'start and end must be YYYY-MM-DD and doctor_id a comma separated list of ids'}), 400
+    group = request.args.get('group', 'day')
+
+    if group not in ('day', 'week'):
+        return jsonify({'message': 'group must be day or week'}), 400
+    if end < start or (end - start).days >= current_app.config['UTILIZATION_MAX_DAYS']:
+        return jsonify({'message': 'start must be before end and the range at most %d days' % current_app.config['UTILIZATION_MAX_DAYS']}), 400
+
+    def compute():
+        ids = doctor_ids or [id for id, in Doctor.query.with_entities(Doctor.id).order_by(Doctor.id)]
+        return doctor_utilization(sorted(set(ids)), start, end, group)
+
+    return jsonify(cached_result(('doctor', 'doctor_availability', 'appointment'), compute))
+
+
+# API to get staff availability and attendance
+@bp.route('/analytics/staff-availability', methods=['GET'])
+@token_required
+@permission_required('analytics:staff-availability')
+def get_staff_availability(current_user):
+    # answered from the result cache until one of these tables is written
+    def compute():
+        # get the total number of staff members
+        total_staff = HospitalStaff.query.count()
+
+        # get the number of staff members available on each date
+        day = func.date(StaffAvailability.start_time)
+        availabilities = StaffAvailability.query.with_entities(day, func.count(distinct(StaffAvailability.staff_id))).group_by(day).order_by(day).all()
+
+        # get the number of days each staff member was present
+        attendances = StaffAttendance.query.with_entities(StaffAttendance.staff_id, func.count(StaffAttendance.id)).filter(StaffAttendance.status == 'Present').group_by(StaffAttendance.staff_id).order_by(StaffAttendance.staff_id).all()
+
+        # create a dictionary with the data
+        data = {
+            'total_staff': total_staff,
+            'availabilities': [{'date': date, 'available_staff': available_staff} for date, available_staff in availabilities],
+            'attendances': [{'staff_id': staff_id, 'days_present': days_present} for staff_id, days_present in attendances]
+        }
+
+        return data
+
+    return jsonify(cached_result(('hospital_staff', 'staff_availability', 'staff_attendance'), compute))
+
+
+
+# API to get filtered patient test records
+@bp.route('/analytics/patient-test-records', methods=['GET'])
+@token_required
+@permission_required('analytics:patient-test-records')
+def get_patient_test_records(current_user):
+
+    # get the parameters from the query string
+    patient_id = request.args.get('patient_id')
+    test_type = request.args.get('test_type')
+    test_date_start = request.args.get('test_date_start')
+    test_date_end = request.args.get('test_date_end')
+
+    return jsonify(patient_test_records(patient_id, test_type, test_date_start, test_date_end))
+
+
+# API to get operation theatre bookings filtered by doctor, patient and date
+# range, e.g. /analytics/operation-theatre-bookings?doctor_id=1&date_start=2024-01-01
+@bp.route('/analytics/operation-theatre-bookings', methods=['GET'])
+@token_required
+@permission_required('analytics:operation-theatre-bookings')
+def get_operation_theatre_bookings(current_user):
+
+    # get the parameters from the query string
+    try:
+        doctor_id = int(request.args['doctor_id']) if request.args.get('doctor_id') else None
+        patient_id = int(request.args['patient_id']) if request.args.get('patient_id') else None
+        date_start = datetime.datetime.strptime(request.args['date_start'], '%Y-%m-%d').date() if request.args.get('date_start') else None
+        date_end = datetime.datetime.strptime(request.args['date_end'], '%Y-%m-%d').date() if request.args.get('date_end') else None
+    except ValueError:
+        return jsonify({'message': 'doctor_id and patient_id must be ids and date_start and date_end YYYY-MM-DD'}), 400
+
+    # answered from the result cache until one of these tables is written
+    def compute():
+        # query the database based on the parameters
+        query = OperationTheatreBooking.query
+        if doctor_id is not None:
+            query = query.filter(OperationTheatreBooking.doctor_id == doctor_id)
+        if patient_id is not None:
+            query = query.filter(OperationTheatreBooking.patient_id == patient_id)
+        if date_start:
+            query = query.filter(OperationTheatreBooking.date >= date_start)
+        if date_end:
+            query = query.filter(OperationTheatreBooking.date <= date_end)
+        bookings = query.order_by(OperationTheatreBooking.date, OperationTheatreBooking.start_time, OperationTheatreBooking.id).all()
+
+        # create a list with the data
+        data = [{'id': booking.id, 'patient_id': booking.patient_id, 'doctor_id': booking.doctor_id, 'operation_type': booking.operation_type,
+                 'date': plain(booking.date), 'start_time': plain(booking.start_time), 'end_time': plain(booking.end_time)} for booking in bookings]
+
+        return data
+
+    return jsonify(cached_result(('operation_theatre_booking',), compute))
+
+
+# API to get hospital staff members filtered by job title and name, e.g.
+# /analytics/hospital-staff?job_title=Nurse&name=ann
+@bp.route('/analytics/hospital-staff', methods=['GET'])
+@token_required
+@permission_required('analytics:hospital-staff')
+def get_hospital_staff(current_user):
+
+    # get the parameters from the query string
+    job_title = request.args.get('job_title')
+    name = request.args.get('name')
+
+    # answered from the result cache until one of these tables is written
+    def compute():
+        # query the database based on the parameters; the name matches the
+        # first or the last name
+        query = HospitalStaff.query
+        if job_title:
+            query = query.filter(HospitalStaff.job_title == job_title)
+        if name:
+            pattern = '%{}%'.format(name)
+            query = query.filter(or_(HospitalStaff.first_name.ilike(pattern), HospitalStaff.last_name.ilike(pattern)))
+        staff_members = query.order_by(HospitalStaff.last_name, HospitalStaff.first_name, HospitalStaff.id).all()
+
+        # create a list with the data
+        data = [{'id': staff.id, 'first_name': staff.first_name, 'last_name': staff.last_name, 'job_title': staff.job_title} for staff in staff_members]
+
+        return data
+
+    return jsonify(cached_result(('hospital_staff',), compute))
+
+
+# API to get the hourly (or any step) inpatient census over a date range
+@bp.route('/analytics/bed-census', methods=['GET'])
+@token_required
+@permission_required('analytics:bed-census')
+def get_bed_census(current_user):
+
+    # get the parameters from the query string; a bare date is its midnight
+    start = parse_datetime_arg('start', required=True)
+    end = parse_datetime_arg('end', required=True)
+    try:
+        step = datetime.timedelta(minutes=int(request.args.get('step', 60)))
+    except (OverflowError, ValueError):
+        # a step past timedelta's range (about 2.7 million years) overflows
+        return jsonify({'message': 'step must be a whole number of minutes'}), 400
+
+    if end < start or step.total_seconds() <= 0:
+        return jsonify({'message': 'start must be before end and step must be positive'}), 400
+    if (end - start) / step > current_app.config['CENSUS_MAX_POINTS']:
+        return jsonify({'message': 'Too many points, use a larger step'}), 400
+
+    series = census(start, end, step)
+
+    return jsonify({
+        'census': [{'time': time.strftime('%Y-%m-%d %H:%M'), 'occupancy': occupancy} for time, occupancy in series],
+        'peak': max(occupancy for time, occupancy in series)
+    })
+
+
+# flask analytics rebuild-census
+@bp.cli.command('rebuild-census')
+def rebuild_census_command():
+    rebuild_snapshots()
+
+
+# flask analytics rebuild-utilization
+@bp.cli.command('rebuild-utilization')
+def rebuild_utilization_command():
+    click.echo('%d doctor days' % rebuild_bookings())
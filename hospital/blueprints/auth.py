@@ -0,0 +1,149 @@
+import datetime
+from flask import Blueprint, current_app, jsonify, make_response, request, session
+import jwt
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from hospital.extensions import db
+from hospital.listing import bad_request, list_rows, projection
+from hospital.models import Doctor, Role, User
+from hospital.permissions import permission_required, token_required
+from hospital.schemas import Schema, assign
+
+bp = Blueprint('auth', __name__)
+
+# public field name -> column, selectable with ?fields=
+USER_FIELDS = {
+    'id': User.id,
+    'username': User.username,
+    'role_id': User.role_id,
+    'doctor_id': User.doctor_id,
+}
+USER_SCHEMA = Schema(USER_FIELDS)
+
+
+# Authentication API
+@bp.route('/login', methods=['POST'])
+def login():
+    auth_data = request.json
+    if not auth_data or not auth_data['username'] or not auth_data['password']:
+        return make_response('Could not verify', 401, {'WWW-Authenticate': 'Basic realm="Login required!"'})
+    
+    user = User.query.filter_by(username=auth_data['username']).first()
+
+    if not user:
+        return make_response('Could not verify', 401, {'WWW-Authenticate': 'Basic realm="Login required!"'})
+
+    if check_password_hash(user.password, auth_data['password']):
+        # the role is looked up on every request (see token_required), so it is not in the token
+        token = jwt.encode({'id': user.id, 'exp': datetime.datetime.utcnow() + datetime.timedelta(minutes=30)}, current_app.config['SECRET_KEY'])
+        return jsonify({'token': token})
+
+    return make_response('Could not verify', 401, {'WWW-Authenticate': 'Basic realm="Login required!"'})
+
+
+@bp.route('/logout', methods=['POST'])
+def logout():
+    return jsonify({'message': 'Logged out successfully'})
+
+
+# Sign-Out API
+@bp.route('/sign-out', methods=['POST'])
+def sign_out():
+    session.pop('user_id', None)
+    return jsonify({'message': 'Signed out successfully'})
+
+
+# User and Role API
+@bp.route('/users', methods=['GET'])
+@token_required
+def get_all_users(current_user):
+
+    columns, serialize = projection(USER_FIELDS)
+    users, page = list_rows(User.query.with_entities(*columns), User, USER_FIELDS)
+
+    return jsonify(dict(page, users=[serialize(user) for user in users]))
+
+
+@bp.route('/users/<int:id>', methods=['GET'])
+@token_required
+def get_user(current_user, id):
+
+    columns, serialize = projection(USER_FIELDS)
+    user = User.query.with_entities(*columns).filter(User.id == id).first()
+    if not user:
+        return jsonify({'message': 'User not found'})
+
+    return jsonify({'user': serialize(user)})
+
+
+def check_role(role_id):
+    if db.session.get(Role, role_id) is None:
+        bad_request('Invalid request', errors={'role_id': 'is not a role'})
+
+def check_doctor(doctor_id):
+    if doctor_id is not None and db.session.get(Doctor, doctor_id) is None:
+        bad_request('Invalid request', errors={'doctor_id': 'is not a doctor'})
+
+def check_username(username, id=None):
+    if User.query.filter(User.username == username, User.id != id).first() is not None:
+        bad_request('Invalid request', errors={'username': 'is taken'})
+
+
+@bp.route('/users', methods=['POST'])
+@token_required
+@permission_required('users:write')
+def create_user(current_user):
+    data = request.get_json(silent=True)
+    values = USER_SCHEMA.load(data)
+    if not isinstance(data.get('password'), str) or not data['password']:
+        bad_request('Invalid request', errors={'password': 'is required'})
+    check_role(values['role_id'])
+    check_doctor(values.get('doctor_id'))
+    check_username(values['username'])
+
+    # hashed the way login checks it
+    new_user = User(password=generate_password_hash(data['password']), **values)
+
+    db.session.add(new_user)
+    db.session.commit()
+
+    return jsonify({'message': 'User created'})
+
+
+
+@bp.route('/users/<int:id>', methods=['PUT'])
+@token_required
+@permission_required('users:write')
+def update_user(current_user, id):
+
+    user = User.query.filter_by(id=id).first()
+    if not user:
+        return jsonify({'message': 'User not found'})
+
+    values = USER_SCHEMA.load(request.get_json(silent=True), partial=True)
+    if 'role_id' in values:
+        check_role(values['role_id'])
+    if 'doctor_id' in values:
+        check_doctor(values['doctor_id'])
+    if 'username' in values:
+        check_username(values['username'], id)
+    assign(user, values)
+
+    db.session.commit()
+
+    return jsonify({'message': 'User updated'})
+
+
+@bp.route('/users/<int:id>', methods=['DELETE'])
+@token_required
+@permission_required('users:write')
+def delete_user(current_user, id):
+
+    user = User.query.filter_by(id=id).first()
+    if not user:
+        return jsonify({'message': 'User not found'})
+
+    db.session.delete(user)
+    db.session.commit()
+
+    return jsonify({'message': 'User deleted'})
@@ -0,0 +1,39 @@
+import time
+from flask import Blueprint, current_app, jsonify, request
+
+from hospital.changes import wait_for_changes
+from hospital.extensions import db
+from hospital.models import ChangeLog
+from hospital.permissions import permission_required, token_required
+
+bp = Blueprint('changes', __name__)
+
+
+# API to get the changes after a sequence number, waiting for new ones if asked
+@bp.route('/changes', methods=['GET'])
+@token_required
+@permission_required('changes:read')
+def get_changes(current_user):
+
+    # get the parameters from the query string
+    since = request.args.get('since', 0, type=int)
+    limit = min(request.args.get('limit', 500, type=int), current_app.config['CHANGES_MAX_LIMIT'])
+    wait = min(request.args.get('wait', 0, type=float), current_app.config['CHANGES_MAX_WAIT'])
+
+    deadline = time.monotonic() + wait
+    while True:
+        changes = ChangeLog.query.filter(ChangeLog.seq > since).order_by(ChangeLog.seq).limit(limit).all()
+        remaining = deadline - time.monotonic()
+        if changes or remaining <= 0:
+            break
+
+        # end the read transaction so the next query sees other workers' commits
+        db.session.rollback()
+        wait_for_changes(min(remaining, current_app.config['CHANGES_POLL_INTERVAL']))
+
+    data = [{'seq': change.seq, 'entity': change.entity, 'id': change.entity_id, 'operation': change.operation} for change in changes]
+
+    return jsonify({
+        'changes': data,
+        'last_seq': changes[-1].seq if changes else since
+    })
@@ -0,0 +1,115 @@
+import csv
+import datetime
+import io
+import json
+import zlib
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+
+from hospital.extensions import db
+from hospital.models import (Admission, AdmissionArchive, Appointment, AppointmentArchive, Doctor,
+                             DoctorAvailability, Duty, HospitalStaff, LabResult, OperationTheater,
+                             OperationTheatreBooking, Patient, PatientTest, PatientTestArchive,
+                             PatientTestRecord, Payment, StaffAttendance, StaffAvailability)
+from hospital.permissions import permission_required, token_required
+from hospital.routing import use_shard
+from hospital.sharding import is_sharded, shard_count
+
+bp = Blueprint('export', __name__)
+
+# entity name in the url -> model
+EXPORTS = {
+    'patients': Patient,
+    'appointments': Appointment,
+    'appointments-archive': AppointmentArchive,
+    'admissions': Admission,
+    'admissions-archive': AdmissionArchive,
+    'patient-tests': PatientTest,
+    'patient-tests-archive': PatientTestArchive,
+    'patient-test-records': PatientTestRecord,
+    'lab-results': LabResult,
+    'payments': Payment,
+    'doctors': Doctor,
+    'doctor-availability': DoctorAvailability,
+    'hospital-staff': HospitalStaff,
+    'staff-availability': StaffAvailability,
+    'staff-attendance': StaffAttendance,
+    'duties': Duty,
+    'operation-theaters': OperationTheater,
+    'operation-theatre-bookings': OperationTheatreBooking,
+}
+
+
+def json_value(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+# encode rows as csv or ndjson text, joined into chunks of about chunk_size
+def encode_rows(names, rows, format, chunk_size):
+    buffer = io.StringIO()
+    if format == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(names)
+        write = writer.writerow
+    else:
+        write = lambda row: buffer.write(json.dumps(dict(zip(names, map(json_value, row)))) + '\n')
+
+    for row in rows:
+        write(row)
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks):
+    # wbits=31 writes a gzip header, so the stream is a valid .gz file
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# API to stream every row of an entity as csv or ndjson
+@bp.route('/export/<entity>', methods=['GET'])
+@token_required
+@permission_required('export:read')
+def export_entity(current_user, entity):
+    model = EXPORTS.get(entity)
+    if model is None:
+        return jsonify({'message': 'Unknown entity', 'entities': sorted(EXPORTS)}), 404
+
+    format = request.args.get('format', 'csv')
+    if format not in ('csv', 'ndjson'):
+        return jsonify({'message': 'format must be csv or ndjson'}), 400
+
+    table = model.__table__
+    names = [column.name for column in table.columns]
+
+    # yield_per streams rows from a server side cursor in batches, so memory
+    # stays flat however large the table is; sharded tables are read one
+    # shard after the other
+    def rows():
+        for shard in range(shard_count()) if is_sharded(model) else [0]:
+            with use_shard(shard):
+                yield from db.session.query(*table.columns).order_by(*table.primary_key.columns) \
+                    .yield_per(current_app.config['EXPORT_BATCH_SIZE'])
+
+    chunks = encode_rows(names, rows(), format, current_app.config['EXPORT_CHUNK_SIZE'])
+    headers = {'Content-Disposition': 'attachment; filename=%s.%s' % (entity, format)}
+
+    if request.args.get('compress') == 'gzip' or 'gzip' in request.headers.get('Accept-Encoding', ''):
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+        headers['Vary'] = 'Accept-Encoding'
+
+    mimetype = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+
+    # no Content-Length, so the server sends the body with chunked encoding
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
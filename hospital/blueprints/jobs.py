@@ -0,0 +1,87 @@
+import inspect
+from flask import Blueprint, Response, current_app, jsonify, request
+
+from hospital.jobs import get_job_runner
+from hospital.permissions import token_required
+from hospital.reports import REPORTS
+
+bp = Blueprint('jobs', __name__)
+
+
+def forbidden():
+    return jsonify({'message': 'You do not have permission to perform this action'})
+
+def job_not_found():
+    return jsonify({'message': 'Job not found'}), 404
+
+
+# Report Job API
+# API to run a report in the background, e.g.
+# {"report": "hospital-revenues", "params": {"date_start": "2023-01-01"}}
+@bp.route('/jobs', methods=['POST'])
+@token_required
+def submit_job(current_user):
+    data = request.get_json() or {}
+
+    report = data.get('report')
+    if report not in REPORTS:
+        return jsonify({'message': 'Unknown report', 'reports': sorted(REPORTS)}), 400
+    function, permission = REPORTS[report]
+    if not current_user.can(permission):
+        return forbidden()
+
+    # only the report's own parameters, as strings, so equal requests share a job
+    params = data.get('params') or {}
+    accepted = inspect.signature(function).parameters
+    if not isinstance(params, dict) or any(name not in accepted for name in params):
+        return jsonify({'message': 'Unknown parameter', 'params': list(accepted)}), 400
+    params = {name: str(value) for name, value in params.items() if value not in (None, '')}
+
+    job, created = get_job_runner(current_app._get_current_object()).submit(report, function, params)
+    if job is None:
+        response = jsonify({'message': 'Too many report jobs waiting, try again later'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+
+    return jsonify(dict(job.describe(), created=created)), 202 if created else 200
+
+
+# API to get the status of a job; ?wait=N holds the request until the job
+# finishes or N seconds pass
+@bp.route('/jobs/<job_id>', methods=['GET'])
+@token_required
+def get_job(current_user, job_id):
+    runner = get_job_runner(current_app._get_current_object())
+    job = runner.get(job_id)
+    if job is None:
+        return job_not_found()
+    if not current_user.can(REPORTS[job.report][1]):
+        return forbidden()
+
+    wait = min(request.args.get('wait', 0, type=float), current_app.config['JOB_MAX_WAIT'])
+    if wait > 0:
+        job = runner.wait(job, wait)
+        if job is None:
+            return job_not_found()
+
+    return jsonify(job.describe())
+
+
+# API to download the result of a finished job
+@bp.route('/jobs/<job_id>/result', methods=['GET'])
+@token_required
+def get_job_result(current_user, job_id):
+    job = get_job_runner(current_app._get_current_object()).get(job_id, with_result=True)
+    if job is None:
+        return job_not_found()
+    if not current_user.can(REPORTS[job.report][1]):
+        return forbidden()
+
+    # the job was served; the report it ran is what failed
+    if job.status == 'failed':
+        return jsonify(dict(job.describe(), message='Report failed'))
+    if job.status != 'done':
+        return jsonify({'message': 'Report not finished', 'status': job.status}), 409
+
+    # the cached bytes are sent as they are
+    return Response(job.result, mimetype='application/json')
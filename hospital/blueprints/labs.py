@@ -0,0 +1,123 @@
+from flask import Blueprint, current_app, jsonify, request
+
+from hospital.extensions import db
+from hospital.labs import trends
+from hospital.listing import bad_request, parse_datetime_arg
+from hospital.models import LabResult, Patient, ReferenceRange
+from hospital.permissions import permission_required, token_required
+from hospital.routing import use_shard
+from hospital.schemas import Schema, assign
+from hospital.sharding import allocate_ids, patient_shard, sharding_enabled
+
+bp = Blueprint('labs', __name__)
+
+LAB_RESULT_SCHEMA = Schema({
+    'patient_id': LabResult.patient_id,
+    'test_type': LabResult.test_type,
+    'taken_at': LabResult.taken_at,
+    'value': LabResult.value,
+    'unit': LabResult.unit,
+})
+
+REFERENCE_RANGE_SCHEMA = Schema({
+    'low': ReferenceRange.low,
+    'high': ReferenceRange.high,
+    'unit': ReferenceRange.unit,
+})
+
+
+# Lab Result API
+# API to record one numeric lab result, or a list of them in one insert
+@bp.route('/lab-results', methods=['POST'])
+@token_required
+@permission_required('lab-results:write')
+def create_lab_results(current_user):
+    data = request.get_json()
+    rows = LAB_RESULT_SCHEMA.load_many(data if isinstance(data, list) else [data])
+
+    # one insert per shard holding any of the patients
+    groups = {}
+    for row in rows:
+        groups.setdefault(patient_shard(row['patient_id']), []).append(row)
+
+    # foreign keys are not enforced on every database, so patients are
+    # checked first, with one query per shard
+    unknown = set()
+    for shard, shard_rows in groups.items():
+        with use_shard(shard):
+            patient_ids = {row['patient_id'] for row in shard_rows}
+            unknown |= patient_ids - {id for id, in db.session.query(Patient.id).filter(Patient.id.in_(patient_ids))}
+    if unknown:
+        return jsonify({'message': 'Unknown patient', 'patient_ids': sorted(unknown)}), 400
+
+    # the insert bypasses assign_global_id, so ids are reserved for it
+    if sharding_enabled():
+        for row, id in zip(rows, allocate_ids('lab_result', len(rows))):
+            row['id'] = id
+
+    for shard, shard_rows in groups.items():
+        with use_shard(shard):
+            db.session.execute(LabResult.__table__.insert(), shard_rows)
+    db.session.commit()
+
+    return jsonify({'message': 'Lab results recorded', 'count': len(rows)})
+
+
+# API to get the trend of one test for one or many patients, e.g.
+# /lab-results/trend?patient_id=1,2,3&test_type=creatinine&bucket=1440
+@bp.route('/lab-results/trend', methods=['GET'])
+@token_required
+@permission_required('lab-results:read')
+def get_lab_trend(current_user):
+
+    # get the parameters from the query string
+    try:
+        patient_ids = [int(id) for id in request.args.get('patient_id', '').split(',') if id.strip()]
+    except ValueError:
+        return jsonify({'message': 'patient_id must be a comma separated list of ids'}), 400
+    test_type = request.args.get('test_type')
+    bucket = request.args.get('bucket', type=int)
+
+    if not patient_ids or not test_type:
+        return jsonify({'message': 'patient_id and test_type are required'}), 400
+    if len(patient_ids) > current_app.config['LAB_TREND_MAX_PATIENTS']:
+        return jsonify({'message': 'At most %d patients per request' % current_app.config['LAB_TREND_MAX_PATIENTS']}), 400
+    if bucket is not None and bucket <= 0:
+        return jsonify({'message': 'bucket must be a positive number of minutes'}), 400
+
+    start = parse_datetime_arg('start')
+    end = parse_datetime_arg('end')
+
+    return jsonify(trends(patient_ids, test_type, start, end, bucket * 60 if bucket else None))
+
+
+# API to set the reference range of a test type
+@bp.route('/reference-ranges/<test_type>', methods=['PUT'])
+@token_required
+@permission_required('lab-results:write')
+def set_reference_range(current_user, test_type):
+    values = REFERENCE_RANGE_SCHEMA.load(request.get_json(silent=True), partial=True)
+
+    reference = db.session.get(ReferenceRange, test_type)
+    if reference is None:
+        reference = ReferenceRange(test_type=test_type)
+        db.session.add(reference)
+
+    assign(reference, values)
+    if reference.low is not None and reference.high is not None and reference.low > reference.high:
+        db.session.rollback()
+        bad_request('Invalid request', errors={'low': 'must not be above high'})
+    db.session.commit()
+
+    return jsonify({'message': 'Reference range updated'})
+
+
+@bp.route('/reference-ranges', methods=['GET'])
+@token_required
+def get_reference_ranges(current_user):
+
+    references = ReferenceRange.query.order_by(ReferenceRange.test_type).all()
+    return jsonify({'reference_ranges': [
+        {'test_type': reference.test_type, 'low': reference.low, 'high': reference.high, 'unit': reference.unit}
+        for reference in references
+    ]})
@@ -0,0 +1,142 @@
+import datetime
+import time
+from flask import Blueprint, current_app, render_template, request, url_for
+from sqlalchemy import func
+
+from hospital.archive import rows_in_range
+from hospital.blueprints.patients import ADMISSION_FIELDS, PATIENT_SUMMARY_FIELDS, PATIENT_TEST_FIELDS
+from hospital.cache import cached_fragment, request_key
+from hospital.dashboard import dashboard_stats
+from hospital.extensions import db
+from hospital.listing import list_rows, list_spec, page_result, page_window, parse_datetime_arg, projection
+from hospital.models import Admission, Doctor, DoctorAvailability, PatientSummary
+from hospital.permissions import permission_required, token_required
+from hospital.sharding import scatter, sum_by_key
+from hospital.summaries import refresh_expired
+
+bp = Blueprint('pages', __name__)
+bp.add_app_template_global(cached_fragment)
+
+# tables every dashboard counter is computed from
+DASHBOARD_TABLES = ('patient', 'appointment', 'admission', 'patient_test', 'operation_theatre_booking',
+                    'doctor', 'hospital_staff')
+
+
+# Server rendered pages
+# the first page of each list is rendered on the server, so a ward PC paints
+# real rows without running any client code; the blocks are cached as html
+# fragments until their tables change (see cached_fragment). Further pages
+# come from the .../rows endpoints as bare table rows, fetched by a few lines
+# of script when the last row scrolls into view. Lists take the same
+# ?filter=, ?sort= and ?per_page= as the list APIs, and the token comes in
+# the query string, as a browser cannot set headers on a page load
+
+# (page, per_page) of a page list; the first page when none is asked for
+def rows_window():
+    return page_window((1, current_app.config['PAGE_ROWS']), allow_all=False)
+
+# the key of a block of rows: the query string without the endpoint, so the
+# page and its rows endpoint share the cached html
+def rows_key():
+    return request_key()[1:]
+
+# the url of the page after window, or None after the last page. The token is
+# left out: the rows are cached and shared between users
+def next_rows_url(endpoint, window, page):
+    if not page['has_more']:
+        return None
+    args = request.args.to_dict(flat=False)
+    args.pop('token', None)
+    args.update(page=window[0] + 1, per_page=window[1])
+    return url_for(endpoint, **args)
+
+
+# summaries whose next appointment passes are moved on without a change log
+# entry, so cached patient rows last at most one refresh interval
+def patient_rows_key():
+    return rows_key() + (int(time.time() // max(current_app.config['PATIENT_SUMMARY_REFRESH'], 1)),)
+
+
+# loaders run inside the cached blocks, so a cache hit makes no queries
+def load_patients():
+    window = rows_window()
+    columns, serialize = projection(PATIENT_SUMMARY_FIELDS)
+    patients, page = list_rows(PatientSummary.query.with_entities(*columns), PatientSummary, PATIENT_SUMMARY_FIELDS,
+                               window)
+    return [serialize(patient) for patient in patients], next_rows_url('pages.patient_rows', window, page)
+
+def archived_rows(table_name, fields, endpoint):
+    start = parse_datetime_arg('start')
+    end = parse_datetime_arg('end')
+    columns, serialize = projection(fields)
+    criteria, order = list_spec(fields)
+    window = rows_window()
+    rows, page = page_result(rows_in_range(table_name, start, end, columns, criteria, order, window), window)
+    return [serialize(row) for row in rows], next_rows_url(endpoint, window, page)
+
+def load_admissions():
+    return archived_rows('admission', ADMISSION_FIELDS, 'pages.admission_rows')
+
+def load_patient_tests():
+    return archived_rows('patient_test', PATIENT_TEST_FIELDS, 'pages.patient_test_rows')
+
+
+# doctors working on day, with their hours, by first start time
+def doctors_on(day):
+    hours = {}
+    for doctor_id, first_name, last_name, start, end in db.session.query(
+            Doctor.id, Doctor.first_name, Doctor.last_name, DoctorAvailability.start_time, DoctorAvailability.end_time) \
+            .join(DoctorAvailability, DoctorAvailability.doctor_id == Doctor.id) \
+            .filter(DoctorAvailability.day_of_week == day.weekday()) \
+            .order_by(DoctorAvailability.start_time, Doctor.id):
+        doctor = hours.setdefault(doctor_id, {'name': 'Dr. %s %s' % (first_name, last_name), 'hours': []})
+        doctor['hours'].append('%s-%s' % (start.strftime('%H:%M'), end.strftime('%H:%M')))
+    return list(hours.values())
+
+# live admissions by status, over every shard
+def admission_statuses():
+    return sum_by_key(scatter(lambda shard: db.session.query(Admission.status, func.count(Admission.id))
+                              .group_by(Admission.status).all()))
+
+
+@bp.route('/pages/dashboard', methods=['GET'])
+@token_required
+@permission_required('dashboard:read')
+def dashboard_page(current_user):
+    return render_template('dashboard.html', tables=DASHBOARD_TABLES, stats=dashboard_stats,
+                           today=datetime.date.today(), doctors=doctors_on, statuses=admission_statuses)
+
+
+@bp.route('/pages/patients', methods=['GET'])
+@token_required
+def patients_page(current_user):
+    refresh_expired()
+    return render_template('patient_management.html', key=patient_rows_key(), rows=load_patients)
+
+@bp.route('/pages/patients/rows', methods=['GET'])
+@token_required
+def patient_rows(current_user):
+    refresh_expired()
+    return render_template('_patient_rows.html', key=patient_rows_key(), rows=load_patients)
+
+
+@bp.route('/pages/admissions', methods=['GET'])
+@token_required
+def admissions_page(current_user):
+    return render_template('admission_management.html', key=rows_key(), rows=load_admissions)
+
+@bp.route('/pages/admissions/rows', methods=['GET'])
+@token_required
+def admission_rows(current_user):
+    return render_template('_admission_rows.html', key=rows_key(), rows=load_admissions)
+
+
+@bp.route('/pages/patient-tests', methods=['GET'])
+@token_required
+def patient_tests_page(current_user):
+    return render_template('patient_testing.html', key=rows_key(), rows=load_patient_tests)
+
+@bp.route('/pages/patient-tests/rows', methods=['GET'])
+@token_required
+def patient_test_rows(current_user):
+    return render_template('_patient_test_rows.html', key=rows_key(), rows=load_patient_tests)
@@ -0,0 +1,572 @@
+import click
+from flask import Blueprint, current_app, jsonify, request
+
+from hospital.archive import get_row, rows_in_range
+from hospital.extensions import db
+from hospital.listing import (bad_request, date_part, list_rows, list_spec, page_result, page_window, parse_datetime_arg,
+                              plain, projection, time_part)
+from hospital.matching import dedupe_patients, find_duplicates, rebuild_match_keys
+from hospital.models import (Admission, Appointment, AppointmentArchive, Patient, PatientHistory, PatientHistoryVersion,
+                             PatientSummary, PatientTest, PatientTestArchive, PatientVersion)
+from hospital.permissions import permission_required, token_required
+from hospital.routing import use_shard
+from hospital.schemas import Schema, assign, parse_integer
+from hospital.sharding import locate, other_shard, patient_shard, place_new_patient, request_patient_id
+from hospital.summaries import rebuild_summaries, refresh_expired
+from hospital.versions import as_of_arg, in_force, open_missing_versions, version_as_of, version_fields
+
+bp = Blueprint('patients', __name__)
+
+# public field name -> column (or column and format), selectable with ?fields=
+PATIENT_FIELDS = {
+    'id': Patient.id,
+    'first_name': Patient.first_name,
+    'last_name': Patient.last_name,
+    'gender': Patient.gender,
+    'date_of_birth': Patient.date_of_birth,
+    'phone': Patient.contact_number,
+    'email': Patient.email,
+    'address': Patient.address,
+}
+
+ADMISSION_FIELDS = {
+    'id': Admission.id,
+    'patient_id': Admission.patient_id,
+    'admission_date': (Admission.registration_date_time, date_part),
+    'admission_time': (Admission.registration_date_time, time_part),
+    'discharge_date': (Admission.discharge_date_time, date_part),
+    'discharge_time': (Admission.discharge_date_time, time_part),
+    'status': Admission.status,
+}
+
+PATIENT_TEST_FIELDS = {
+    'id': PatientTest.id,
+    'patient_id': PatientTest.patient_id,
+    'test_date': (PatientTest.test_date_time, date_part),
+    'test_name': PatientTest.test_type,
+    'test_result': PatientTest.test_result,
+}
+
+# the patient list, read from the summaries: the patient fields with their
+# next appointment, latest admission and last test
+PATIENT_SUMMARY_FIELDS = {
+    'id': PatientSummary.id,
+    'first_name': PatientSummary.first_name,
+    'last_name': PatientSummary.last_name,
+    'gender': PatientSummary.gender,
+    'date_of_birth': PatientSummary.date_of_birth,
+    'phone': PatientSummary.contact_number,
+    'email': PatientSummary.email,
+    'address': PatientSummary.address,
+    'next_appointment_id': PatientSummary.next_appointment_id,
+    'next_appointment_date': (PatientSummary.next_appointment_date_time, date_part),
+    'next_appointment_time': (PatientSummary.next_appointment_date_time, time_part),
+    'next_appointment_doctor_id': PatientSummary.next_appointment_doctor_id,
+    'admission_status': PatientSummary.admission_status,
+    'admission_date': (PatientSummary.admission_date_time, date_part),
+    'last_test_name': PatientSummary.last_test_type,
+    'last_test_date': (PatientSummary.last_test_date_time, date_part),
+    'last_test_result': PatientSummary.last_test_result,
+}
+
+PATIENT_HISTORY_FIELDS = {
+    'id': PatientHistory.id,
+    'patient_id': PatientHistory.patient_id,
+    'diagnosis': PatientHistory.diagnosis,
+    'prescription': PatientHistory.prescription,
+    'treatment_date': (PatientHistory.treatment_date_time, date_part),
+    'treatment_time': (PatientHistory.treatment_date_time, time_part),
+}
+
+# the same fields, read from the versions for ?as_of=
+PATIENT_VERSION_FIELDS = version_fields(PATIENT_FIELDS, PatientVersion)
+PATIENT_HISTORY_VERSION_FIELDS = version_fields(PATIENT_HISTORY_FIELDS, PatientHistoryVersion)
+
+# the same fields, checked and parsed for writes
+PATIENT_SCHEMA = Schema(PATIENT_FIELDS)
+ADMISSION_SCHEMA = Schema(ADMISSION_FIELDS)
+PATIENT_TEST_SCHEMA = Schema(PATIENT_TEST_FIELDS)
+PATIENT_HISTORY_SCHEMA = Schema(PATIENT_HISTORY_FIELDS)
+
+
+# Patient API
+@bp.route('/patients', methods=['GET'])
+@token_required
+def get_all_patients(current_user):
+
+    # one read of the summary table, however many fields are asked for
+    refresh_expired()
+    columns, serialize = projection(PATIENT_SUMMARY_FIELDS)
+    patients, page = list_rows(PatientSummary.query.with_entities(*columns), PatientSummary, PATIENT_SUMMARY_FIELDS)
+
+    return jsonify(dict(page, patients=[serialize(patient) for patient in patients]))
+
+
+@bp.route('/patients/<int:id>', methods=['GET'])
+@token_required
+def get_patient(current_user, id):
+
+    # ?as_of=YYYY-MM-DD HH:MM:SS (UTC) returns the patient as they were then
+    as_of = as_of_arg()
+    with use_shard(patient_shard(id)):
+        if as_of:
+            columns, serialize = projection(PATIENT_VERSION_FIELDS)
+            patient = version_as_of(db.session.query(*columns), PatientVersion, id, as_of)
+        else:
+            columns, serialize = projection(PATIENT_FIELDS)
+            patient = Patient.query.with_entities(*columns).filter(Patient.id == id).first()
+    if not patient:
+        return jsonify({'message': 'Patient not found'})
+
+    return jsonify({'patient': serialize(patient)})
+
+
+@bp.route('/patients', methods=['POST'])
+@token_required
+@permission_required('patients:write')
+def create_patient(current_user):
+
+    data = request.get_json()
+
+    new_patient = Patient(**PATIENT_SCHEMA.load(data))
+
+    # a near certain match is refused unless the client confirms it is a
+    # different person; weaker matches are reported with the new record
+    duplicates = find_duplicates(match_record(new_patient))
+    if duplicates and duplicates[0][0] >= current_app.config['MATCH_BLOCK_SCORE'] and not data.get('allow_duplicate'):
+        return jsonify({'message': 'Patient may already be registered', 'possible_duplicates': duplicate_list(duplicates)}), 409
+
+    new_patient.id, shard = place_new_patient()
+    with use_shard(shard):
+        db.session.add(new_patient)
+        db.session.commit()
+        patient_id = new_patient.id
+
+    return jsonify({'message': 'New patient created', 'id': patient_id, 'possible_duplicates': duplicate_list(duplicates)})
+
+@bp.route('/patients/<int:id>', methods=['PUT'])
+@token_required
+@permission_required('patients:write')
+def update_patient(current_user, id):
+
+    with use_shard(patient_shard(id)):
+        patient = Patient.query.filter_by(id=id).first()
+        if not patient:
+            return jsonify({'message': 'Patient not found'})
+
+        assign(patient, PATIENT_SCHEMA.load(request.get_json(), partial=True))
+
+        db.session.commit()
+
+    return jsonify({'message': 'Patient updated'})
+
+@bp.route('/patients/<int:id>', methods=['DELETE'])
+@token_required
+@permission_required('patients:write')
+def delete_patient(current_user, id):
+    
+    with use_shard(patient_shard(id)):
+        patient = Patient.query.filter_by(id=id).first()
+        if not patient:
+            return jsonify({'message': 'Patient not found'})
+
+        db.session.delete(patient)
+        db.session.commit()
+
+    return jsonify({'message': 'Patient deleted'})
+
+
+def match_record(patient):
+    return {'id': patient.id, 'first_name': patient.first_name, 'last_name': patient.last_name,
+            'date_of_birth': patient.date_of_birth, 'contact_number': patient.contact_number, 'email': patient.email}
+
+def duplicate_list(duplicates):
+    return [{
+        'id': candidate['id'],
+        'first_name': candidate['first_name'],
+        'last_name': candidate['last_name'],
+        'date_of_birth': candidate['date_of_birth'].strftime('%Y-%m-%d'),
+        'phone': candidate['contact_number'],
+        'email': candidate['email'],
+        'score': score
+    } for score, candidate in duplicates]
+
+
+# API to look up likely duplicates of a patient before registering them
+@bp.route('/patients/match', methods=['POST'])
+@token_required
+@permission_required('patients:write')
+def match_patient(current_user):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        bad_request('Invalid request', errors={'': 'must be an object'})
+
+    # the fields are checked as for a registration, but any may be left out
+    values = PATIENT_SCHEMA.load({name: value for name, value in data.items() if value is not None}, partial=True)
+    record = {name: values.get(name) for name in ('first_name', 'last_name', 'date_of_birth', 'contact_number', 'email')}
+
+    # the patient's own chart, left out of the matches
+    try:
+        id = parse_integer(data['id']) if data.get('id') is not None else None
+    except ValueError as error:
+        bad_request('Invalid request', errors={'id': str(error)})
+
+    return jsonify({'possible_duplicates': duplicate_list(find_duplicates(record, id))})
+
+
+# flask patients dedupe: print clusters of likely duplicate charts, best first
+@bp.cli.command('dedupe')
+def dedupe_command():
+    for ids, score in dedupe_patients():
+        click.echo('%.3f %s' % (score, ' '.join(str(id) for id in ids)))
+
+
+# flask patients rebuild-match-keys
+@bp.cli.command('rebuild-match-keys')
+def rebuild_match_keys_command():
+    rebuild_match_keys()
+
+
+# flask patients rebuild-summaries: fill in the patient list summaries, after
+# an upgrade or after rows were written around the ORM
+@bp.cli.command('rebuild-summaries')
+def rebuild_summaries_command():
+    click.echo('%d patient summaries rebuilt' % rebuild_summaries())
+
+
+# Admission API
+@bp.route('/admissions', methods=['GET'])
+@token_required
+def get_all_admissions(current_user):
+
+    # archived admissions are only read when the range reaches them
+    start = parse_datetime_arg('start')
+    end = parse_datetime_arg('end')
+    columns, serialize = projection(ADMISSION_FIELDS)
+    criteria, order = list_spec(ADMISSION_FIELDS)
+    window = page_window()
+    admissions, page = page_result(rows_in_range('admission', start, end, columns, criteria, order, window), window)
+
+    return jsonify(dict(page, admissions=[serialize(admission) for admission in admissions]))
+
+
+@bp.route('/admissions/<int:id>', methods=['GET'])
+@token_required
+def get_admission(current_user, id):
+
+    columns, serialize = projection(ADMISSION_FIELDS)
+    admission = get_row('admission', id, columns)
+    if not admission:
+        return jsonify({'message': 'Admission not found'})
+
+    return jsonify({'admission': serialize(admission)})
+
+
+@bp.route('/admissions', methods=['POST'])
+@token_required
+@permission_required('admissions:write')
+def create_admission(current_user):
+
+    values = ADMISSION_SCHEMA.load(request.get_json())
+    new_admission = Admission(**values)
+
+    with use_shard(patient_shard(values['patient_id'])):
+        db.session.add(new_admission)
+        db.session.commit()
+
+    return jsonify({'message': 'New admission created'})
+
+@bp.route('/admissions/<int:id>', methods=['PUT'])
+@token_required
+@permission_required('admissions:write')
+def update_admission(current_user, id):
+
+    shard = locate(Admission, id, patient_id=request_patient_id())
+    if shard is None:
+        return jsonify({'message': 'Admission not found'})
+
+    with use_shard(shard):
+        admission = Admission.query.filter_by(id=id).first()
+        if not admission:
+            return jsonify({'message': 'Admission not found'})
+
+        values = ADMISSION_SCHEMA.load(request.get_json(), partial=True, current=admission)
+        if other_shard(values.get('patient_id'), shard):
+            return jsonify({'message': 'Cannot move the admission to a patient on another shard'}), 400
+
+        assign(admission, values)
+
+        db.session.commit()
+
+    return jsonify({'message': 'Admission updated'})
+
+
+
+@bp.route('/admissions/<int:id>', methods=['DELETE'])
+@token_required
+@permission_required('admissions:write')
+def delete_admission(current_user, id):
+
+    shard = locate(Admission, id)
+    if shard is None:
+        return jsonify({'message': 'Admission not found'})
+
+    with use_shard(shard):
+        admission = Admission.query.filter_by(id=id).first()
+        if not admission:
+            return jsonify({'message': 'Admission not found'})
+
+        db.session.delete(admission)
+        db.session.commit()
+
+    return jsonify({'message': 'Admission deleted'})
+
+
+# Patient Test API
+@bp.route('/patient-tests', methods=['GET'])
+@token_required
+def get_all_patient_tests(current_user):
+
+    # archived tests are only read when the range reaches them
+    start = parse_datetime_arg('start')
+    end = parse_datetime_arg('end')
+    columns, serialize = projection(PATIENT_TEST_FIELDS)
+    criteria, order = list_spec(PATIENT_TEST_FIELDS)
+    window = page_window()
+    patient_tests, page = page_result(rows_in_range('patient_test', start, end, columns, criteria, order, window), window)
+
+    return jsonify(dict(page, patient_tests=[serialize(patient_test) for patient_test in patient_tests]))
+
+
+@bp.route('/patient-tests/<int:id>', methods=['GET'])
+@token_required
+@permission_required('patient-tests:read')
+def get_patient_test(current_user, id):
+
+    columns, serialize = projection(PATIENT_TEST_FIELDS)
+    patient_test = get_row('patient_test', id, columns)
+    if not patient_test:
+        return jsonify({'message': 'Patient test not found'})
+
+    return jsonify({'patient_test': serialize(patient_test)})
+
+@bp.route('/patient-tests', methods=['POST'])
+@token_required
+@permission_required('patient-tests:write')
+def create_patient_test(current_user):
+
+    values = PATIENT_TEST_SCHEMA.load(request.get_json())
+    new_patient_test = PatientTest(**values)
+
+    with use_shard(patient_shard(values['patient_id'])):
+        db.session.add(new_patient_test)
+        db.session.commit()
+
+    return jsonify({'message': 'Patient test created'})
+
+
+@bp.route('/patient-tests/<int:id>', methods=['PUT'])
+@token_required
+@permission_required('patient-tests:write')
+def update_patient_test(current_user, id):
+
+
+    shard = locate(PatientTest, id, patient_id=request_patient_id())
+    if shard is None:
+        return jsonify({'message': 'Patient test not found'})
+
+    with use_shard(shard):
+        patient_test = PatientTest.query.filter_by(id=id).first()
+        if not patient_test:
+            return jsonify({'message': 'Patient test not found'})
+
+        values = PATIENT_TEST_SCHEMA.load(request.get_json(), partial=True, current=patient_test)
+        if other_shard(values.get('patient_id'), shard):
+            return jsonify({'message': 'Cannot move the test to a patient on another shard'}), 400
+
+        assign(patient_test, values)
+
+        db.session.commit()
+
+    return jsonify({'message': 'Patient test updated'})
+
+
+
+@bp.route('/patient-tests/<int:id>', methods=['DELETE'])
+@token_required
+@permission_required('patient-tests:write')
+def delete_patient_test(current_user, id):
+
+    shard = locate(PatientTest, id)
+    if shard is None:
+        return jsonify({'message': 'Patient test not found'})
+
+    with use_shard(shard):
+        patient_test = PatientTest.query.filter_by(id=id).first()
+        if not patient_test:
+            return jsonify({'message': 'Patient test not found'})
+
+        db.session.delete(patient_test)
+        db.session.commit()
+
+    return jsonify({'message': 'Patient test deleted'})
+
+
+# Patient History API
+# the patient's history entries, as they stand or as they stood at as_of
+def history_entries(patient_id, as_of=None, requested=True):
+    if as_of:
+        columns, serialize = projection(PATIENT_HISTORY_VERSION_FIELDS, requested)
+        query = db.session.query(*columns).filter(PatientHistoryVersion.patient_id == patient_id,
+                                                  in_force(PatientHistoryVersion, as_of)) \
+            .order_by(PatientHistoryVersion.treatment_date_time, PatientHistoryVersion.id)
+    else:
+        columns, serialize = projection(PATIENT_HISTORY_FIELDS, requested)
+        query = PatientHistory.query.with_entities(*columns).filter(PatientHistory.patient_id == patient_id) \
+            .order_by(PatientHistory.treatment_date_time, PatientHistory.id)
+    return [serialize(entry) for entry in query]
+
+
+# without read-all, a user may read only the charts of patients who have
+# (or had, before archiving) appointments with the doctor linked to them;
+# runs on the patient's shard
+def can_read_patient(current_user, patient_id):
+    if current_user.can('patient-data:read-all'):
+        return True
+    if current_user.doctor_id is None:
+        return False
+    return any(db.session.query(source.id).filter(source.patient_id == patient_id, source.doctor_id == current_user.doctor_id).first()
+               for source in (Appointment, AppointmentArchive))
+
+def forbidden():
+    return jsonify({'message': 'You do not have permission to perform this action'})
+
+
+@bp.route('/patients/<int:patient_id>/history', methods=['GET'])
+@token_required
+@permission_required('patient-data:read')
+def get_patient_history(current_user, patient_id):
+
+    as_of = as_of_arg()
+    with use_shard(patient_shard(patient_id)):
+        if not can_read_patient(current_user, patient_id):
+            return forbidden()
+        history = history_entries(patient_id, as_of)
+
+    return jsonify({'history': history})
+
+
+@bp.route('/patients/<int:patient_id>/history', methods=['POST'])
+@token_required
+@permission_required('patient-history:write')
+def create_patient_history(current_user, patient_id):
+
+    values = PATIENT_HISTORY_SCHEMA.load(dict(request.get_json() or {}, patient_id=patient_id))
+    entry = PatientHistory(**values)
+
+    with use_shard(patient_shard(patient_id)):
+        db.session.add(entry)
+        db.session.commit()
+        entry_id = entry.id
+
+    return jsonify({'message': 'History entry created', 'id': entry_id})
+
+
+@bp.route('/patient-history/<int:id>', methods=['PUT'])
+@token_required
+@permission_required('patient-history:write')
+def update_patient_history(current_user, id):
+
+    shard = locate(PatientHistory, id, patient_id=request_patient_id())
+    if shard is None:
+        return jsonify({'message': 'History entry not found'})
+
+    with use_shard(shard):
+        entry = PatientHistory.query.filter_by(id=id).first()
+        if not entry:
+            return jsonify({'message': 'History entry not found'})
+
+        values = PATIENT_HISTORY_SCHEMA.load(request.get_json(), partial=True, current=entry)
+        if values.get('patient_id', entry.patient_id) != entry.patient_id:
+            return jsonify({'message': 'Cannot move a history entry to another patient'}), 400
+
+        assign(entry, values)
+
+        db.session.commit()
+
+    return jsonify({'message': 'History entry updated'})
+
+
+@bp.route('/patient-history/<int:id>', methods=['DELETE'])
+@token_required
+@permission_required('patient-history:write')
+def delete_patient_history(current_user, id):
+
+    shard = locate(PatientHistory, id)
+    if shard is None:
+        return jsonify({'message': 'History entry not found'})
+
+    with use_shard(shard):
+        entry = PatientHistory.query.filter_by(id=id).first()
+        if not entry:
+            return jsonify({'message': 'History entry not found'})
+
+        # its versions stay, so the entry still shows as of earlier dates
+        db.session.delete(entry)
+        db.session.commit()
+
+    return jsonify({'message': 'History entry deleted'})
+
+
+# flask patients init-versions: open a version for patients and history
+# entries written before versioning, valid from now
+@bp.cli.command('init-versions')
+def init_versions_command():
+    click.echo('%d versions opened' % open_missing_versions())
+
+
+# API to get patient data; ?as_of= (UTC) returns the chart as it stood then:
+# the patient and history entries in force at that moment and the tests
+# taken by then
+@bp.route('/patient/<int:patient_id>', methods=['GET'])
+@token_required
+@permission_required('patient-data:read')
+def get_patient_data(current_user, patient_id):
+    as_of = as_of_arg()
+
+    # everything about the patient is on their shard
+    with use_shard(patient_shard(patient_id)):
+        # get the patient from the database
+        if as_of:
+            columns, serialize = projection(PATIENT_VERSION_FIELDS, False)
+            patient = version_as_of(db.session.query(*columns), PatientVersion, patient_id, as_of)
+        else:
+            columns, serialize = projection(PATIENT_FIELDS, False)
+            patient = Patient.query.with_entities(*columns).filter(Patient.id == patient_id).first()
+
+        # check if the patient exists
+        if not patient:
+            return jsonify({'message': 'Patient not found'})
+
+        # check if the current user is authorized to access the patient data
+        if not can_read_patient(current_user, patient_id):
+            return forbidden()
+
+        # create a dictionary with the patient data
+        data = serialize(patient)
+
+        # get the patient tests, live and archived, and add them to the dictionary
+        tests = []
+        for source in (PatientTestArchive, PatientTest):
+            query = db.session.query(source.test_type, source.test_date_time, source.test_result) \
+                .filter(source.patient_id == patient_id)
+            if as_of:
+                query = query.filter(source.test_date_time <= as_of)
+            tests += [{'test_name': test_type, 'test_date': plain(test_date_time), 'result': test_result}
+                      for test_type, test_date_time, test_result in query]
+        data['tests'] = sorted(tests, key=lambda test: test['test_date'])
+
+        # get the patient history and add it to the dictionary
+        data['history'] = history_entries(patient_id, as_of, False)
+
+        return jsonify(data)
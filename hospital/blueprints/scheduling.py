@@ -0,0 +1,299 @@
+from flask import Blueprint, current_app, jsonify, request
+from sqlalchemy.exc import IntegrityError
+
+from hospital.archive import get_row, rows_in_range
+from hospital.extensions import db
+from hospital.listing import (date_part, list_rows, list_spec, page_result, page_window, parse_datetime_arg,
+                              projection, time_part)
+from hospital.models import Appointment, Doctor, DoctorAvailability
+from hospital.permissions import permission_required, token_required
+from hospital.routing import use_shard
+from hospital.schemas import Schema, assign
+from hospital.sharding import locate, other_shard, patient_shard, request_patient_id
+
+bp = Blueprint('scheduling', __name__)
+
+# public field name -> column (or column and format), selectable with ?fields=
+APPOINTMENT_FIELDS = {
+    'id': Appointment.id,
+    'patient_id': Appointment.patient_id,
+    'doctor_id': Appointment.doctor_id,
+    'appointment_date': (Appointment.date_time, date_part),
+    'appointment_time': (Appointment.date_time, time_part),
+    'status': Appointment.status,
+}
+
+DOCTOR_FIELDS = {
+    'id': Doctor.id,
+    'name': Doctor.first_name + ' ' + Doctor.last_name,
+    'first_name': Doctor.first_name,
+    'last_name': Doctor.last_name,
+    'specialization': Doctor.specialization,
+}
+
+DOCTOR_AVAILABILITY_FIELDS = {
+    'id': DoctorAvailability.id,
+    'doctor_id': DoctorAvailability.doctor_id,
+    'day': DoctorAvailability.day_of_week,
+    'start_time': DoctorAvailability.start_time,
+    'end_time': DoctorAvailability.end_time,
+}
+
+# the same fields, checked and parsed for writes
+APPOINTMENT_SCHEMA = Schema(APPOINTMENT_FIELDS)
+DOCTOR_SCHEMA = Schema(DOCTOR_FIELDS)
+DOCTOR_AVAILABILITY_SCHEMA = Schema(DOCTOR_AVAILABILITY_FIELDS)
+
+
+# appointments start on fixed slot boundaries, so two bookings overlap
+# exactly when they share a start time and the slot index can catch it
+def is_slot_start(date_time):
+    slot_minutes = current_app.config['APPOINTMENT_SLOT_MINUTES']
+    return date_time.second == 0 and date_time.microsecond == 0 and (date_time.hour * 60 + date_time.minute) % slot_minutes == 0
+
+def invalid_slot():
+    return jsonify({'message': 'Appointments must start on a %d minute slot boundary' % current_app.config['APPOINTMENT_SLOT_MINUTES']}), 400
+
+def slot_taken(doctor_id, date_time):
+    return jsonify({
+        'message': 'Doctor already has an appointment at this time',
+        'doctor_id': doctor_id,
+        'date_time': date_time.strftime('%Y-%m-%d %H:%M:%S')
+    }), 409
+
+
+# Appointment API
+@bp.route('/appointments', methods=['GET'])
+@token_required
+def get_all_appointments(current_user):
+
+    # archived appointments are only read when the range reaches them
+    start = parse_datetime_arg('start')
+    end = parse_datetime_arg('end')
+    columns, serialize = projection(APPOINTMENT_FIELDS)
+    criteria, order = list_spec(APPOINTMENT_FIELDS)
+    window = page_window()
+    appointments, page = page_result(rows_in_range('appointment', start, end, columns, criteria, order, window), window)
+
+    return jsonify(dict(page, appointments=[serialize(appointment) for appointment in appointments]))
+
+
+
+@bp.route('/appointments/<int:id>', methods=['GET'])
+@token_required
+def get_appointment(current_user, id):
+
+    columns, serialize = projection(APPOINTMENT_FIELDS)
+    appointment = get_row('appointment', id, columns)
+    if not appointment:
+        return jsonify({'message': 'Appointment not found'})
+
+    return jsonify({'appointment': serialize(appointment)})
+
+
+
+@bp.route('/appointments', methods=['POST'])
+@token_required
+@permission_required('appointments:write')
+def create_appointment(current_user):
+    values = APPOINTMENT_SCHEMA.load(request.get_json())
+
+    date_time = values['date_time']
+    if not is_slot_start(date_time):
+        return invalid_slot()
+
+    new_appointment = Appointment(**values)
+
+    # the unique slot index (or, with sharding, the slot claim in the main
+    # database) rejects a second booking atomically, even when two workers
+    # insert at the same moment
+    with use_shard(patient_shard(values['patient_id'])):
+        db.session.add(new_appointment)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return slot_taken(values['doctor_id'], date_time)
+        appointment_id = new_appointment.id
+
+    return jsonify({'message': 'New appointment created', 'id': appointment_id})
+
+
+
+@bp.route('/appointments/<int:id>', methods=['PUT'])
+@token_required
+@permission_required('appointments:write')
+def update_appointment(current_user, id):
+
+    shard = locate(Appointment, id, patient_id=request_patient_id())
+    if shard is None:
+        return jsonify({'message': 'Appointment not found'})
+
+    with use_shard(shard):
+        appointment = Appointment.query.filter_by(id=id).first()
+        if not appointment:
+            return jsonify({'message': 'Appointment not found'})
+
+        values = APPOINTMENT_SCHEMA.load(request.get_json(), partial=True, current=appointment)
+        if other_shard(values.get('patient_id'), shard):
+            return jsonify({'message': 'Cannot move the appointment to a patient on another shard'}), 400
+        if 'date_time' in values and not is_slot_start(values['date_time']):
+            return invalid_slot()
+
+        doctor_id = values.get('doctor_id', appointment.doctor_id)
+        date_time = values.get('date_time', appointment.date_time)
+        assign(appointment, values)
+
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return slot_taken(doctor_id, date_time)
+
+    return jsonify({'message': 'Appointment updated'})
+
+@bp.route('/appointments/<int:id>', methods=['DELETE'])
+@token_required
+@permission_required('appointments:write')
+def delete_appointment(current_user, id):
+
+    shard = locate(Appointment, id)
+    if shard is None:
+        return jsonify({'message': 'Appointment not found'})
+
+    with use_shard(shard):
+        appointment = Appointment.query.filter_by(id=id).first()
+        if not appointment:
+            return jsonify({'message': 'Appointment not found'})
+
+        db.session.delete(appointment)
+        db.session.commit()
+
+    return jsonify({'message': 'Appointment deleted'})
+
+
+# Doctor API
+@bp.route('/doctors', methods=['GET'])
+@token_required
+def get_all_doctors(current_user):
+
+    columns, serialize = projection(DOCTOR_FIELDS)
+    doctors, page = list_rows(Doctor.query.with_entities(*columns), Doctor, DOCTOR_FIELDS)
+
+    return jsonify(dict(page, doctors=[serialize(doctor) for doctor in doctors]))
+
+
+
+@bp.route('/doctors/<int:id>', methods=['GET'])
+@token_required
+def get_doctor(current_user, id):
+
+    columns, serialize = projection(DOCTOR_FIELDS)
+    doctor = Doctor.query.with_entities(*columns).filter(Doctor.id == id).first()
+    if not doctor:
+        return jsonify({'message': 'Doctor not found'})
+
+    return jsonify({'doctor': serialize(doctor)})
+
+
+@bp.route('/doctors', methods=['POST'])
+@token_required
+@permission_required('doctors:write')
+def create_doctor(current_user):
+    new_doctor = Doctor(**DOCTOR_SCHEMA.load(request.get_json()))
+
+    db.session.add(new_doctor)
+    db.session.commit()
+
+    return jsonify({'message': 'Doctor created'})
+
+
+@bp.route('/doctors/<int:id>', methods=['PUT'])
+@token_required
+@permission_required('doctors:write')
+def update_doctor(current_user, id):
+    doctor = Doctor.query.filter_by(id=id).first()
+    if not doctor:
+        return jsonify({'message': 'Doctor not found'})
+
+    assign(doctor, DOCTOR_SCHEMA.load(request.get_json(), partial=True))
+
+    db.session.commit()
+
+    return jsonify({'message': 'Doctor updated'})
+
+
+@bp.route('/doctors/<int:id>', methods=['DELETE'])
+@token_required
+@permission_required('doctors:write')
+def delete_doctor(current_user, id):
+    
+    doctor = Doctor.query.filter_by(id=id).first()
+    if not doctor:
+        return jsonify({'message': 'Doctor not found'})
+
+    db.session.delete(doctor)
+    db.session.commit()
+
+    return jsonify({'message': 'Doctor deleted'})
+
+@bp.route('/doctor-availability', methods=['GET'])
+@token_required
+def get_doctor_availability(current_user):
+
+    columns, serialize = projection(DOCTOR_AVAILABILITY_FIELDS)
+    availabilities, page = list_rows(DoctorAvailability.query.with_entities(*columns), DoctorAvailability, DOCTOR_AVAILABILITY_FIELDS)
+
+    return jsonify(dict(page, availabilities=[serialize(availability) for availability in availabilities]))
+
+@bp.route('/doctor-availability/<int:id>', methods=['GET'])
+@token_required
+def get_doctor_availability_by_id(current_user, id):
+
+    columns, serialize = projection(DOCTOR_AVAILABILITY_FIELDS)
+    availability = DoctorAvailability.query.with_entities(*columns).filter(DoctorAvailability.id == id).first()
+    if not availability:
+        return jsonify({'message': 'Doctor availability not found'})
+
+    return jsonify({'availability': serialize(availability)})
+
+@bp.route('/doctor-availability', methods=['POST'])
+@token_required
+@permission_required('doctor-availability:write')
+def create_doctor_availability(current_user):
+
+    new_availability = DoctorAvailability(**DOCTOR_AVAILABILITY_SCHEMA.load(request.get_json()))
+
+    db.session.add(new_availability)
+    db.session.commit()
+
+    return jsonify({'message': 'Doctor availability created'})
+
+@bp.route('/doctor-availability/<int:id>', methods=['PUT'])
+@token_required
+@permission_required('doctor-availability:write')
+def update_doctor_availability(current_user, id):
+
+    availability = DoctorAvailability.query.filter_by(id=id).first()
+    if not availability:
+        return jsonify({'message': 'Doctor availability not found'})
+
+    assign(availability, DOCTOR_AVAILABILITY_SCHEMA.load(request.get_json(), partial=True))
+
+    db.session.commit()
+
+    return jsonify({'message': 'Doctor availability updated'})
+
+@bp.route('/doctor-availability/<int:id>', methods=['DELETE'])
+@token_required
+@permission_required('doctor-availability:write')
+def delete_doctor_availability(current_user, id):
+
+    availability = DoctorAvailability.query.filter_by(id=id).first()
+    if not availability:
+        return jsonify({'message': 'Doctor availability not found'})
+
+    db.session.delete(availability)
+    db.session.commit()
+
+    return jsonify({'message': 'Doctor availability deleted'})
@@ -0,0 +1,340 @@
+from datetime import datetime, timedelta
+import heapq
+from flask import Blueprint, current_app, jsonify, request
+
+from hospital.extensions import db
+from hospital.listing import list_rows, projection
+from hospital.models import Duty, HospitalStaff, StaffAttendance, StaffAvailability
+from hospital.permissions import permission_required, token_required
+from hospital.reports import staff_attendance_report
+from hospital.schemas import Schema, assign
+
+bp = Blueprint('staff', __name__)
+
+# public field name -> column, selectable with ?fields=
+HOSPITAL_STAFF_FIELDS = {
+    'id': HospitalStaff.id,
+    'name': HospitalStaff.first_name + ' ' + HospitalStaff.last_name,
+    'first_name': HospitalStaff.first_name,
+    'last_name': HospitalStaff.last_name,
+    'designation': HospitalStaff.job_title,
+}
+
+# the same fields, checked and parsed for writes
+HOSPITAL_STAFF_SCHEMA = Schema(HOSPITAL_STAFF_FIELDS)
+
+
+# Hospital Staff API
+@bp.route('/hospital-staff', methods=['GET'])
+@token_required
+def get_all_hospital_staff(current_user):
+
+    columns, serialize = projection(HOSPITAL_STAFF_FIELDS)
+    hospital_staff, page = list_rows(HospitalStaff.query.with_entities(*columns), HospitalStaff, HOSPITAL_STAFF_FIELDS)
+
+    return jsonify(dict(page, hospital_staff=[serialize(staff) for staff in hospital_staff]))
+
+
+@bp.route('/hospital-staff/<int:id>', methods=['GET'])
+@token_required
+@permission_required('hospital-staff:read')
+def get_hospital_staff(current_user, id):
+
+    columns, serialize = projection(HOSPITAL_STAFF_FIELDS)
+    staff = HospitalStaff.query.with_entities(*columns).filter(HospitalStaff.id == id).first()
+    if not staff:
+        return jsonify({'message': 'Hospital staff not found'})
+
+    return jsonify({'hospital_staff': serialize(staff)})
+
+
+@bp.route('/hospital-staff', methods=['POST'])
+@token_required
+@permission_required('hospital-staff:write')
+def create_hospital_staff(current_user):
+
+    new_staff = HospitalStaff(**HOSPITAL_STAFF_SCHEMA.load(request.get_json()))
+
+    db.session.add(new_staff)
+    db.session.commit()
+
+    return jsonify({'message': 'Hospital staff created'})
+
+
+@bp.route('/hospital-staff/<int:id>', methods=['PUT'])
+@token_required
+@permission_required('hospital-staff:write')
+def update_hospital_staff(current_user, id):
+
+    staff = HospitalStaff.query.filter_by(id=id).first()
+    if not staff:
+        return jsonify({'message': 'Hospital staff not found'})
+
+    assign(staff, HOSPITAL_STAFF_SCHEMA.load(request.get_json(), partial=True))
+
+    db.session.commit()
+
+    return jsonify({'message': 'Hospital staff updated'})
+
+@bp.route('/hospital-staff/<int:id>', methods=['DELETE'])
+@token_required
+@permission_required('hospital-staff:write')
+def delete_hospital_staff(current_user, id):
+    staff = HospitalStaff.query.filter_by(id=id).first()
+    if not staff:
+        return jsonify({'message': 'Hospital staff not found'})
+
+    db.session.delete(staff)
+    db.session.commit()
+
+    return jsonify({'message': 'Hospital staff deleted'})
+
+
+# API to get staff attendance
+@bp.route('/staff_attendance', methods=['GET'])
+@token_required
+@permission_required('staff-attendance:read')
+def get_staff_attendance(current_user):
+
+    # get the staff attendance data from the database
+    staff_attendance = StaffAttendance.query.all()
+
+    # create a dictionary to store the attendance data for each staff member
+    attendance_data = {}
+
+    # loop through the staff attendance data and add it to the dictionary
+    for attendance in staff_attendance:
+        if attendance.staff_id not in attendance_data:
+            attendance_data[attendance.staff_id] = {'name': attendance.staff.name,
+                                                    'attendance': []}
+        attendance_data[attendance.staff_id]['attendance'].append({'date': attendance.date,
+                                                                    'status': attendance.status})
+
+    # return the staff attendance data
+    return jsonify({'attendance_data': list(attendance_data.values())})
+
+
+# API to assign daily duty to staff members
+@bp.route('/assign_duty', methods=['POST'])
+@token_required
+@permission_required('duty:write')
+def assign_duty(current_user):
+
+    # get the request data
+    data = request.get_json()
+
+    # get the staff member and date from the request data
+    staff_id = data.get('staff_id')
+    date = data.get('date')
+
+    # get the staff member from the database
+    staff = HospitalStaff.query.get(staff_id)
+
+    # check if the staff member exists
+    if not staff:
+        return jsonify({'message': 'Staff member not found'})
+
+    # check if the staff member is available on the specified date
+    if not staff.is_available(date):
+        return jsonify({'message': 'Staff member is not available on this date'})
+
+    # create a new duty object
+    duty = Duty(staff_id=staff_id, date=date)
+
+    # add the duty to the database
+    db.session.add(duty)
+    db.session.commit()
+
+    # return a success message
+    return jsonify({'message': 'Duty assigned successfully'})
+
+
+# generate duties for every day in [start_date, end_date] in one pass
+def generate_duty_roster(start_date, end_date, staff_per_day, max_duties_per_staff=None):
+    day_count = (end_date - start_date).days + 1
+    range_start = datetime.combine(start_date, datetime.min.time())
+    range_end = range_start + timedelta(days=day_count)
+
+    # load availability intervals that touch the range once
+    intervals = db.session.query(StaffAvailability.staff_id, StaffAvailability.start_time, StaffAvailability.end_time) \
+        .filter(StaffAvailability.start_time < range_end, StaffAvailability.end_time > range_start).all()
+
+    # load existing duties and absences in the range once
+    existing = db.session.query(Duty.staff_id, Duty.date) \
+        .filter(Duty.date >= start_date, Duty.date <= end_date).all()
+    absences = db.session.query(StaffAttendance.staff_id, StaffAttendance.date) \
+        .filter(StaffAttendance.date >= start_date, StaffAttendance.date <= end_date, StaffAttendance.status == 'Absent').all()
+
+    on_duty = [set() for _ in range(day_count)]
+    duty_count = {}
+    last_duty = {}
+    for staff_id, date in existing:
+        day = (date - start_date).days
+        on_duty[day].add(staff_id)
+        duty_count[staff_id] = duty_count.get(staff_id, 0) + 1
+        last_duty[staff_id] = max(last_duty.get(staff_id, -1), day)
+
+    absent = [set() for _ in range(day_count)]
+    for staff_id, date in absences:
+        absent[(date - start_date).days].add(staff_id)
+
+    # turn each interval into open/close events on day indexes
+    events = []
+    for staff_id, start_time, end_time in intervals:
+        first_day = max(0, (start_time.date() - start_date).days)
+        last_day = min(day_count - 1, ((end_time - timedelta(microseconds=1)).date() - start_date).days)
+        if first_day <= last_day:
+            events.append((first_day, 1, staff_id))
+            events.append((last_day + 1, -1, staff_id))
+    events.sort()
+
+    # sweep the days, keeping the set of staff with an open interval
+    open_intervals = {}
+    rows = []
+    shortfalls = []
+    event_index = 0
+    for day in range(day_count):
+        while event_index < len(events) and events[event_index][0] == day:
+            _, delta, staff_id = events[event_index]
+            open_intervals[staff_id] = open_intervals.get(staff_id, 0) + delta
+            if not open_intervals[staff_id]:
+                del open_intervals[staff_id]
+            event_index += 1
+
+        needed = staff_per_day - len(on_duty[day])
+        if needed <= 0:
+            continue
+
+        candidates = [
+            staff_id for staff_id in open_intervals
+            if staff_id not in on_duty[day] and staff_id not in absent[day]
+            and (max_duties_per_staff is None or duty_count.get(staff_id, 0) < max_duties_per_staff)
+        ]
+
+        # fairness: fewest duties first, then whoever has rested longest
+        chosen = heapq.nsmallest(needed, candidates, key=lambda staff_id: (duty_count.get(staff_id, 0), last_duty.get(staff_id, -1), staff_id))
+
+        date = start_date + timedelta(days=day)
+        for staff_id in chosen:
+            rows.append({'staff_id': staff_id, 'date': date})
+            on_duty[day].add(staff_id)
+            duty_count[staff_id] = duty_count.get(staff_id, 0) + 1
+            last_duty[staff_id] = day
+
+        if len(chosen) < needed:
+            shortfalls.append({'date': date.strftime('%Y-%m-%d'), 'missing': needed - len(chosen)})
+
+    return rows, shortfalls
+
+
+def is_count(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+
+# API to generate the duty roster for a date range
+@bp.route('/generate_roster', methods=['POST'])
+@token_required
+@permission_required('duty:write')
+def generate_roster(current_user):
+
+    # get the request data
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'message': 'The body must be a JSON object'}), 400
+
+    try:
+        start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').date()
+        end_date = datetime.strptime(data['end_date'], '%Y-%m-%d').date()
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'message': 'start_date and end_date must be dates (YYYY-MM-DD)'}), 400
+    staff_per_day = data.get('staff_per_day', 1)
+    max_duties_per_staff = data.get('max_duties_per_staff')
+    dry_run = data.get('dry_run', False)
+
+    if not is_count(staff_per_day) or not (max_duties_per_staff is None or is_count(max_duties_per_staff)):
+        return jsonify({'message': 'staff_per_day and max_duties_per_staff must be positive integers'}), 400
+    if not isinstance(dry_run, bool):
+        return jsonify({'message': 'dry_run must be true or false'}), 400
+    if end_date < start_date:
+        return jsonify({'message': 'end_date must not be before start_date'}), 400
+    if (end_date - start_date).days >= current_app.config['ROSTER_MAX_DAYS']:
+        return jsonify({'message': 'A roster may cover at most %d days' % current_app.config['ROSTER_MAX_DAYS']}), 400
+
+    rows, shortfalls = generate_duty_roster(start_date, end_date, staff_per_day, max_duties_per_staff)
+
+    # write the whole roster in a single bulk insert
+    if rows and not dry_run:
+        db.session.execute(Duty.__table__.insert(), rows)
+        db.session.commit()
+
+    return jsonify({
+        'message': 'Roster generated successfully',
+        'assigned': len(rows),
+        'shortfalls': shortfalls,
+        'duties': [{'staff_id': row['staff_id'], 'date': row['date'].strftime('%Y-%m-%d')} for row in rows] if dry_run else []
+    })
+
+
+# API to get staff duty schedule
+@bp.route('/staff_duty_schedule', methods=['GET'])
+@token_required
+@permission_required('duty:read')
+def get_staff_duty_schedule(current_user):
+
+    # get the staff member id from the request data
+    staff_id = request.args.get('staff_id')
+
+    # get the staff member from the database
+    staff = HospitalStaff.query.get(staff_id)
+
+    # check if the staff member exists
+    if not staff:
+        return jsonify({'message': 'Staff member not found'})
+
+    # get the duty schedule for the staff member
+    duty_schedule = staff.get_duty_schedule()
+
+    # return the duty schedule
+    return jsonify({'duty_schedule': duty_schedule})
+
+
+# API to mark staff attendance
+@bp.route('/mark_staff_attendance', methods=['POST'])
+@token_required
+@permission_required('staff-attendance:write')
+def mark_staff_attendance(current_user):
+
+    # get the staff attendance details from the request data
+    data = request.get_json()
+    staff_id = data['staff_id']
+    date = data['date']
+    is_present = data['is_present']
+
+    # get the staff member from the database
+    staff = HospitalStaff.query.get(staff_id)
+
+    # check if the staff member exists
+    if not staff:
+        return jsonify({'message': 'Staff member not found'})
+
+    # mark the staff member's attendance
+    staff.mark_attendance(date, is_present)
+
+    # save the changes to the database
+    db.session.commit()
+
+    # return a success message
+    return jsonify({'message': 'Attendance marked successfully'})
+
+
+
+#API to get staff attendance report
+@bp.route('/staff_attendance_report', methods=['GET'])
+@token_required
+@permission_required('staff-attendance:read')
+def get_staff_attendance_report(current_user):
+    # get the date range from the request data
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+
+    return jsonify(staff_attendance_report(start_date, end_date))
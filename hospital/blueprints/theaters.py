@@ -0,0 +1,256 @@
+import math
+from datetime import datetime
+from flask import Blueprint, current_app, jsonify, request
+
+from hospital.extensions import db
+from hospital.listing import bad_request, list_rows, projection
+from hospital.models import Doctor, DoctorAvailability, OperationTheater, OperationTheatreBooking
+from hospital.permissions import permission_required, token_required
+from hospital.planning import plan_theaters
+from hospital.schemas import Schema, assign
+
+bp = Blueprint('theaters', __name__)
+
+# public field name -> column, selectable with ?fields=
+OPERATION_THEATRE_BOOKING_FIELDS = {
+    'id': OperationTheatreBooking.id,
+    'patient_id': OperationTheatreBooking.patient_id,
+    'doctor_id': OperationTheatreBooking.doctor_id,
+    'operation_type': OperationTheatreBooking.operation_type,
+    'date': OperationTheatreBooking.date,
+    'start_time': OperationTheatreBooking.start_time,
+    'end_time': OperationTheatreBooking.end_time,
+    'notes': OperationTheatreBooking.notes,
+}
+
+OPERATION_THEATER_FIELDS = {
+    'id': OperationTheater.id,
+    'name': OperationTheater.name,
+    'theater_name': OperationTheater.theater_name,
+    'location': OperationTheater.location,
+    'availability': OperationTheater.availability,
+}
+
+# the same fields, checked and parsed for writes
+OPERATION_THEATRE_BOOKING_SCHEMA = Schema(OPERATION_THEATRE_BOOKING_FIELDS)
+OPERATION_THEATER_SCHEMA = Schema(OPERATION_THEATER_FIELDS)
+# the columns are nullable, but a booked operation needs all of these
+BOOKING_REQUIRED_FIELDS = ('patient_id', 'doctor_id', 'date', 'start_time', 'end_time')
+
+
+#Operation Theatre Booking API
+@bp.route('/operation-theatre-bookings', methods=['GET'])
+@token_required
+@permission_required('operation-theatre-bookings:read')
+def get_operation_theatre_bookings(current_user):
+    columns, serialize = projection(OPERATION_THEATRE_BOOKING_FIELDS)
+    operation_theatre_bookings, page = list_rows(OperationTheatreBooking.query.with_entities(*columns), OperationTheatreBooking, OPERATION_THEATRE_BOOKING_FIELDS)
+    return jsonify(dict(page, operation_theatre_bookings=[serialize(ot_booking) for ot_booking in operation_theatre_bookings]))
+
+@bp.route('/operation-theatre-bookings', methods=['POST'])
+@token_required
+@permission_required('operation-theatre-bookings:write')
+def create_operation_theatre_booking(current_user):
+    operation_theatre_booking = OperationTheatreBooking(**OPERATION_THEATRE_BOOKING_SCHEMA.load(request.get_json(silent=True)))
+    db.session.add(operation_theatre_booking)
+    db.session.commit()
+    return jsonify({'message': 'Operation theatre booking created successfully'})
+
+@bp.route('/operation-theatre-bookings/<int:ot_booking_id>', methods=['PUT'])
+@token_required
+@permission_required('operation-theatre-bookings:write')
+def update_operation_theatre_booking(current_user, ot_booking_id):
+    operation_theatre_booking = OperationTheatreBooking.query.filter_by(id=ot_booking_id).first()
+    if not operation_theatre_booking:
+        return jsonify({'message': 'Operation theatre booking not found'})
+    assign(operation_theatre_booking, OPERATION_THEATRE_BOOKING_SCHEMA.load(request.get_json(silent=True), partial=True))
+    db.session.commit()
+    return jsonify({'message': 'Operation theatre booking updated successfully'})
+
+
+@bp.route('/operation-theatre-bookings/<int:ot_booking_id>', methods=['DELETE'])
+@token_required
+@permission_required('operation-theatre-bookings:write')
+def delete_operation_theatre_booking(current_user, ot_booking_id):
+    operation_theatre_booking = OperationTheatreBooking.query.filter_by(id=ot_booking_id).first()
+    if not operation_theatre_booking:
+        return jsonify({'message': 'Operation theatre booking not found'})
+    db.session.delete(operation_theatre_booking)
+    db.session.commit()
+    return jsonify({'message': 'Operation theatre booking deleted successfully'})
+
+
+# Operation Theater API
+@bp.route('/operation-theaters', methods=['GET'])
+@token_required
+def get_all_operation_theaters(current_user):
+
+    columns, serialize = projection(OPERATION_THEATER_FIELDS)
+    operation_theaters, page = list_rows(OperationTheater.query.with_entities(*columns), OperationTheater, OPERATION_THEATER_FIELDS)
+
+    return jsonify(dict(page, operation_theaters=[serialize(operation_theater) for operation_theater in operation_theaters]))
+
+@bp.route('/operation-theaters/<int:id>', methods=['GET'])
+@token_required
+def get_operation_theater(current_user, id):
+
+    columns, serialize = projection(OPERATION_THEATER_FIELDS)
+    operation_theater = OperationTheater.query.with_entities(*columns).filter(OperationTheater.id == id).first()
+    if not operation_theater:
+        return jsonify({'message': 'Operation theater not found'})
+
+    return jsonify({'operation_theater': serialize(operation_theater)})
+
+
+
+@bp.route('/operation-theaters', methods=['POST'])
+@token_required
+@permission_required('operation-theaters:write')
+def create_operation_theater(current_user):
+
+    new_operation_theater = OperationTheater(**OPERATION_THEATER_SCHEMA.load(request.get_json()))
+
+    db.session.add(new_operation_theater)
+    db.session.commit()
+
+    return jsonify({'message': 'Operation theater created'})
+
+@bp.route('/operation-theaters/<int:id>', methods=['PUT'])
+@token_required
+@permission_required('operation-theaters:write')
+def update_operation_theater(current_user, id):
+    operation_theater = OperationTheater.query.filter_by(id=id).first()
+    if not operation_theater:
+        return jsonify({'message': 'Operation theater not found'})
+
+    assign(operation_theater, OPERATION_THEATER_SCHEMA.load(request.get_json(), partial=True))
+
+    db.session.commit()
+
+    return jsonify({'message': 'Operation theater updated'})
+
+
+@bp.route('/operation-theaters/<int:id>', methods=['DELETE'])
+@token_required
+@permission_required('operation-theaters:write')
+def delete_operation_theater(current_user, id):
+
+    operation_theater = OperationTheater.query.filter_by(id=id).first()
+    if not operation_theater:
+        return jsonify({'message': 'Operation theater not found'})
+
+    db.session.delete(operation_theater)
+    db.session.commit()
+
+    return jsonify({'message': 'Operation theater deleted'})
+
+
+# Operation Theater Planning API
+# API to pack a batch of pending surgeries into theater sessions, e.g.
+# {"cases": [{"id": "a", "doctor_id": 1, "duration": 90, "earliest": "2024-06-03",
+#  "latest": "2024-06-07"}], "theater_ids": [1, 2], "time_budget": 2}
+# The plan is returned, not booked
+@bp.route('/operation-theaters/plan', methods=['POST'])
+@token_required
+@permission_required('operation-theaters:plan')
+def plan_operation_theaters(current_user):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'message': 'The body must be a JSON object'}), 400
+    config = current_app.config
+
+    cases = data.get('cases')
+    if not isinstance(cases, list) or not cases:
+        return jsonify({'message': 'cases must be a non-empty list'}), 400
+    if len(cases) > config['OT_PLAN_MAX_CASES']:
+        return jsonify({'message': 'At most %d cases per plan' % config['OT_PLAN_MAX_CASES']}), 400
+
+    planned = []
+    for n, case in enumerate(cases):
+        try:
+            planned.append({
+                'id': case.get('id', n),
+                'doctor_id': int(case['doctor_id']),
+                'duration': int(case['duration']),
+                'earliest': datetime.strptime(case['earliest'], '%Y-%m-%d').date(),
+                'latest': datetime.strptime(case['latest'], '%Y-%m-%d').date(),
+            })
+        except (AttributeError, KeyError, OverflowError, TypeError, ValueError):
+            return jsonify({'message': 'Case %d needs doctor_id, duration in minutes and earliest and latest dates (YYYY-MM-DD)' % n}), 400
+        if planned[-1]['duration'] <= 0 or planned[-1]['latest'] < planned[-1]['earliest']:
+            return jsonify({'message': 'Case %d needs a positive duration and latest on or after earliest' % n}), 400
+
+    first = min(case['earliest'] for case in planned)
+    last = max(case['latest'] for case in planned)
+    if (last - first).days >= config['OT_PLAN_MAX_DAYS']:
+        return jsonify({'message': 'A plan may cover at most %d days' % config['OT_PLAN_MAX_DAYS']}), 400
+
+    theater_ids = data.get('theater_ids')
+    if theater_ids is not None and (not isinstance(theater_ids, list) or not all(isinstance(id, int) for id in theater_ids)):
+        return jsonify({'message': 'theater_ids must be a list of ids'}), 400
+    query = OperationTheater.query.order_by(OperationTheater.id)
+    if theater_ids:
+        query = query.filter(OperationTheater.id.in_(theater_ids))
+    theaters = query.all()
+    if not theaters:
+        return jsonify({'message': 'No operation theaters to plan'}), 400
+
+    # float() also takes 'nan' and 'inf', which no search can be given
+    try:
+        time_budget = float(data.get('time_budget', config['OT_PLAN_TIME_BUDGET']))
+    except (TypeError, ValueError):
+        time_budget = math.nan
+    if not math.isfinite(time_budget):
+        return jsonify({'message': 'time_budget must be a number of seconds'}), 400
+    time_budget = min(time_budget, config['OT_PLAN_MAX_TIME_BUDGET'])
+
+    return jsonify(plan_theaters(planned, theaters, max(time_budget, 0)))
+
+
+# a no-op write to the doctor's row, held until the transaction ends: the
+# row lock serializes bookings for one doctor, and on SQLite the write takes
+# the database write lock, so reads after it see every committed booking
+def lock_doctor(doctor_id):
+    table = Doctor.__table__
+    db.session.execute(table.update().where(table.c.id == doctor_id).values(id=table.c.id))
+
+
+# Operation Theater Booking API
+# books an operation when the doctor is available at that time and not
+# already operating, e.g. {"patient_id": 1, "doctor_id": 1, "operation_type":
+# "Appendectomy", "date": "2024-06-03", "start_time": "09:00", "end_time": "10:30"}
+@bp.route('/operation-theater-booking', methods=['POST'])
+@token_required
+@permission_required('operation-theatre-bookings:write')
+def book_operation_theater(current_user):
+    values = OPERATION_THEATRE_BOOKING_SCHEMA.load(request.get_json(silent=True))
+    missing = [name for name in BOOKING_REQUIRED_FIELDS if values.get(name) is None]
+    if missing:
+        bad_request('Invalid request', errors={name: 'is required' for name in missing})
+    doctor_id, date, start_time, end_time = values['doctor_id'], values['date'], values['start_time'], values['end_time']
+    if end_time <= start_time:
+        bad_request('Invalid request', errors={'end_time': 'must be after start_time'})
+
+    # check if the doctor is available for the whole operation
+    availability = DoctorAvailability.query.filter(
+        DoctorAvailability.doctor_id == doctor_id, DoctorAvailability.day_of_week == date.weekday(),
+        DoctorAvailability.start_time <= start_time, DoctorAvailability.end_time >= end_time).first()
+    if not availability:
+        return jsonify({'message': 'Doctor not available at the specified time'}), 409
+
+    # bookings are not tied to a theater, so the check is that the doctor is
+    # not booked for another operation at the same time. The check and the
+    # insert run after lock_doctor, so two overlapping bookings cannot both pass
+    lock_doctor(doctor_id)
+    clash = OperationTheatreBooking.query.filter(
+        OperationTheatreBooking.doctor_id == doctor_id, OperationTheatreBooking.date == date,
+        OperationTheatreBooking.start_time < end_time, OperationTheatreBooking.end_time > start_time).first()
+    if clash:
+        db.session.rollback()
+        return jsonify({'message': 'Doctor already has an operation at the specified time', 'booking_id': clash.id}), 409
+
+    new_booking = OperationTheatreBooking(**values)
+    db.session.add(new_booking)
+    db.session.commit()
+
+    return jsonify({'message': 'Operation theater booked successfully', 'id': new_booking.id})
@@ -0,0 +1,416 @@
+import collections
+import contextlib
+import json
+import pickle
+import sqlite3
+import threading
+import time
+from flask import current_app, g, request
+from markupsafe import Markup
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from hospital.extensions import db
+from hospital.models import ChangeLog
+
+# returned by claim_poll when the change log was read less than an interval ago
+NOT_DUE = object()
+
+
+# Cache stores
+# the tier behind each worker's LRU. A store keeps a counter of
+# invalidations: every write to a table bumps it and records the new value
+# as the table's seq, which every worker reads from the last value it saw to
+# drop its own copies. It also holds the change log position, so the change
+# log is read once per interval for all the workers that share the store
+
+# nothing shared: entries live in the worker's LRU only, and invalidations
+# reach the threads of this worker
+class MemoryStore(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seq = 0
+        # table -> seq of its newest invalidation
+        self.table_seq = {}
+        self.cursor = None
+        self.polled = None
+
+    # the change log seq read up to (None before the first read), or NOT_DUE
+    def claim_poll(self, interval):
+        now = time.monotonic()
+        with self.lock:
+            if self.polled is not None and now - self.polled < interval:
+                return NOT_DUE
+            self.polled = now
+            return self.cursor
+
+    # bump the seq of each of tables, and move the change log position on to
+    # cursor; returns table -> new seq
+    def invalidate(self, tables, cursor=None):
+        with self.lock:
+            for table in tables:
+                self.seq += 1
+                self.table_seq[table] = self.seq
+            if cursor is not None:
+                self.cursor = cursor if self.cursor is None else max(self.cursor, cursor)
+            return {table: self.table_seq[table] for table in tables}
+
+    # (newest seq, [(table, seq)] of the tables invalidated after since)
+    def invalidated(self, since):
+        with self.lock:
+            return self.seq, [(table, seq) for table, seq in self.table_seq.items() if seq > since]
+
+    def get(self, key):
+        return None
+
+    def put(self, key, data, tables, seq, ttl):
+        pass
+
+    def clear(self):
+        pass
+
+
+SQLITE_STORE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache_entry (key TEXT PRIMARY KEY, value BLOB NOT NULL, tables TEXT NOT NULL,
+                                        seq INTEGER NOT NULL, expires REAL, size INTEGER NOT NULL, used REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS ix_cache_entry_used ON cache_entry (used);
+CREATE INDEX IF NOT EXISTS ix_cache_entry_expires ON cache_entry (expires);
+CREATE TABLE IF NOT EXISTS cache_entry_table (table_name TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (table_name, key));
+CREATE INDEX IF NOT EXISTS ix_cache_entry_table_key ON cache_entry_table (key);
+CREATE TABLE IF NOT EXISTS cache_table (table_name TEXT PRIMARY KEY, seq INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS cache_state (name TEXT PRIMARY KEY, value REAL NOT NULL);
+'''
+
+# entries and invalidations in a sqlite file of their own, shared by every
+# worker on the host (like RATE_LIMIT_STORE), so a result is stored once per
+# host however many workers read it. Values are pickled: the file is written
+# only by the app's own workers. Past max_bytes the entries least recently
+# read from the file go first; a read records its time only when the last
+# record is touch_interval seconds old, so most hits write nothing
+class SQLiteStore(object):
+    def __init__(self, path, max_bytes, touch_interval=0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self.local = threading.local()
+
+    def connection(self):
+        # one connection per thread, opened after the fork
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            # a cache can lose its last writes in a power cut
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SQLITE_STORE_SCHEMA)
+            self.local.connection = connection
+        return connection
+
+    @contextlib.contextmanager
+    def transaction(self):
+        connection = self.connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+            connection.execute('COMMIT')
+        except:
+            connection.execute('ROLLBACK')
+            raise
+
+    def state(self, connection, name):
+        row = connection.execute('SELECT value FROM cache_state WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, connection, name, value):
+        connection.execute('INSERT OR REPLACE INTO cache_state (name, value) VALUES (?, ?)', (name, value))
+
+    def claim_poll(self, interval):
+        # wall clock time, since monotonic clocks are not shared between
+        # processes; the write lock is only taken once the poll is due
+        now = time.time()
+        polled = self.state(self.connection(), 'polled')
+        if polled is not None and now - polled < interval:
+            return NOT_DUE
+        with self.transaction() as connection:
+            polled = self.state(connection, 'polled')
+            if polled is not None and now - polled < interval:
+                return NOT_DUE
+            self.set_state(connection, 'polled', now)
+            cursor = self.state(connection, 'cursor')
+        return int(cursor) if cursor is not None else None
+
+    def invalidate(self, tables, cursor=None):
+        changed = {}
+        with self.transaction() as connection:
+            seq = int(self.state(connection, 'seq') or 0)
+            for table in tables:
+                seq += 1
+                changed[table] = seq
+                connection.execute('INSERT OR REPLACE INTO cache_table (table_name, seq) VALUES (?, ?)', (table, seq))
+                keys = [key for key, in connection.execute(
+                    'SELECT key FROM cache_entry_table WHERE table_name = ?', (table,)).fetchall()]
+                self.drop(connection, keys)
+            self.set_state(connection, 'seq', seq)
+            if cursor is not None:
+                current = self.state(connection, 'cursor')
+                self.set_state(connection, 'cursor', cursor if current is None else max(int(current), cursor))
+        return changed
+
+    def invalidated(self, since):
+        connection = self.connection()
+        seq = int(self.state(connection, 'seq') or 0)
+        changed = connection.execute('SELECT table_name, seq FROM cache_table WHERE seq > ?', (since,)).fetchall()
+        return max([seq] + [table_seq for table, table_seq in changed]), changed
+
+    # (value, tables, seq, seconds left or None, size), or None
+    def get(self, key):
+        connection = self.connection()
+        key = json.dumps(key, default=str)
+        row = connection.execute('SELECT value, tables, seq, expires, size, used FROM cache_entry WHERE key = ?',
+                                 (key,)).fetchone()
+        if row is None:
+            return None
+        data, tables, seq, expires, size, used = row
+        now = time.time()
+        if expires is not None and expires <= now:
+            return None
+        if now - used >= self.touch_interval:
+            connection.execute('UPDATE cache_entry SET used = ? WHERE key = ?', (now, key))
+        return pickle.loads(data), tuple(json.loads(tables)), seq, expires - now if expires is not None else None, size
+
+    # store data unless one of its tables was invalidated after seq
+    def put(self, key, data, tables, seq, ttl):
+        key = json.dumps(key, default=str)
+        now = time.time()
+        with self.transaction() as connection:
+            for table in tables:
+                row = connection.execute('SELECT seq FROM cache_table WHERE table_name = ?', (table,)).fetchone()
+                if row and row[0] > seq:
+                    return
+            self.drop(connection, [key])
+            connection.execute('INSERT INTO cache_entry (key, value, tables, seq, expires, size, used) '
+                               'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                               (key, data, json.dumps(tables), seq, now + ttl if ttl else None, len(data), now))
+            connection.executemany('INSERT INTO cache_entry_table (table_name, key) VALUES (?, ?)',
+                                   [(table, key) for table in set(tables)])
+            self.evict(connection, now)
+
+    def evict(self, connection, now):
+        self.drop(connection, [key for key, in connection.execute(
+            'SELECT key FROM cache_entry WHERE expires <= ?', (now,)).fetchall()])
+        total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM cache_entry').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        keys = []
+        for key, size in connection.execute('SELECT key, size FROM cache_entry ORDER BY used').fetchall():
+            if total <= self.max_bytes:
+                break
+            keys.append(key)
+            total -= size
+        self.drop(connection, keys)
+
+    def drop(self, connection, keys):
+        connection.executemany('DELETE FROM cache_entry WHERE key = ?', [(key,) for key in keys])
+        connection.executemany('DELETE FROM cache_entry_table WHERE key = ?', [(key,) for key in keys])
+
+    def clear(self):
+        with self.transaction() as connection:
+            connection.execute('DELETE FROM cache_entry')
+            connection.execute('DELETE FROM cache_entry_table')
+
+
+# Result cache
+# computed results, each tagged with the tables it was computed from, in an
+# LRU per worker in front of a store (see above). sync() first hands the
+# change log past the store's position to the store, at most once per
+# sync_interval: that covers writes from other hosts, and from other workers
+# when the store is not shared. Writes through this app's ORM are broadcast
+# at commit instead (see broadcast_changes). Then the entries of every table
+# invalidated since the last sync are dropped. The TTL covers writes that
+# bypass the ORM and so the change log (bulk Core inserts, archive moves);
+# past max_bytes the least recently used entries go first
+class ResultCache(object):
+    def __init__(self, max_bytes, ttl=None, store=None, sync_interval=0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.store = store if store is not None else MemoryStore()
+        self.sync_interval = sync_interval
+        self.lock = threading.Lock()
+        # key -> (value, tables, seq, expires, size), least recently used first
+        self.entries = collections.OrderedDict()
+        # table -> keys of the entries computed from it
+        self.by_table = {}
+        # table -> seq of its newest invalidation seen
+        self.table_seq = {}
+        self.last_seq = 0
+        self.size = 0
+
+    # drop the entries of every table invalidated since the last check;
+    # returns the seq checked up to, so a result computed now can be stored
+    # safely
+    def sync(self):
+        cursor = self.store.claim_poll(self.sync_interval)
+        if cursor is not NOT_DUE:
+            self.read_change_log(cursor)
+
+        seq, changed = self.store.invalidated(self.last_seq)
+        self.apply(changed)
+        with self.lock:
+            self.last_seq = max(self.last_seq, seq)
+        return seq
+
+    # hand the tables written past cursor in the change log to the store
+    def read_change_log(self, cursor):
+        if cursor is None:
+            seq = db.session.query(func.max(ChangeLog.seq)).scalar() or 0
+            changed = []
+        else:
+            changed = db.session.query(ChangeLog.entity, func.max(ChangeLog.seq)) \
+                .filter(ChangeLog.seq > cursor).group_by(ChangeLog.entity).all()
+            seq = max([cursor] + [table_seq for table, table_seq in changed])
+        self.invalidate([table for table, table_seq in changed], seq)
+
+    # invalidate tables in the store, for every worker sharing it, and here
+    # at once
+    def invalidate(self, tables, cursor=None):
+        self.apply(self.store.invalidate(tables, cursor).items())
+
+    def apply(self, changed):
+        with self.lock:
+            for table, table_seq in changed:
+                if table_seq > self.table_seq.get(table, 0):
+                    self.table_seq[table] = table_seq
+                    for key in list(self.by_table.get(table, ())):
+                        self.drop(key)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[3] is None or entry[3] >= time.monotonic():
+                    self.entries.move_to_end(key)
+                    return True, entry[0]
+                self.drop(key)
+
+        shared = self.store.get(key)
+        if shared is None:
+            return False, None
+        value, tables, seq, ttl, size = shared
+        self.keep(key, value, tables, seq, ttl, size)
+        return True, value
+
+    # store value unless one of its tables was invalidated after seq, the
+    # point its computation started from
+    def put(self, key, value, tables, seq):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if self.keep(key, value, tables, seq, self.ttl, len(data)):
+            self.store.put(key, data, tables, seq, self.ttl)
+
+    def keep(self, key, value, tables, seq, ttl, size):
+        with self.lock:
+            if any(self.table_seq.get(table, 0) > seq for table in tables) or size > self.max_bytes:
+                return False
+            if key in self.entries:
+                self.drop(key)
+            expires = time.monotonic() + ttl if ttl else None
+            self.entries[key] = (value, tables, seq, expires, size)
+            for table in tables:
+                self.by_table.setdefault(table, set()).add(key)
+            self.size += size
+            while self.size > self.max_bytes:
+                self.drop(next(iter(self.entries)))
+            return True
+
+    def drop(self, key):
+        value, tables, seq, expires, size = self.entries.pop(key)
+        for table in tables:
+            self.by_table[table].discard(key)
+        self.size -= size
+
+    # the seq of the newest invalidation seen of each of tables, 0 for
+    # tables not written since the store was created
+    def versions(self, tables):
+        with self.lock:
+            return tuple(self.table_seq.get(table, 0) for table in tables)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.by_table.clear()
+            self.size = 0
+        self.store.clear()
+
+
+def get_result_cache(app):
+    if 'result_cache' not in app.extensions:
+        path = app.config['RESULT_CACHE_STORE']
+        store = SQLiteStore(path, app.config['RESULT_CACHE_STORE_MAX_BYTES'],
+                            app.config['RESULT_CACHE_STORE_TOUCH_INTERVAL']) if path else MemoryStore()
+        app.extensions['result_cache'] = ResultCache(app.config['RESULT_CACHE_MAX_BYTES'], app.config['RESULT_CACHE_TTL'],
+                                                     store, app.config['RESULT_CACHE_SYNC_INTERVAL'])
+    return app.extensions['result_cache']
+
+
+# the result cache, synced once per request however many lookups the request
+# makes, and the seq results computed in this request start from
+def synced_cache():
+    cache = get_result_cache(current_app)
+    if 'cache_seq' not in g:
+        g.cache_seq = cache.sync()
+    return cache, g.cache_seq
+
+
+# the endpoint and its query string, with repeated and reordered arguments
+# normalized so equal requests share an entry
+def request_key():
+    args = request.args
+    return (request.endpoint,) + tuple((name, tuple(sorted(args.getlist(name)))) for name in sorted(args) if name != 'token')
+
+
+# compute() under key, from the cache while none of tables has changed
+def cached_value(key, tables, compute):
+    cache, seq = synced_cache()
+    found, value = cache.get(key)
+    if found:
+        return value
+
+    value = compute()
+    cache.put(key, value, tuple(tables), seq)
+    return value
+
+# compute() for this request, from the cache while none of tables has changed
+def cached_result(tables, compute):
+    return cached_value(request_key(), tables, compute)
+
+
+# Template fragments
+# {% call cached_fragment('patient-rows', ('patient',), page) %}...{% endcall %}
+# renders the block once per name, key and versions of its tables and serves
+# the html from the result cache after that, so the queries a block makes
+# only run when one of its tables changed. The cache is synced once per
+# request however many fragments a page has
+def cached_fragment(name, tables, *key, caller):
+    cache, seq = synced_cache()
+
+    tables = tuple(tables)
+    key = ('fragment', name) + key + cache.versions(tables)
+    found, value = cache.get(key)
+    if found:
+        return Markup(value)
+
+    value = caller()
+    cache.put(key, str(value), tables, seq)
+    return Markup(value)
+
+
+# Write events
+# a commit that wrote through the ORM invalidates its tables (collected by
+# hospital.changes) at once, in this worker and every worker sharing the
+# store, rather than when the change log is next read
+def broadcast_changes(session):
+    tables = session.info.pop('changed_tables', None)
+    if tables:
+        get_result_cache(current_app).invalidate(sorted(tables))
+
+
+event.listen(Session, 'after_commit', broadcast_changes)
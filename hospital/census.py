@@ -0,0 +1,174 @@
+import datetime
+from sqlalchemy import and_, event, func, inspect, or_, select, union_all
+
+from hospital.archive import archive_horizon
+from hospital.extensions import db
+from hospital.models import Admission, AdmissionArchive, CensusSnapshot
+from hospital.sharding import scatter
+
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def midnight(day):
+    return datetime.datetime.combine(day, datetime.time())
+
+def counts_as_inpatient(status):
+    return status != 'Cancelled'
+
+
+# a patient is in the hospital over [admitted, discharged); these are the first
+# and last days whose midnight falls inside that stay (last is None while open)
+def stay_days(admitted, discharged):
+    first = admitted.date() if admitted.time() == datetime.time() else admitted.date() + ONE_DAY
+    if discharged is None:
+        return first, None
+    last = discharged.date() - ONE_DAY if discharged.time() == datetime.time() else discharged.date()
+    return first, last
+
+
+# add delta to every stored snapshot the stay covers, in a single statement
+def adjust_snapshots(connection, admitted, discharged, delta):
+    first, last = stay_days(admitted, discharged)
+    table = CensusSnapshot.__table__
+
+    condition = table.c.day >= first
+    if last is not None:
+        if last < first:
+            return
+        condition = and_(condition, table.c.day <= last)
+
+    connection.execute(table.update().where(condition).values(occupancy=table.c.occupancy + delta))
+
+
+def admission_inserted(mapper, connection, target):
+    if counts_as_inpatient(target.status):
+        adjust_snapshots(connection, target.registration_date_time, target.discharge_date_time, 1)
+
+def admission_updated(mapper, connection, target):
+    state = inspect(target)
+    old = {}
+    for name in ('registration_date_time', 'discharge_date_time', 'status'):
+        history = state.attrs[name].history
+        if history.has_changes():
+            old[name] = history.deleted[0] if history.deleted else None
+        else:
+            old[name] = getattr(target, name)
+
+    if counts_as_inpatient(old['status']):
+        adjust_snapshots(connection, old['registration_date_time'], old['discharge_date_time'], -1)
+    if counts_as_inpatient(target.status):
+        adjust_snapshots(connection, target.registration_date_time, target.discharge_date_time, 1)
+
+def admission_deleted(mapper, connection, target):
+    if counts_as_inpatient(target.status):
+        adjust_snapshots(connection, target.registration_date_time, target.discharge_date_time, -1)
+
+
+# the admission tables that can hold a stay with an event after after: the
+# archive only holds stays discharged (or cancelled) before its horizon
+def admission_tables(after=None):
+    horizon = archive_horizon('admission')
+    if horizon is not None and (after is None or after < horizon):
+        return [Admission.__table__, AdmissionArchive.__table__]
+    return [Admission.__table__]
+
+# values of column over the stays, live and archived, that are not cancelled
+# and have column in (after, until]
+def stay_times(column, after, until):
+    selects = [select(table.c[column]).where(table.c.status != 'Cancelled', table.c[column] > after, table.c[column] <= until)
+               for table in admission_tables(after)]
+    return db.session.execute(union_all(*selects) if len(selects) > 1 else selects[0]).all()
+
+# admit (+1) and discharge (-1) events in (after, until], sorted by time
+def occupancy_events(after, until):
+    admitted = stay_times('registration_date_time', after, until)
+    discharged = stay_times('discharge_date_time', after, until)
+
+    events = [(time, 1) for time, in admitted] + [(time, -1) for time, in discharged]
+    events.sort()
+    return events
+
+
+# make sure there is a snapshot for every day up to until, replaying only the
+# events after the newest snapshot already stored
+def ensure_snapshots(until):
+    last_day = db.session.query(func.max(CensusSnapshot.day)).scalar()
+    if last_day is not None and last_day >= until:
+        return
+
+    if last_day is None:
+        firsts = [db.session.query(func.min(table.c.registration_date_time)).filter(table.c.status != 'Cancelled').scalar()
+                  for table in admission_tables()]
+        first_admitted = min([first for first in firsts if first is not None], default=None)
+        if first_admitted is None or first_admitted.date() > until:
+            return
+        # nobody is in the hospital the day before the first admission
+        day = first_admitted.date() - ONE_DAY
+        occupancy = 0
+    else:
+        day = last_day
+        occupancy = db.session.query(CensusSnapshot.occupancy).filter(CensusSnapshot.day == last_day).scalar()
+
+    events = occupancy_events(midnight(day), midnight(until))
+    rows = []
+    index = 0
+    while day < until:
+        day += ONE_DAY
+        boundary = midnight(day)
+        while index < len(events) and events[index][0] <= boundary:
+            occupancy += events[index][1]
+            index += 1
+        rows.append({'day': day, 'occupancy': occupancy})
+
+    # another worker may be filling in the same days
+    db.session.execute(CensusSnapshot.__table__.insert().prefix_with('OR IGNORE'), rows)
+    db.session.commit()
+
+
+# drop the snapshots and build them again from the admissions, live and archived
+def rebuild_snapshots(until=None):
+    def rebuild(shard):
+        db.session.query(CensusSnapshot).delete()
+        db.session.commit()
+        ensure_snapshots(until or datetime.date.today())
+
+    scatter(rebuild)
+
+
+# occupancy at start, start + step, ... up to end, added up over the shards
+def census(start, end, step):
+    series = scatter(lambda shard: shard_census(start, end, step))
+    return [(points[0][0], sum(occupancy for time, occupancy in points)) for points in zip(*series)]
+
+# the census of the current shard, swept from the snapshot of start's day
+# instead of from the beginning of history; each shard keeps its own snapshots
+def shard_census(start, end, step):
+    day = start.date()
+    ensure_snapshots(day)
+
+    occupancy = db.session.query(CensusSnapshot.occupancy).filter(CensusSnapshot.day == day).scalar() or 0
+    events = occupancy_events(midnight(day), end)
+
+    series = []
+    index = 0
+    time = start
+    while time <= end:
+        while index < len(events) and events[index][0] <= time:
+            occupancy += events[index][1]
+            index += 1
+        series.append((time, occupancy))
+        time += step
+
+    return series
+
+
+def current_occupancy():
+    now = datetime.datetime.now()
+    return sum(scatter(lambda shard: Admission.query.filter(
+        Admission.status != 'Cancelled', Admission.registration_date_time <= now,
+        or_(Admission.discharge_date_time.is_(None), Admission.discharge_date_time > now)).count()))
+
+
+event.listen(Admission, 'after_insert', admission_inserted)
+event.listen(Admission, 'after_update', admission_updated)
+event.listen(Admission, 'after_delete', admission_deleted)
@@ -0,0 +1,90 @@
+import datetime
+import threading
+from sqlalchemy import Integer, event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from hospital.extensions import db
+from hospital.models import ChangeLog
+
+# woken after every commit that wrote to the change log in this process
+changes_committed = threading.Condition()
+
+
+# entity_id is an integer, so only models keyed by a single integer column
+# are logged; the others (reference ranges by test type, versions, census
+# snapshots, slot claims) are bookkeeping keyed by strings, dates or several
+# columns
+def has_integer_key(mapper):
+    return len(mapper.primary_key) == 1 and isinstance(mapper.primary_key[0].type, Integer)
+
+
+# record entity, id and operation for every object written by a flush
+def record_changes(session, flush_context):
+    now = datetime.datetime.utcnow()
+    rows = []
+    tables = set()
+    for operation, objects in (('insert', session.new), ('update', session.dirty), ('delete', session.deleted)):
+        for obj in objects:
+            if isinstance(obj, ChangeLog):
+                continue
+            if operation == 'update' and not session.is_modified(obj, include_collections=False):
+                continue
+
+            mapper = inspect(obj).mapper
+            tables.add(mapper.local_table.name)
+            if not has_integer_key(mapper):
+                continue
+            rows.append({
+                'entity': mapper.local_table.name,
+                'entity_id': mapper.primary_key_from_instance(obj)[0],
+                'operation': operation,
+                'changed_at': now
+            })
+
+    if rows:
+        session.connection().execute(ChangeLog.__table__.insert(), rows)
+        session.info['changes_pending'] = True
+    # for the result cache to invalidate at commit (see hospital.cache); writes
+    # left out of the log reach other workers through RESULT_CACHE_STORE only,
+    # and other hosts once RESULT_CACHE_TTL runs out
+    if tables:
+        session.info.setdefault('changed_tables', set()).update(tables)
+
+
+# delete change log rows written before cutoff, one batch per transaction.
+# The newest row is kept, so the last sequence number survives an idle spell
+def prune_change_log(cutoff, batch_size):
+    table = ChangeLog.__table__
+    last = db.session.query(func.max(ChangeLog.seq)).scalar()
+    pruned = 0
+    while True:
+        batch = select(table.c.seq).where(table.c.changed_at < cutoff, table.c.seq < last) \
+            .order_by(table.c.seq).limit(batch_size)
+        deleted = db.session.execute(table.delete().where(table.c.seq.in_(batch))).rowcount
+        db.session.commit()
+        pruned += deleted
+        if deleted < batch_size:
+            return pruned
+
+
+def notify_changes(session):
+    if session.info.pop('changes_pending', False):
+        with changes_committed:
+            changes_committed.notify_all()
+
+
+def discard_changes(session):
+    session.info.pop('changes_pending', None)
+    session.info.pop('changed_tables', None)
+
+
+# block until a local commit writes changes, or the timeout runs out;
+# commits from other workers are picked up by the caller polling again
+def wait_for_changes(timeout):
+    with changes_committed:
+        changes_committed.wait(timeout)
+
+
+event.listen(Session, 'after_flush', record_changes)
+event.listen(Session, 'after_commit', notify_changes)
+event.listen(Session, 'after_rollback', discard_changes)
@@ -0,0 +1,161 @@
+class Config(object):
+    SECRET_KEY = 'secret_key'
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///hospital.db'
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # concurrent writers wait for the SQLite lock instead of failing at once
+    SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': 15}}
+
+    # blueprint modules registered by create_app, in order
+    BLUEPRINTS = [
+        'hospital.blueprints.auth',
+        'hospital.blueprints.patients',
+        'hospital.blueprints.scheduling',
+        'hospital.blueprints.theaters',
+        'hospital.blueprints.staff',
+        'hospital.blueprints.analytics',
+        'hospital.blueprints.changes',
+        'hospital.blueprints.export',
+        'hospital.blueprints.labs',
+        'hospital.blueprints.jobs',
+        'hospital.blueprints.pages',
+    ]
+
+    # change feed long-poll limits, in seconds
+    CHANGES_MAX_WAIT = 30
+    CHANGES_POLL_INTERVAL = 1.0
+    CHANGES_MAX_LIMIT = 5000
+    # change log rows older than this many days are deleted by `flask archive
+    # run`; a feed reader further behind misses them
+    CHANGE_LOG_RETENTION_DAYS = 30
+
+    # dashboard push: seconds between stat refreshes, and between keep-alives
+    DASHBOARD_PUSH_INTERVAL = 2
+    DASHBOARD_KEEPALIVE = 15
+
+    # length of an appointment slot, in minutes
+    APPOINTMENT_SLOT_MINUTES = 15
+
+    # most points a single bed census request may return
+    CENSUS_MAX_POINTS = 10000
+
+    # duplicate patient detection: lowest score reported, score at which
+    # registration is refused without allow_duplicate, most candidates read
+    # per lookup, and largest blocking key block the batch dedupe compares
+    MATCH_MIN_SCORE = 0.6
+    MATCH_BLOCK_SCORE = 0.9
+    MATCH_MAX_CANDIDATES = 200
+    MATCH_MAX_BLOCK = 50
+
+    # how often, in seconds, patient summaries whose next appointment has
+    # passed are moved on to the following one
+    PATIENT_SUMMARY_REFRESH = 60
+
+    # theater planning (see hospital.planning): session hours of theaters
+    # whose availability gives none, weekdays with sessions, minutes to turn
+    # a theater round between cases, default and longest time budget in
+    # seconds, and most cases and days one plan may cover
+    OT_SESSION_HOURS = ('08:00', '18:00')
+    OT_SESSION_DAYS = (0, 1, 2, 3, 4)
+    OT_TURNOVER_MINUTES = 15
+    OT_PLAN_TIME_BUDGET = 2.0
+    OT_PLAN_MAX_TIME_BUDGET = 10.0
+    OT_PLAN_MAX_CASES = 2000
+    OT_PLAN_MAX_DAYS = 31
+
+    # longest range, in days, of one generated duty roster
+    ROSTER_MAX_DAYS = 92
+
+    # longest range, in days, of a doctor utilization request
+    UTILIZATION_MAX_DAYS = 366
+
+    # most patients a single lab trend request may ask for
+    LAB_TREND_MAX_PATIENTS = 100
+
+    # closed records older than this many days move to the archive tables
+    ARCHIVE_HORIZON_DAYS = 365
+    ARCHIVE_BATCH_SIZE = 1000
+
+    # report jobs (see hospital.jobs): pool threads per worker, most jobs
+    # queued or running, how long and how many bytes of finished results are
+    # kept, and the longest ?wait= on a job status request, in seconds
+    JOB_WORKERS = 2
+    JOB_MAX_PENDING = 20
+    JOB_RESULT_TTL = 600
+    JOB_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    JOB_MAX_WAIT = 30
+    # sqlite file holding the jobs and results for every worker on the host,
+    # so any worker answers the polls; None keeps jobs in the worker that
+    # accepted them, which only suits a single worker
+    JOB_STORE = 'hospital-jobs.db'
+
+    # result cache (see hospital.cache): size cap in bytes per worker, and
+    # seconds an entry may live (None for no limit) to cover writes that
+    # bypass the change log
+    RESULT_CACHE_MAX_BYTES = 16 * 1024 * 1024
+    RESULT_CACHE_TTL = 300
+    # sqlite file shared by the workers on a host, and its size cap; None
+    # keeps entries and invalidations per worker
+    RESULT_CACHE_STORE = None
+    RESULT_CACHE_STORE_MAX_BYTES = 256 * 1024 * 1024
+    # seconds between writes of an entry's last read time, which orders
+    # eviction from the store; a hit within them only reads
+    RESULT_CACHE_STORE_TOUCH_INTERVAL = 60
+    # seconds between reads of the change log for writes from other hosts
+    # (and other workers, without a store); 0 reads it on every request
+    RESULT_CACHE_SYNC_INTERVAL = 1
+
+    # streaming export: rows fetched per cursor batch, bytes per response chunk
+    EXPORT_BATCH_SIZE = 1000
+    EXPORT_CHUNK_SIZE = 64 * 1024
+
+    # patient-keyed tables split over these databases, one per shard (see
+    # hospital.sharding); empty keeps everything in SQLALCHEMY_DATABASE_URI
+    SHARD_URIS = []
+    SHARD_SCATTER_THREADS = 8
+    SHARD_DIRECTORY_CACHE_SIZE = 100000
+    # ids reserved per trip to the main database for sharded tables, and
+    # how often a reservation is retried while the database is locked
+    ID_BLOCK_SIZE = 100
+    ID_BLOCK_RETRIES = 5
+
+    # route class of each blueprint (others are 'standard'); 'stream' routes
+    # hold a connection open while idle and are left out of load shedding
+    ROUTE_CLASSES = {
+        'patients': 'clinical',
+        'scheduling': 'clinical',
+        'labs': 'clinical',
+        'analytics': 'bulk',
+        'export': 'bulk',
+        'changes': 'stream',
+        'jobs': 'stream',
+    }
+
+    # token buckets per user and route class: (tokens per second, burst)
+    RATE_LIMITS = {
+        'clinical': (20, 60),
+        'standard': (10, 30),
+        'bulk': (1, 5),
+        'stream': (1, 10),
+    }
+    # sqlite file shared by the workers on a host; None keeps buckets per worker
+    RATE_LIMIT_STORE = None
+
+    # load shedding per worker: requests in flight before non-clinical ones
+    # get 503, the hard limit for clinical ones, and the response time (moving
+    # average, seconds) above which non-clinical requests are shed
+    SHED_MAX_IN_FLIGHT = 48
+    SHED_CLINICAL_MAX_IN_FLIGHT = 60
+    SHED_LATENCY_TARGET = 0.5
+    SHED_RETRY_AFTER = 1
+
+    # list endpoints: default and largest ?per_page=, and whether
+    # ?per_page=all may return a whole list, for clients written before paging
+    LIST_PER_PAGE = 100
+    LIST_MAX_PER_PAGE = 1000
+    LIST_UNPAGED = True
+
+    # rows of each page of the server rendered lists
+    PAGE_ROWS = 50
+
+    # responses smaller than this many bytes are sent uncompressed
+    COMPRESS_MIN_SIZE = 1024
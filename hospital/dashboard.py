@@ -0,0 +1,107 @@
+import json
+import queue
+import threading
+import time
+from sqlalchemy import func
+
+from hospital.census import current_occupancy
+from hospital.extensions import db
+from hospital.models import (Admission, Appointment, ChangeLog, Doctor, HospitalStaff,
+                             OperationTheatreBooking, Patient, PatientTest)
+from hospital.sharding import count_rows
+
+
+# hospital statistics shown on the dashboard
+def dashboard_stats():
+    return {
+        'patient_count': count_rows(Patient),
+        'appointment_count': count_rows(Appointment),
+        'admission_count': count_rows(Admission),
+        'test_count': count_rows(PatientTest),
+        'ot_booking_count': OperationTheatreBooking.query.count(),
+        'doctor_count': Doctor.query.count(),
+        'staff_count': HospitalStaff.query.count(),
+        'inpatient_count': current_occupancy()
+    }
+
+
+# one producer thread per worker recomputes the stats when the change log
+# moves and fans the event out to every connected dashboard
+class DashboardBroadcaster(object):
+    def __init__(self, app):
+        self.app = app
+        self.interval = app.config['DASHBOARD_PUSH_INTERVAL']
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.last_event = None
+
+    def subscribe(self):
+        # a dashboard only needs the newest stats, so one slot is enough
+        subscriber = queue.Queue(maxsize=1)
+        with self.lock:
+            self.subscribers.add(subscriber)
+            if self.last_event:
+                subscriber.put(self.last_event)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='dashboard-broadcaster', daemon=True)
+                self.thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, event):
+        with self.lock:
+            self.last_event = event
+            subscribers = list(self.subscribers)
+
+        for subscriber in subscribers:
+            # replace an event the client has not read yet instead of queueing
+            try:
+                subscriber.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                pass
+
+    def run(self):
+        last_seq = None
+        while True:
+            with self.lock:
+                if not self.subscribers:
+                    # the next subscriber starts a new producer
+                    self.thread = None
+                    self.last_event = None
+                    return
+
+            with self.app.app_context():
+                # a failed tick (a locked database, an unreachable shard) is
+                # retried on the next one rather than ending the producer
+                try:
+                    # max(seq) is a primary key lookup, so checking for changes is cheap
+                    seq = db.session.query(func.max(ChangeLog.seq)).scalar()
+                    if seq != last_seq:
+                        stats = dashboard_stats()
+                        last_seq = seq
+                        self.publish('id: %s\nevent: stats\ndata: %s\n\n' % (seq or 0, json.dumps(stats)))
+                except Exception:
+                    self.app.logger.exception('Dashboard statistics failed')
+                finally:
+                    db.session.remove()
+
+            # at most one event per interval, however many changes came in
+            time.sleep(self.interval)
+
+
+broadcaster_lock = threading.Lock()
+
+def get_broadcaster(app):
+    # two first requests at once must not start two producers
+    with broadcaster_lock:
+        if 'dashboard_broadcaster' not in app.extensions:
+            app.extensions['dashboard_broadcaster'] = DashboardBroadcaster(app)
+        return app.extensions['dashboard_broadcaster']
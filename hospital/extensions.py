@@ -0,0 +1,7 @@
+from flask_sqlalchemy import SQLAlchemy
+
+from hospital.routing import RoutingSession
+
+# created unbound so every app built by create_app shares the same models;
+# the session routes patient tables to their shard when sharding is on
+db = SQLAlchemy(session_options={'class_': RoutingSession})
@@ -0,0 +1,352 @@
+import collections
+import concurrent.futures
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# seconds between reads of a job that another worker is running, while a
+# request waits for it
+WAIT_POLL_INTERVAL = 0.25
+
+
+# identical report and parameters give the same key
+def job_key(report, params):
+    return hashlib.sha1(json.dumps([report, params], sort_keys=True).encode()).hexdigest()
+
+
+class Job(object):
+    def __init__(self, report, params, id=None, status='queued', submitted_at=None, started_at=None,
+                 finished_at=None, result=None, error=None):
+        self.id = id or uuid.uuid4().hex
+        self.report = report
+        self.params = params
+        self.key = job_key(report, params)
+        self.status = status
+        self.submitted_at = submitted_at or time.time()
+        self.started_at = started_at
+        self.finished_at = finished_at
+        # the result as encoded JSON, ready to send
+        self.result = result
+        self.error = error
+
+    def describe(self):
+        return {
+            'id': self.id,
+            'report': self.report,
+            'params': self.params,
+            'status': self.status,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'error': self.error,
+        }
+
+
+# Job stores
+# a store holds the jobs and their results. A submission identical to a
+# queued, running or cached job gets that job back. Finished jobs are kept
+# for ttl seconds, and the least recently used results are dropped once they
+# hold more than max_bytes
+
+# jobs held by this worker process: only its own requests see them
+class MemoryJobStore(object):
+    def __init__(self, max_pending, ttl, max_bytes):
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.jobs = {}
+        # job key -> id of the job answering it
+        self.by_key = {}
+        # finished job id -> result size, least recently used first
+        self.finished = collections.OrderedDict()
+        self.cached_bytes = 0
+
+    # (job, created), or (None, False) when too many jobs are waiting already
+    def submit(self, report, params):
+        key = job_key(report, params)
+        with self.lock:
+            self.expire()
+            job = self.jobs.get(self.by_key.get(key))
+            if job is not None and job.status != 'failed':
+                self.touch(job)
+                return job, False
+
+            pending = sum(1 for job in self.jobs.values() if job.finished_at is None)
+            if pending >= self.max_pending:
+                return None, False
+
+            job = Job(report, params)
+            self.jobs[job.id] = job
+            self.by_key[key] = job.id
+            return job, True
+
+    def get(self, job_id, with_result=False):
+        with self.lock:
+            self.expire()
+            job = self.jobs.get(job_id)
+            if job is not None:
+                self.touch(job)
+            return job
+
+    def start(self, job_id):
+        with self.lock:
+            job = self.jobs[job_id]
+            job.status = 'running'
+            job.started_at = time.time()
+
+    def finish(self, job_id, result, error):
+        with self.lock:
+            job = self.jobs[job_id]
+            job.result = result
+            job.error = error
+            job.status = 'failed' if result is None else 'done'
+            job.finished_at = time.time()
+            self.finished[job_id] = len(result or b'')
+            self.cached_bytes += len(result or b'')
+            self.evict()
+
+    # the helpers below run with the lock held
+
+    def touch(self, job):
+        if job.id in self.finished:
+            self.finished.move_to_end(job.id)
+
+    def expire(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [job_id for job_id in self.finished if self.jobs[job_id].finished_at < cutoff]:
+            self.drop(job_id)
+
+    def evict(self):
+        # the newest result is kept even when it alone is over the limit
+        while self.cached_bytes > self.max_bytes and len(self.finished) > 1:
+            self.drop(next(iter(self.finished)))
+
+    def drop(self, job_id):
+        job = self.jobs.pop(job_id)
+        self.cached_bytes -= self.finished.pop(job_id)
+        if self.by_key.get(job.key) == job_id:
+            del self.by_key[job.key]
+
+
+SQLITE_JOB_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS report_job (id TEXT PRIMARY KEY, key TEXT NOT NULL, report TEXT NOT NULL, params TEXT NOT NULL,
+                                       status TEXT NOT NULL, worker INTEGER NOT NULL, submitted_at REAL NOT NULL,
+                                       started_at REAL, finished_at REAL, result BLOB, error TEXT,
+                                       size INTEGER NOT NULL DEFAULT 0, used REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS ix_report_job_key ON report_job (key);
+CREATE INDEX IF NOT EXISTS ix_report_job_finished_at ON report_job (finished_at);
+'''
+
+JOB_COLUMNS = 'id, report, params, status, submitted_at, started_at, finished_at, error'
+
+# the error of a job whose worker exited before finishing it
+WORKER_STOPPED = 'The worker running the report stopped'
+
+def worker_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# jobs and results in a sqlite file of their own, shared by every worker on
+# the host (like RATE_LIMIT_STORE), so any worker can answer the polls for a
+# job and identical submissions share one job host-wide. A job still runs in
+# the worker that accepted it; the jobs of a worker that exits are marked
+# failed the next time they are read
+class SQLiteJobStore(object):
+    def __init__(self, path, max_pending, ttl, max_bytes):
+        self.path = path
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.local = threading.local()
+
+    def connection(self):
+        # one connection per thread, opened after the fork
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(SQLITE_JOB_SCHEMA)
+            self.local.connection = connection
+        return connection
+
+    @contextlib.contextmanager
+    def transaction(self):
+        connection = self.connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+            connection.execute('COMMIT')
+        except:
+            connection.execute('ROLLBACK')
+            raise
+
+    def submit(self, report, params):
+        key = job_key(report, params)
+        now = time.time()
+        with self.transaction() as connection:
+            self.expire(connection, now)
+            self.fail_orphans(connection, now)
+            row = connection.execute('SELECT %s FROM report_job WHERE key = ? AND status != ? '
+                                     'ORDER BY submitted_at DESC LIMIT 1' % JOB_COLUMNS, (key, 'failed')).fetchone()
+            if row is not None:
+                connection.execute('UPDATE report_job SET used = ? WHERE id = ?', (now, row[0]))
+                return self.job(row), False
+
+            pending = connection.execute('SELECT COUNT(*) FROM report_job WHERE finished_at IS NULL').fetchone()[0]
+            if pending >= self.max_pending:
+                return None, False
+
+            job = Job(report, params, submitted_at=now)
+            connection.execute('INSERT INTO report_job (id, key, report, params, status, worker, submitted_at, used) '
+                               'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                               (job.id, key, report, json.dumps(params), job.status, os.getpid(), now, now))
+            return job, True
+
+    # the result is only read when asked for, so status polls stay cheap
+    def get(self, job_id, with_result=False):
+        connection = self.connection()
+        now = time.time()
+        columns = JOB_COLUMNS + ', worker' + (', result' if with_result else '')
+        row = connection.execute('SELECT %s FROM report_job WHERE id = ?' % columns, (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = self.job(row[:8])
+        if job.finished_at is not None and job.finished_at < now - self.ttl:
+            return None
+        if job.finished_at is None and not worker_alive(row[8]):
+            with self.transaction() as connection:
+                self.fail_orphans(connection, now)
+            return self.get(job_id, with_result)
+        if with_result:
+            job.result = row[9]
+        connection.execute('UPDATE report_job SET used = ? WHERE id = ?', (now, job_id))
+        return job
+
+    def start(self, job_id):
+        self.connection().execute('UPDATE report_job SET status = ?, started_at = ? WHERE id = ?',
+                                  ('running', time.time(), job_id))
+
+    def finish(self, job_id, result, error):
+        now = time.time()
+        with self.transaction() as connection:
+            connection.execute('UPDATE report_job SET status = ?, result = ?, error = ?, finished_at = ?, size = ?, '
+                               'used = ? WHERE id = ?',
+                               ('failed' if result is None else 'done', result, error, now, len(result or b''), now,
+                                job_id))
+            self.expire(connection, now)
+            self.evict(connection)
+
+    def job(self, row):
+        id, report, params, status, submitted_at, started_at, finished_at, error = row
+        return Job(report, json.loads(params), id=id, status=status, submitted_at=submitted_at,
+                   started_at=started_at, finished_at=finished_at, error=error)
+
+    # the helpers below run in a write transaction
+
+    def fail_orphans(self, connection, now):
+        for job_id, worker in connection.execute(
+                'SELECT id, worker FROM report_job WHERE finished_at IS NULL').fetchall():
+            if not worker_alive(worker):
+                connection.execute('UPDATE report_job SET status = ?, error = ?, finished_at = ?, used = ? WHERE id = ?',
+                                   ('failed', WORKER_STOPPED, now, now, job_id))
+
+    def expire(self, connection, now):
+        connection.execute('DELETE FROM report_job WHERE finished_at < ?', (now - self.ttl,))
+
+    def evict(self, connection):
+        # the newest result is kept even when it alone is over the limit
+        rows = connection.execute('SELECT id, size FROM report_job WHERE finished_at IS NOT NULL '
+                                  'ORDER BY used').fetchall()
+        total = sum(size for job_id, size in rows)
+        for job_id, size in rows[:-1]:
+            if total <= self.max_bytes:
+                break
+            connection.execute('DELETE FROM report_job WHERE id = ?', (job_id,))
+            total -= size
+
+
+# Report jobs
+# reports run on a small thread pool owned by the worker process, so the
+# request submitting one returns at once; the jobs themselves are kept in the
+# store
+class JobRunner(object):
+    def __init__(self, app, store):
+        self.app = app
+        self.store = store
+        self.lock = threading.Lock()
+        # id of each job running in this worker -> event set when it finishes
+        self.running = {}
+        self.executor = None
+
+    # (job, created), or (None, False) when too many jobs are waiting already
+    def submit(self, report, function, params):
+        job, created = self.store.submit(report, params)
+        if not created:
+            return job, False
+
+        with self.lock:
+            self.running[job.id] = threading.Event()
+            # created on first use, so a preloading master never starts threads
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(
+                    self.app.config['JOB_WORKERS'], thread_name_prefix='report-job')
+
+        self.executor.submit(self.run, job, function)
+        return job, True
+
+    def run(self, job, function):
+        self.store.start(job.id)
+        error = None
+        try:
+            with self.app.app_context():
+                result = json.dumps(function(**job.params)).encode()
+        except Exception as exception:
+            self.app.logger.exception('Report job %s (%s) failed', job.id, job.report)
+            result = None
+            error = str(exception) or exception.__class__.__name__
+
+        self.store.finish(job.id, result, error)
+        with self.lock:
+            self.running.pop(job.id).set()
+
+    def get(self, job_id, with_result=False):
+        return self.store.get(job_id, with_result)
+
+    # block until the job finishes or timeout seconds pass, and return it as
+    # last read (None once it expired); jobs run by other workers are polled
+    def wait(self, job, timeout):
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            done = self.running.get(job.id)
+        if done is not None:
+            done.wait(timeout)
+            return self.get(job.id)
+
+        while job is not None and job.finished_at is None:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            time.sleep(min(WAIT_POLL_INTERVAL, left))
+            job = self.get(job.id)
+        return job
+
+
+def get_job_runner(app):
+    if 'job_runner' not in app.extensions:
+        path = app.config['JOB_STORE']
+        limits = app.config['JOB_MAX_PENDING'], app.config['JOB_RESULT_TTL'], app.config['JOB_CACHE_MAX_BYTES']
+        store = SQLiteJobStore(path, *limits) if path else MemoryJobStore(*limits)
+        app.extensions['job_runner'] = JobRunner(app, store)
+    return app.extensions['job_runner']
@@ -0,0 +1,157 @@
+import numpy as np
+from sqlalchemy import event
+
+from hospital.extensions import db
+from hospital.models import LabResult, PatientTest, ReferenceRange
+from hospital.sharding import allocate_id, patients_by_shard, scatter, sharding_enabled
+
+
+# numeric patient test results are mirrored into the lab result store
+def numeric_result(text):
+    try:
+        value = float(text)
+    except (TypeError, ValueError):
+        return None
+    return value if np.isfinite(value) else None
+
+def store_test_result(connection, target):
+    value = numeric_result(target.test_result)
+    if value is not None:
+        row = dict(patient_id=target.patient_id, test_type=target.test_type, taken_at=target.test_date_time,
+                   value=value, patient_test_id=target.id)
+        # a Core insert, so the id is allocated here rather than by assign_global_id
+        if sharding_enabled():
+            row['id'] = allocate_id('lab_result')
+        connection.execute(LabResult.__table__.insert().values(**row))
+
+def drop_test_result(connection, target):
+    table = LabResult.__table__
+    connection.execute(table.delete().where(table.c.patient_test_id == target.id))
+
+
+def patient_test_inserted(mapper, connection, target):
+    store_test_result(connection, target)
+
+def patient_test_updated(mapper, connection, target):
+    drop_test_result(connection, target)
+    store_test_result(connection, target)
+
+def patient_test_deleted(mapper, connection, target):
+    drop_test_result(connection, target)
+
+
+# the series of test_type for every patient in patient_ids, in one indexed
+# query, as parallel arrays sorted by patient and time
+def load_series(patient_ids, test_type, start=None, end=None):
+    groups = patients_by_shard(patient_ids)
+
+    def shard_rows(shard):
+        query = db.session.query(LabResult.patient_id, LabResult.taken_at, LabResult.value) \
+            .filter(LabResult.patient_id.in_(groups[shard]), LabResult.test_type == test_type)
+        if start:
+            query = query.filter(LabResult.taken_at >= start)
+        if end:
+            query = query.filter(LabResult.taken_at <= end)
+        return query.order_by(LabResult.patient_id, LabResult.taken_at).all()
+
+    # a patient's rows are all on one shard and already in time order
+    rows = sorted((row for rows in scatter(shard_rows, groups) for row in rows), key=lambda row: row[0])
+
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype='datetime64[s]'), np.empty(0)
+    ids, times, values = zip(*rows)
+    return np.array(ids, dtype=np.int64), np.array(times, dtype='datetime64[s]'), np.array(values, dtype=np.float64)
+
+
+# (patient id, slice) for each patient's run in the sorted id array
+def patient_slices(ids):
+    patients, starts = np.unique(ids, return_index=True)
+    ends = np.append(starts[1:], len(ids))
+    return [(int(patient), slice(start, end)) for patient, start, end in zip(patients, starts, ends)]
+
+
+# min, max, mean and count per bucket of bucket_seconds; times must be sorted
+def downsample(times, values, bucket_seconds):
+    seconds = times.astype(np.int64)
+    buckets = seconds // bucket_seconds
+    keys, starts, counts = np.unique(buckets, return_index=True, return_counts=True)
+    return {
+        'time': (keys * bucket_seconds).astype('datetime64[s]'),
+        'min': np.minimum.reduceat(values, starts),
+        'max': np.maximum.reduceat(values, starts),
+        'avg': np.add.reduceat(values, starts) / counts,
+        'count': counts,
+    }
+
+
+# 'L' below the reference range, 'H' above it, None inside or without a
+# range; also returns how many values are out of range
+def range_flags(values, low, high):
+    below = values < low if low is not None else np.zeros(len(values), dtype=bool)
+    above = values > high if high is not None else np.zeros(len(values), dtype=bool)
+    flags = np.where(below, 'L', np.where(above, 'H', None))
+    return flags, int(np.count_nonzero(below | above))
+
+
+def time_strings(times):
+    return np.char.replace(np.datetime_as_string(times, unit='s'), 'T', ' ').tolist()
+
+
+# least squares slope in units per day, None with fewer than two points
+def slope_per_day(times, values):
+    if len(values) < 2:
+        return None
+    days = (times - times[0]).astype(np.float64) / 86400
+    spread = days - days.mean()
+    denominator = (spread * spread).sum()
+    if denominator == 0:
+        return None
+    return float((spread * (values - values.mean())).sum() / denominator)
+
+
+# columnar trend of test_type for each patient: raw points with their flags,
+# or min/max/avg buckets when bucket_seconds is given, plus a summary
+def trends(patient_ids, test_type, start=None, end=None, bucket_seconds=None):
+    ids, times, values = load_series(patient_ids, test_type, start, end)
+    reference = db.session.get(ReferenceRange, test_type)
+    low, high = (reference.low, reference.high) if reference else (None, None)
+
+    result = {}
+    for patient_id, rows in patient_slices(ids):
+        patient_times, patient_values = times[rows], values[rows]
+        flags, out_of_range = range_flags(patient_values, low, high)
+
+        if bucket_seconds:
+            buckets = downsample(patient_times, patient_values, bucket_seconds)
+            series = {
+                'time': time_strings(buckets['time']),
+                'min': buckets['min'].tolist(),
+                'max': buckets['max'].tolist(),
+                'avg': buckets['avg'].tolist(),
+                'count': buckets['count'].tolist(),
+            }
+        else:
+            series = {
+                'time': time_strings(patient_times),
+                'value': patient_values.tolist(),
+                'flag': flags.tolist(),
+            }
+
+        series['summary'] = {
+            'count': len(patient_values),
+            'last': float(patient_values[-1]),
+            'last_flag': flags[-1],
+            'min': float(patient_values.min()),
+            'max': float(patient_values.max()),
+            'avg': float(patient_values.mean()),
+            'out_of_range': out_of_range,
+            'slope_per_day': slope_per_day(patient_times, patient_values),
+        }
+        result[patient_id] = series
+
+    return {'test_type': test_type, 'reference_range': {'low': low, 'high': high}, 'patients': result}
+
+
+event.listen(PatientTest, 'after_insert', patient_test_inserted)
+event.listen(PatientTest, 'after_update', patient_test_updated)
+event.listen(PatientTest, 'after_delete', patient_test_deleted)
@@ -0,0 +1,157 @@
+import math
+import sqlite3
+import threading
+import time
+from flask import current_app, g, jsonify, request
+
+
+# route class of the current request, from its blueprint
+def route_class():
+    return current_app.config['ROUTE_CLASSES'].get(request.blueprint, 'standard')
+
+
+# refill a bucket holding tokens at updated up to now and take one token;
+# returns the tokens left and the seconds to wait (0 when a token was taken)
+def take_token(tokens, updated, now, rate, burst):
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) / rate
+
+
+# token buckets held by this worker process
+class LocalBuckets(object):
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (burst, now))
+            tokens, wait = take_token(tokens, updated, now, rate, burst)
+            self.buckets[key] = (tokens, now)
+        return wait
+
+
+# token buckets in a small sqlite file of their own, so every worker on the
+# host draws from the same buckets without touching the hospital database
+class SQLiteBuckets(object):
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def connection(self):
+        # one connection per thread, opened after the fork
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS token_bucket '
+                               '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+            self.local.connection = connection
+        return connection
+
+    def take(self, key, rate, burst):
+        connection = self.connection()
+        # wall clock time, since monotonic clocks are not shared between processes
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT tokens, updated FROM token_bucket WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens, wait = take_token(tokens, updated, now, rate, burst)
+            connection.execute('INSERT OR REPLACE INTO token_bucket (key, tokens, updated) VALUES (?, ?, ?)', (key, tokens, now))
+            connection.execute('COMMIT')
+        except:
+            connection.execute('ROLLBACK')
+            raise
+        return wait
+
+
+# load shedding for this worker: requests in flight stand in for the queue
+# depth, and a moving average of response time for latency. Above the soft
+# limits only clinical requests are admitted, and they keep the headroom up
+# to a hard limit of their own
+class AdmissionControl(object):
+    def __init__(self, app):
+        self.max_in_flight = app.config['SHED_MAX_IN_FLIGHT']
+        self.clinical_max_in_flight = app.config['SHED_CLINICAL_MAX_IN_FLIGHT']
+        self.latency_target = app.config['SHED_LATENCY_TARGET']
+        self.in_flight = 0
+        self.latency = 0.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def current_latency(self, now):
+        # halve every second without completions, so a worker that sheds
+        # everything does not stay stuck on its last slow average
+        return self.latency * 0.5 ** (now - self.updated)
+
+    def admit(self, route_class):
+        now = time.monotonic()
+        with self.lock:
+            if route_class == 'clinical':
+                admitted = self.in_flight < self.clinical_max_in_flight
+            else:
+                admitted = self.in_flight < self.max_in_flight and self.current_latency(now) < self.latency_target
+            if admitted:
+                self.in_flight += 1
+            return admitted
+
+    def release(self, route_class, elapsed):
+        now = time.monotonic()
+        with self.lock:
+            self.in_flight -= 1
+            # exports and reports are slow by design and say nothing about load
+            if route_class != 'bulk':
+                latency = self.current_latency(now)
+                self.latency = latency + (elapsed - latency) * 0.1
+                self.updated = now
+
+
+def limited(status, message, retry_after):
+    response = jsonify({'message': message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, int(math.ceil(retry_after))))
+    return response
+
+
+# called by token_required once the token is decoded: each identity gets a
+# bucket per route class
+def check_rate_limit(identity):
+    name = route_class()
+    if name not in current_app.config['RATE_LIMITS']:
+        return None
+
+    rate, burst = current_app.config['RATE_LIMITS'][name]
+    wait = current_app.extensions['rate_limits'].take('%s:%s' % (identity, name), rate, burst)
+    if wait:
+        return limited(429, 'Too many requests', wait)
+    return None
+
+
+def admit_request():
+    name = route_class()
+    # long polls and streams are idle most of their life; they are not load
+    if name == 'stream':
+        return None
+
+    if not current_app.extensions['admission_control'].admit(name):
+        return limited(503, 'Server is busy, try again shortly', current_app.config['SHED_RETRY_AFTER'])
+    g.admitted = (name, time.monotonic())
+    return None
+
+def release_request(exception=None):
+    admitted = g.pop('admitted', None)
+    if admitted is not None:
+        name, admitted_at = admitted
+        current_app.extensions['admission_control'].release(name, time.monotonic() - admitted_at)
+
+
+def init_app(app):
+    path = app.config['RATE_LIMIT_STORE']
+    app.extensions['rate_limits'] = SQLiteBuckets(path) if path else LocalBuckets()
+    app.extensions['admission_control'] = AdmissionControl(app)
+    app.before_request(admit_request)
+    app.teardown_request(release_request)
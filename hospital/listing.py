@@ -0,0 +1,292 @@
+import datetime
+import operator
+from flask import abort, current_app, jsonify, request
+from sqlalchemy import String, and_, or_
+from sqlalchemy.orm.attributes import InstrumentedAttribute
+
+from hospital.extensions import db
+from hospital.sharding import is_sharded, scatter, sharding_enabled
+
+
+# query string helpers shared by the list endpoints
+
+DATETIME_ARG_FORMATS = ('%Y-%m-%d', '%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S')
+
+# a 'YYYY-MM-DD', 'YYYY-MM-DD HH:MM' or 'YYYY-MM-DD HH:MM:SS' argument, or
+# None when absent; a bad value, or a missing required one, is a 400
+def parse_datetime_arg(name, required=False):
+    value = request.args.get(name)
+    if not value:
+        if required:
+            bad_request('%s is required' % name)
+        return None
+    for format in DATETIME_ARG_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, format)
+        except ValueError:
+            pass
+    bad_request('%s must be a date (YYYY-MM-DD) or a date and time (YYYY-MM-DD HH:MM:SS)' % name)
+
+
+def plain(value):
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, datetime.date):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, datetime.time):
+        return value.strftime('%H:%M:%S')
+    return value
+
+def date_part(value):
+    return value.strftime('%Y-%m-%d')
+
+def time_part(value):
+    return value.strftime('%H:%M:%S')
+
+
+def bad_request(message, **extra):
+    response = jsonify(dict(extra, message=message))
+    response.status_code = 400
+    abort(response)
+
+
+# the fields named in ?fields=a,b,c (all of them when absent); fields maps the
+# public name to a column, or to (column, format) when the value is reshaped
+def requested_fields(fields):
+    value = request.args.get('fields')
+    if not value:
+        return list(fields)
+
+    names = []
+    for name in value.split(','):
+        name = name.strip()
+        if name and name not in names:
+            names.append(name)
+
+    unknown = [name for name in names if name not in fields]
+    if unknown or not names:
+        bad_request('Unknown fields', unknown=unknown, fields=list(fields))
+    return names
+
+
+# the columns to select for the requested fields and a function turning a
+# result row into the response dict; several fields may share one column,
+# and only these columns are read, so unrequested ones are never loaded.
+# requested=False projects every field, whatever ?fields= says
+def projection(fields, requested=True):
+    columns = []
+    positions = {}
+    getters = []
+    for name in requested_fields(fields) if requested else fields:
+        column, format = fields[name] if isinstance(fields[name], tuple) else (fields[name], plain)
+        # columns overload ==, so they are matched by identity
+        if id(column) not in positions:
+            positions[id(column)] = len(columns)
+            columns.append(column)
+        getters.append((name, positions[id(column)], format))
+
+    def serialize(row):
+        return {name: None if row[index] is None else format(row[index]) for name, index, format in getters}
+
+    return columns, serialize
+
+
+# ?filter=field:op:value (repeatable) and ?sort=-field,field; the fields are
+# the public names of the endpoint's field map, compiled to plain column
+# comparisons so the database can answer them from its indexes
+
+ONE_DAY = datetime.timedelta(days=1)
+
+OPERATORS = {
+    'eq': operator.eq,
+    'ne': operator.ne,
+    'lt': operator.lt,
+    'lte': operator.le,
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'in': lambda column, values: column.in_(values),
+    # a range rather than LIKE, so an ordinary index on the column serves it
+    'prefix': lambda column, value: and_(column >= value, column < value + '\U0010ffff'),
+}
+
+# a bare date compared with a datetime column stands for the whole day
+DAY_OPERATORS = {
+    'eq': lambda column, day: and_(column >= day, column < day + ONE_DAY),
+    'ne': lambda column, day: or_(column < day, column >= day + ONE_DAY),
+    'lt': lambda column, day: column < day,
+    'lte': lambda column, day: column < day + ONE_DAY,
+    'gt': lambda column, day: column >= day + ONE_DAY,
+    'gte': lambda column, day: column >= day,
+}
+
+
+# the table column behind a field map entry, or None for computed fields
+def field_column(field):
+    attribute = field[0] if isinstance(field, tuple) else field
+    if isinstance(attribute, InstrumentedAttribute) and hasattr(attribute.property, 'columns'):
+        return attribute.property.columns[0]
+    return None
+
+# whether an index leads with the column; partial indexes only serve queries
+# that repeat their condition, so they do not count
+def is_indexed(column):
+    if column.primary_key or column.index or column.unique:
+        return True
+    return any(next(iter(index.columns)) is column and not index.dialect_kwargs.get('sqlite_where')
+               for index in column.table.indexes)
+
+
+def parse_value(column, value):
+    python_type = column.type.python_type
+    if python_type is datetime.datetime:
+        return datetime.datetime.strptime(value, '%Y-%m-%d %H:%M:%S' if ' ' in value else '%Y-%m-%d')
+    if python_type is datetime.date:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    if python_type is datetime.time:
+        return datetime.datetime.strptime(value, '%H:%M:%S' if value.count(':') == 2 else '%H:%M').time()
+    if python_type is bool:
+        return value.lower() in ('1', 'true', 'yes')
+    return python_type(value)
+
+
+# operators that only apply to some column types
+OPERATOR_TYPES = {
+    'prefix': String,
+}
+
+def parse_filter(fields, value):
+    name, op, argument = (value.split(':', 2) + ['', ''])[:3]
+    column = field_column(fields[name]) if name in fields else None
+    if column is None:
+        bad_request('Cannot filter on %s' % name, filterable=[name for name in fields if field_column(fields[name]) is not None])
+    if op not in OPERATORS:
+        bad_request('Unknown filter operator %s' % op, operators=sorted(OPERATORS))
+    if op in OPERATOR_TYPES and not isinstance(column.type, OPERATOR_TYPES[op]):
+        bad_request('Cannot filter on %s with %s' % (name, op),
+                    filterable=[name for name in fields if is_filterable(fields[name], op)])
+
+    try:
+        if op == 'in':
+            return column.key, op, [parse_value(column, item) for item in argument.split('|')]
+        if op in DAY_OPERATORS and column.type.python_type is datetime.datetime and ' ' not in argument:
+            return column.key, 'day_' + op, parse_value(column, argument)
+        return column.key, op, parse_value(column, argument)
+    except (NotImplementedError, TypeError, ValueError):
+        bad_request('Invalid value for %s: %s' % (name, argument))
+
+def is_filterable(field, op):
+    column = field_column(field)
+    return column is not None and (op not in OPERATOR_TYPES or isinstance(column.type, OPERATOR_TYPES[op]))
+
+
+def parse_sort(fields, value):
+    descending = value.startswith('-')
+    name = value.lstrip('-')
+    # sorting on an unindexed column means sorting the whole table
+    if name not in fields or not is_sortable(fields[name]):
+        bad_request('Cannot sort on %s, it is not indexed' % name,
+                    sortable=[name for name in fields if is_sortable(fields[name])])
+    return field_column(fields[name]).key, descending
+
+def is_sortable(field):
+    column = field_column(field)
+    return column is not None and is_indexed(column)
+
+
+# the ?filter= and ?sort= arguments checked against fields, as
+# (attribute, op, value) criteria and (attribute, descending) sort keys; they
+# name attributes rather than columns, so they apply to archive tables too
+def list_spec(fields):
+    criteria = [parse_filter(fields, value) for value in request.args.getlist('filter')]
+    order = [parse_sort(fields, name.strip()) for name in request.args.get('sort', '').split(',') if name.strip()]
+    return criteria, order
+
+
+def conditions(source, criteria):
+    result = []
+    for key, op, value in criteria:
+        column = getattr(source, key)
+        if op.startswith('day_'):
+            result.append(DAY_OPERATORS[op[4:]](column, value))
+        else:
+            result.append(OPERATORS[op](column, value))
+    return result
+
+# id last, so pages are stable when the sort keys tie
+def ordering(source, order):
+    return [getattr(source, key).desc() if descending else getattr(source, key) for key, descending in order] + [source.id]
+
+
+# (page, per_page) from ?page= and ?per_page=, or default (the first
+# LIST_PER_PAGE rows unless given) when neither is given. ?per_page=all
+# returns None, the whole list, where allow_all and LIST_UNPAGED permit it
+def page_window(default=None, allow_all=True):
+    args = request.args
+    if 'page' not in args and 'per_page' not in args:
+        return default or (1, current_app.config['LIST_PER_PAGE'])
+
+    max_per_page = current_app.config['LIST_MAX_PER_PAGE']
+    if args.get('per_page') == 'all':
+        if not (allow_all and current_app.config['LIST_UNPAGED']) or 'page' in args:
+            bad_request('per_page=all is not allowed here; page through the list with per_page at most %d' % max_per_page)
+        return None
+
+    try:
+        page = int(args.get('page', 1))
+        per_page = int(args.get('per_page', current_app.config['LIST_PER_PAGE']))
+    except ValueError:
+        page = per_page = 0
+    if page < 1 or not 0 < per_page <= max_per_page:
+        bad_request('page must be a positive whole number and per_page one between 1 and %d' % max_per_page)
+    return page, per_page
+
+# one extra row is fetched to tell whether another page follows, instead of a count
+def page_result(rows, window):
+    if window is None:
+        return rows, {}
+    page, per_page = window
+    return rows[:per_page], {'page': page, 'per_page': per_page, 'has_more': len(rows) > per_page}
+
+def limit_page(query, window):
+    if window is None:
+        return query
+    page, per_page = window
+    return query.limit(per_page + 1).offset((page - 1) * per_page)
+
+
+# filter, sort and page a query over model; returns the rows and the page
+# details to merge into the response; default_window pages a request that
+# does not ask for a page
+def list_rows(query, model, fields, default_window=None):
+    criteria, order = list_spec(fields)
+    window = page_window(default_window)
+    query = query.filter(*conditions(model, criteria)).order_by(*ordering(model, order))
+    if not (sharding_enabled() and is_sharded(model)):
+        return page_result(limit_page(query, window).all(), window)
+
+    # the order values ride along after the projected columns for the merge
+    query = query.add_columns(*[getattr(model, key).label('sort_' + key) for key, descending in order + [('id', False)]])
+    results = scatter(lambda shard: limit_page(query.with_session(db.session()), shard_window(window)).all())
+    return page_result(merge_rows(results, order, window, 'sort_'), window)
+
+
+# Sharded lists
+# every shard returns the first page * per_page + 1 rows in list order; the
+# merge sorts them on the order values (selected as prefix + key) and cuts
+# the requested page from the result
+def shard_window(window):
+    if window is None:
+        return None
+    page, per_page = window
+    return 1, page * per_page
+
+def merge_rows(results, order, window, prefix=''):
+    rows = [row for result in results for row in result]
+    # stable sorts from the last key to the first; NULLs first, as SQLite has them
+    for key, descending in reversed(list(order) + [('id', False)]):
+        rows.sort(key=lambda row: (row._mapping[prefix + key] is not None, row._mapping[prefix + key]),
+                  reverse=descending)
+    if window is None:
+        return rows
+    page, per_page = window
+    return rows[(page - 1) * per_page:page * per_page + 1]
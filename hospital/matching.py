@@ -0,0 +1,247 @@
+import difflib
+import itertools
+import re
+from flask import current_app
+from sqlalchemy import event
+
+from hospital.extensions import db
+from hospital.models import Patient, PatientMatchKey
+from hospital.sharding import scatter
+
+SOUNDEX_CODES = dict(itertools.chain.from_iterable(
+    ((letter, code) for letter in letters)
+    for letters, code in (('bfpv', '1'), ('cgjkqsxz', '2'), ('dt', '3'), ('l', '4'), ('mn', '5'), ('r', '6'))))
+
+
+# American soundex: first letter and three digits, '' for names without letters
+def soundex(name):
+    letters = re.sub('[^a-z]', '', (name or '').lower())
+    if not letters:
+        return ''
+
+    code = letters[0].upper()
+    previous = SOUNDEX_CODES.get(letters[0])
+    for letter in letters[1:]:
+        digit = SOUNDEX_CODES.get(letter)
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # h and w do not separate letters with the same code, vowels do
+        if letter not in 'hw':
+            previous = digit
+    return code.ljust(4, '0')
+
+
+def normalize_phone(phone):
+    digits = re.sub(r'\D', '', phone or '')
+    # the last ten digits, so country prefixes do not matter
+    return digits[-10:] if len(digits) >= 7 else ''
+
+def normalize_email(email):
+    email = (email or '').strip().lower()
+    if '@' not in email:
+        return ''
+    local, domain = email.rsplit('@', 1)
+    return local.split('+', 1)[0] + '@' + domain
+
+
+# blocking keys: records can only be duplicates when they share one, so a
+# lookup touches a few small blocks instead of the whole table
+def match_keys(first_name, last_name, date_of_birth, contact_number, email):
+    first, last = soundex(first_name), soundex(last_name)
+    dob = date_of_birth.strftime('%Y-%m-%d') if date_of_birth else ''
+    keys = set()
+    if last and dob:
+        keys.add('last-dob:%s:%s' % (last, dob))
+    if first and dob:
+        # catches a changed last name
+        keys.add('first-dob:%s:%s' % (first, dob))
+    if first and last and date_of_birth:
+        # catches a mistyped date of birth
+        keys.add('name-year:%s:%s:%d' % (first, last, date_of_birth.year))
+    if normalize_phone(contact_number):
+        keys.add('phone:' + normalize_phone(contact_number))
+    if normalize_email(email):
+        keys.add('email:' + normalize_email(email))
+    return keys
+
+
+def similarity(a, b):
+    a, b = (a or '').strip().lower(), (b or '').strip().lower()
+    if not a or not b:
+        return 0.0
+    return difflib.SequenceMatcher(None, a, b).ratio()
+
+def date_similarity(a, b):
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    # day and month swapped, or one field mistyped
+    if a.year == b.year and a.month == b.day and a.day == b.month:
+        return 0.8
+    return 0.5 if sum((a.year == b.year, a.month == b.month, a.day == b.day)) == 2 else 0.0
+
+
+# weighted agreement of two records, between 0 and 1
+MATCH_WEIGHTS = {
+    'last_name': 0.25,
+    'first_name': 0.2,
+    'date_of_birth': 0.25,
+    'contact_number': 0.15,
+    'email': 0.15,
+}
+
+def match_score(a, b):
+    scores = {
+        'last_name': similarity(a['last_name'], b['last_name']),
+        'first_name': similarity(a['first_name'], b['first_name']),
+        'date_of_birth': date_similarity(a['date_of_birth'], b['date_of_birth']),
+        'contact_number': 1.0 if normalize_phone(a['contact_number']) and
+                          normalize_phone(a['contact_number']) == normalize_phone(b['contact_number']) else 0.0,
+        'email': 1.0 if normalize_email(a['email']) and normalize_email(a['email']) == normalize_email(b['email']) else 0.0,
+    }
+    return round(sum(MATCH_WEIGHTS[name] * score for name, score in scores.items()), 3)
+
+
+MATCH_COLUMNS = (Patient.id, Patient.first_name, Patient.last_name, Patient.date_of_birth,
+                 Patient.contact_number, Patient.email)
+
+def patient_record(row):
+    return {column.key: value for column, value in zip(MATCH_COLUMNS, row)}
+
+def record_keys(record):
+    return match_keys(record['first_name'], record['last_name'], record['date_of_birth'],
+                      record['contact_number'], record['email'])
+
+
+# existing patients likely to be the same person as record, best first, as
+# (score, patient) pairs scoring at least MATCH_MIN_SCORE
+def find_duplicates(record, exclude_id=None):
+    keys = record_keys(record)
+    if not keys:
+        return []
+
+    limit = current_app.config['MATCH_MAX_CANDIDATES']
+
+    # a duplicate can sit on any shard
+    def candidates(shard):
+        candidate_ids = [patient_id for patient_id, in db.session.query(PatientMatchKey.patient_id)
+                         .filter(PatientMatchKey.key.in_(keys)).distinct().limit(limit)]
+        return db.session.query(*MATCH_COLUMNS).filter(Patient.id.in_(candidate_ids)).all()
+
+    rows = [row for rows in scatter(candidates) for row in rows]
+
+    matches = []
+    for row in rows:
+        candidate = patient_record(row)
+        if candidate['id'] == exclude_id:
+            continue
+        score = match_score(record, candidate)
+        if score >= current_app.config['MATCH_MIN_SCORE']:
+            matches.append((score, candidate))
+    matches.sort(key=lambda match: -match[0])
+    return matches
+
+
+# keep the match keys in step with the patient table
+def store_match_keys(connection, target):
+    keys = match_keys(target.first_name, target.last_name, target.date_of_birth, target.contact_number, target.email)
+    if keys:
+        connection.execute(PatientMatchKey.__table__.insert(), [{'patient_id': target.id, 'key': key} for key in keys])
+
+def drop_match_keys(connection, target):
+    table = PatientMatchKey.__table__
+    connection.execute(table.delete().where(table.c.patient_id == target.id))
+
+def patient_inserted(mapper, connection, target):
+    store_match_keys(connection, target)
+
+def patient_updated(mapper, connection, target):
+    drop_match_keys(connection, target)
+    store_match_keys(connection, target)
+
+def patient_deleted(mapper, connection, target):
+    drop_match_keys(connection, target)
+
+
+def rebuild_match_keys(batch_size=1000):
+    scatter(lambda shard: rebuild_shard_match_keys(batch_size))
+
+def rebuild_shard_match_keys(batch_size):
+    table = PatientMatchKey.__table__
+    db.session.execute(table.delete())
+    rows = []
+    for row in db.session.query(*MATCH_COLUMNS).yield_per(batch_size):
+        record = patient_record(row)
+        rows.extend({'patient_id': record['id'], 'key': key} for key in record_keys(record))
+        if len(rows) >= batch_size:
+            db.session.execute(table.insert(), rows)
+            rows = []
+    if rows:
+        db.session.execute(table.insert(), rows)
+    db.session.commit()
+
+
+# union-find over patient ids, with path halving
+class DisjointSet(object):
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        self.parent.setdefault(item, item)
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+
+# clusters of likely duplicates across the whole table. Only records sharing
+# a blocking key are compared, and blocks larger than MATCH_MAX_BLOCK (a
+# shared family phone, say) are skipped, so the work grows with the number of
+# records rather than with its square. Returns [(ids, best pair score)]
+def dedupe_patients():
+    min_score = current_app.config['MATCH_MIN_SCORE']
+    max_block = current_app.config['MATCH_MAX_BLOCK']
+
+    # blocks span shards, so the keys of every shard are merged before grouping
+    results = scatter(lambda shard: (db.session.query(*MATCH_COLUMNS).all(),
+                                     db.session.query(PatientMatchKey.key, PatientMatchKey.patient_id).all()))
+    records = {row[0]: patient_record(row) for rows, shard_keys in results for row in rows}
+    keys = sorted(key for rows, shard_keys in results for key in shard_keys)
+
+    clusters = DisjointSet()
+    scores = {}
+    compared = set()
+    for key, block in itertools.groupby(keys, key=lambda row: row[0]):
+        ids = sorted(patient_id for key, patient_id in block if patient_id in records)
+        if len(ids) < 2 or len(ids) > max_block:
+            continue
+        for a, b in itertools.combinations(ids, 2):
+            # the same pair often shares several keys
+            if (a, b) in compared:
+                continue
+            compared.add((a, b))
+            score = match_score(records[a], records[b])
+            if score >= min_score:
+                clusters.union(a, b)
+                scores[a, b] = score
+
+    members = {}
+    best = {}
+    for (a, b), score in scores.items():
+        root = clusters.find(a)
+        members.setdefault(root, set()).update((a, b))
+        best[root] = max(best.get(root, 0), score)
+    return sorted(((sorted(ids), best[root]) for root, ids in members.items()), key=lambda group: -group[1])
+
+
+event.listen(Patient, 'after_insert', patient_inserted)
+event.listen(Patient, 'after_update', patient_updated)
+event.listen(Patient, 'after_delete', patient_deleted)
@@ -0,0 +1,417 @@
+from hospital.extensions import db
+
+# User Model
+class User(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(50), unique=True, nullable=False)
+    password = db.Column(db.String(256), nullable=False)
+    role_id = db.Column(db.Integer, db.ForeignKey('role.id'), nullable=False)
+    role = db.relationship('Role', backref='users')
+    # the doctor this user signs in as, if any
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctor.id'), nullable=True)
+
+    def __repr__(self):
+        return f'<User {self.username}>'
+
+# Role Model
+class Role(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    # comma separated permission names, or '*' for all of them
+    permissions = db.Column(db.Text, nullable=True)
+
+    def __repr__(self):
+        return f'<Role {self.name}>'
+
+# Patient Model
+class Patient(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    first_name = db.Column(db.String(50), nullable=False)
+    last_name = db.Column(db.String(50), nullable=False, index=True)
+    date_of_birth = db.Column(db.Date, nullable=False, index=True)
+    gender = db.Column(db.String(10), nullable=False)
+    contact_number = db.Column(db.String(20), nullable=False)
+    email = db.Column(db.String(50), nullable=False)
+    address = db.Column(db.String(100), nullable=False)
+
+    def __repr__(self):
+        return f'<Patient {self.first_name} {self.last_name}>'
+
+# Patient Match Key Model
+# blocking keys for duplicate detection, maintained by hospital.matching
+class PatientMatchKey(db.Model):
+    __table_args__ = (
+        # covers the lookup, so candidates are found without reading the table
+        db.Index('ix_patient_match_key', 'key', 'patient_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False, index=True)
+    key = db.Column(db.String(100), nullable=False)
+
+    def __repr__(self):
+        return f'<PatientMatchKey {self.patient_id} {self.key}>'
+
+# Patient Directory Model
+# the shard each patient's rows live on, see hospital.sharding
+class PatientDirectory(db.Model):
+    patient_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    shard = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<PatientDirectory {self.patient_id} {self.shard}>'
+
+# Appointment Model
+class Appointment(db.Model):
+    __table_args__ = (
+        # one live appointment per doctor per slot; cancelling frees the slot
+        db.Index('ix_appointment_doctor_slot', 'doctor_id', 'date_time', unique=True,
+                 sqlite_where=db.text("status != 'Cancelled'"),
+                 postgresql_where=db.text("status != 'Cancelled'")),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False, index=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctor.id'), nullable=False, index=True)
+    date_time = db.Column(db.DateTime, nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default='Confirmed')
+
+    def __repr__(self):
+        return f'<Appointment {self.id}>'
+
+# Admissions Model
+class Admission(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False, index=True)
+    registration_date_time = db.Column(db.DateTime, nullable=False, index=True)
+    discharge_date_time = db.Column(db.DateTime, nullable=True, index=True)
+    status = db.Column(db.String(20), nullable=False, default='Completed')
+
+    def __repr__(self):
+        return f'<Admission {self.id}>'
+
+# Patient Test Model
+class PatientTest(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False, index=True)
+    test_type = db.Column(db.String(50), nullable=False)
+    test_date_time = db.Column(db.DateTime, nullable=False, index=True)
+    test_result = db.Column(db.String(50), nullable=False)
+
+    def __repr__(self):
+        return f'<PatientTest {self.id}>'
+
+# Patient History Log Model
+class PatientHistory(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False, index=True)
+    diagnosis = db.Column(db.String(255), nullable=False)
+    prescription = db.Column(db.String(255), nullable=True)
+    treatment_date_time = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<PatientHistory {self.id}>'
+
+# Lab Result Model
+# numeric results, one row per measurement, read back as time series
+class LabResult(db.Model):
+    __table_args__ = (
+        db.Index('ix_lab_result_series', 'patient_id', 'test_type', 'taken_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
+    test_type = db.Column(db.String(50), nullable=False)
+    taken_at = db.Column(db.DateTime, nullable=False)
+    value = db.Column(db.Float, nullable=False)
+    unit = db.Column(db.String(20), nullable=True)
+    # set when the value was parsed from a patient test result
+    patient_test_id = db.Column(db.Integer, nullable=True, index=True)
+
+    def __repr__(self):
+        return f'<LabResult {self.patient_id} {self.test_type} {self.taken_at}>'
+
+# Reference Range Model
+class ReferenceRange(db.Model):
+    test_type = db.Column(db.String(50), primary_key=True)
+    low = db.Column(db.Float, nullable=True)
+    high = db.Column(db.Float, nullable=True)
+    unit = db.Column(db.String(20), nullable=True)
+
+    def __repr__(self):
+        return f'<ReferenceRange {self.test_type} {self.low}-{self.high}>'
+
+# Operation Theatre Model
+class OperationTheater(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)
+    theater_name = db.Column(db.String(50), nullable=False)
+    location = db.Column(db.String(50), nullable=False)
+    availability = db.Column(db.String(50), nullable=False)
+                     
+    def __repr__(self):
+        return f'<OperationTheater {self.name}>'
+
+# Doctor Model
+class Doctor(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    first_name = db.Column(db.String(50), nullable=False)
+    last_name = db.Column(db.String(50), nullable=False, index=True)
+    specialization = db.Column(db.String(50), nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<Doctor {self.first_name} {self.last_name}>'
+    
+# Doctor Availability Model
+class DoctorAvailability(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctor.id'), nullable=False, index=True)
+    day_of_week = db.Column(db.Integer, nullable=False)
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time, nullable=False)
+
+    def __repr__(self):
+        return f'<DoctorAvailability {self.id}>'
+    
+# Hospital Staff Model
+class HospitalStaff(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    first_name = db.Column(db.String(50), nullable=False)
+    last_name = db.Column(db.String(50), nullable=False, index=True)
+    job_title = db.Column(db.String(50), nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<HospitalStaff {self.first_name} {self.last_name}>'
+    
+
+
+class OperationTheatreBooking(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id', ondelete='CASCADE'))
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctor.id', ondelete='CASCADE'))
+    operation_type = db.Column(db.String(255))
+    date = db.Column(db.Date, index=True)
+    start_time = db.Column(db.Time)
+    end_time = db.Column(db.Time)
+    notes = db.Column(db.Text)
+
+    def __str__(self):
+        return f"OperationTheatreBooking {self.id}"
+
+class Duty(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    staff_id = db.Column(db.Integer, db.ForeignKey('hospital_staff.id', ondelete='CASCADE'))
+    date = db.Column(db.Date)
+
+    def __str__(self):
+        return f"Duty {self.id}"
+
+class StaffAttendance(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    staff_id = db.Column(db.Integer, db.ForeignKey('hospital_staff.id', ondelete='CASCADE'))
+    staff = db.relationship('HospitalStaff', backref='attendances')
+    date = db.Column(db.Date)
+    status = db.Column(db.String(255))# (choices: "Present", "Absent")
+    
+    def __str__(self):
+        return f"StaffAttendance {self.id}"
+
+class Payment(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id', ondelete='CASCADE'))
+    amount = db.Column(db.Float)
+    payment_type = db.Column(db.String(50))
+    payment_date = db.Column(db.Date)
+
+    def __str__(self):
+        return f"Payment {self.id}"
+
+
+class PatientTestRecord(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id', ondelete='CASCADE'))
+    test_name = db.Column(db.String(255))
+    test_date = db.Column(db.String(255))
+    test_result = db.Column(db.String(255))
+    
+    def __str__(self):
+        return f"PatientTestRecord {self.id}"
+
+
+class StaffAvailability(db.Model):
+    __tablename__ = 'staff_availability'
+    id = db.Column(db.Integer, primary_key=True)
+    staff_id = db.Column(db.Integer, db.ForeignKey('hospital_staff.id'), nullable=False)
+    staff = db.relationship('HospitalStaff', backref='availabilities')
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<StaffAvailability staff_id={self.staff_id}, start_time={self.start_time}, end_time={self.end_time}>'
+
+
+# Archive Models
+# closed records older than the archive horizon are moved here by hospital.archive
+class AppointmentArchive(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, nullable=False, index=True)
+    doctor_id = db.Column(db.Integer, nullable=False, index=True)
+    date_time = db.Column(db.DateTime, nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<AppointmentArchive {self.id}>'
+
+class AdmissionArchive(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, nullable=False, index=True)
+    registration_date_time = db.Column(db.DateTime, nullable=False, index=True)
+    discharge_date_time = db.Column(db.DateTime, nullable=True)
+    status = db.Column(db.String(20), nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<AdmissionArchive {self.id}>'
+
+class PatientTestArchive(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, nullable=False, index=True)
+    test_type = db.Column(db.String(50), nullable=False)
+    test_date_time = db.Column(db.DateTime, nullable=False, index=True)
+    test_result = db.Column(db.String(50), nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<PatientTestArchive {self.id}>'
+
+# Version Models
+# every state a patient or history entry has had, valid over [valid_from,
+# valid_to) in UTC; valid_to is NULL for the current state and a deleted row
+# keeps its versions. Kept by hospital.versions. The primary key on (id,
+# valid_from) finds the version in force at any moment with one index seek
+class PatientVersion(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    valid_from = db.Column(db.DateTime, primary_key=True)
+    valid_to = db.Column(db.DateTime, nullable=True)
+    first_name = db.Column(db.String(50), nullable=False)
+    last_name = db.Column(db.String(50), nullable=False)
+    date_of_birth = db.Column(db.Date, nullable=False)
+    gender = db.Column(db.String(10), nullable=False)
+    contact_number = db.Column(db.String(20), nullable=False)
+    email = db.Column(db.String(50), nullable=False)
+    address = db.Column(db.String(100), nullable=False)
+
+    def __repr__(self):
+        return f'<PatientVersion {self.id} {self.valid_from}>'
+
+class PatientHistoryVersion(db.Model):
+    __table_args__ = (
+        # a patient's entries as of a moment, without reading other patients'
+        db.Index('ix_patient_history_version_patient', 'patient_id', 'valid_from'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    valid_from = db.Column(db.DateTime, primary_key=True)
+    valid_to = db.Column(db.DateTime, nullable=True)
+    patient_id = db.Column(db.Integer, nullable=False)
+    diagnosis = db.Column(db.String(255), nullable=False)
+    prescription = db.Column(db.String(255), nullable=True)
+    treatment_date_time = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<PatientHistoryVersion {self.id} {self.valid_from}>'
+
+# Archive State Model
+class ArchiveState(db.Model):
+    table_name = db.Column(db.String(50), primary_key=True)
+    # every archived row is older than this
+    horizon = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<ArchiveState {self.table_name} {self.horizon}>'
+
+
+# Census Snapshot Model
+class CensusSnapshot(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    # inpatients in the hospital at midnight at the start of the day
+    occupancy = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<CensusSnapshot {self.day} {self.occupancy}>'
+
+
+# Doctor Day Bookings Model
+# one character per appointment slot of the day, '1' where a live appointment
+# starts; kept up to date by hospital.utilization
+class DoctorDayBookings(db.Model):
+    doctor_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    day = db.Column(db.Date, primary_key=True)
+    slots = db.Column(db.String(1440), nullable=False)
+
+    def __repr__(self):
+        return f'<DoctorDayBookings {self.doctor_id} {self.day}>'
+
+
+# Patient Summary Model
+# a patient's own columns with their next appointment, latest admission and
+# last test, so the patient list is read from one table; kept up to date by
+# hospital.summaries on the patient's shard
+class PatientSummary(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    first_name = db.Column(db.String(50), nullable=False)
+    last_name = db.Column(db.String(50), nullable=False, index=True)
+    date_of_birth = db.Column(db.Date, nullable=False, index=True)
+    gender = db.Column(db.String(10), nullable=False)
+    contact_number = db.Column(db.String(20), nullable=False)
+    email = db.Column(db.String(50), nullable=False)
+    address = db.Column(db.String(100), nullable=False)
+    next_appointment_id = db.Column(db.Integer, nullable=True)
+    next_appointment_date_time = db.Column(db.DateTime, nullable=True, index=True)
+    next_appointment_doctor_id = db.Column(db.Integer, nullable=True)
+    admission_id = db.Column(db.Integer, nullable=True)
+    admission_date_time = db.Column(db.DateTime, nullable=True)
+    admission_status = db.Column(db.String(20), nullable=True, index=True)
+    last_test_id = db.Column(db.Integer, nullable=True)
+    last_test_date_time = db.Column(db.DateTime, nullable=True, index=True)
+    last_test_type = db.Column(db.String(50), nullable=True)
+    last_test_result = db.Column(db.String(50), nullable=True)
+
+    def __repr__(self):
+        return f'<PatientSummary {self.id}>'
+
+
+# Change Log Model
+class ChangeLog(db.Model):
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    # autoincrement keeps the sequence monotonic, even after rows are deleted
+    seq = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(50), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    operation = db.Column(db.String(10), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<ChangeLog {self.seq}>'
+
+
+# Id Block Model
+# next free id of each sharded table, handed out in blocks
+class IdBlock(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    next_id = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<IdBlock {self.name} {self.next_id}>'
+
+
+# Appointment Slot Model
+# live appointments claim their doctor slot here while appointments are sharded
+class AppointmentSlot(db.Model):
+    doctor_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    date_time = db.Column(db.DateTime, primary_key=True)
+
+    def __repr__(self):
+        return f'<AppointmentSlot {self.doctor_id} {self.date_time}>'
@@ -0,0 +1,79 @@
+import datetime
+import decimal
+import gzip
+from flask import current_app, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+
+# both codecs are optional; without them responses stay plain json / gzip
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MSGPACK_MIMETYPES = ['application/msgpack', 'application/x-msgpack']
+
+
+def msgpack_default(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    raise TypeError('Cannot encode %r' % (value,))
+
+
+def wants_msgpack():
+    # json stays the default for */* and for clients that do not ask
+    best = request.accept_mimetypes.best_match(['application/json'] + MSGPACK_MIMETYPES)
+    return best in MSGPACK_MIMETYPES
+
+
+# every jsonify call goes through response(), so all endpoints negotiate
+class NegotiatingJSONProvider(DefaultJSONProvider):
+    def response(self, *args, **kwargs):
+        if msgpack is not None and has_request_context() and wants_msgpack():
+            obj = self._prepare_response_obj(args, kwargs)
+            response = self._app.response_class(msgpack.packb(obj, default=msgpack_default), mimetype=MSGPACK_MIMETYPES[0])
+            response.vary.add('Accept')
+            return response
+
+        response = super().response(*args, **kwargs)
+        response.vary.add('Accept')
+        return response
+
+
+def compress_response(response):
+    # streams and already encoded bodies are left alone
+    if response.is_streamed or response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    threshold = current_app.config['COMPRESS_MIN_SIZE']
+    if response.content_length is not None and response.content_length < threshold:
+        return response
+
+    encoding = request.accept_encodings.best_match(['br', 'gzip'] if brotli is not None else ['gzip'])
+    if not encoding:
+        return response
+
+    data = response.get_data()
+    if len(data) < threshold:
+        return response
+
+    # fast settings: the win is in bytes on the wire, not the last percent
+    if encoding == 'br':
+        data = brotli.compress(data, quality=4)
+    else:
+        data = gzip.compress(data, compresslevel=6)
+
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_app(app):
+    app.json = NegotiatingJSONProvider(app)
+    app.after_request(compress_response)
@@ -0,0 +1,128 @@
+from functools import wraps
+from flask import current_app, jsonify, request
+import jwt
+
+from hospital.cache import cached_value
+from hospital.extensions import db
+from hospital.limits import check_rate_limit
+from hospital.models import Role, User
+
+# Permission registry
+# every permission a route declares gets its own bit
+PERMISSION_BITS = {}
+
+# permissions for the built-in roles when their row does not store any
+DEFAULT_ROLE_PERMISSIONS = {
+    'admin': '*',
+    'doctor': 'analytics:patient-status,patient-data:read,lab-results:read,changes:read,operation-theatre-bookings:read',
+    'staff': 'duty:read,changes:read',
+}
+
+# role id -> (role name, permission bitset), compiled from the role table
+role_permissions = {}
+# the role rows they were compiled from
+role_rows = None
+
+def permission_bit(name):
+    if name not in PERMISSION_BITS:
+        PERMISSION_BITS[name] = 1 << len(PERMISSION_BITS)
+    return PERMISSION_BITS[name]
+
+def compile_permissions(names):
+    # '*' sets every bit, including permissions registered later
+    if names.strip() == '*':
+        return -1
+
+    bits = 0
+    for name in names.split(','):
+        if name.strip():
+            bits |= permission_bit(name.strip())
+    return bits
+
+# the role rows come from the result cache, so a role written in any worker
+# reaches every worker; bits are numbered per process, so each compiles its
+# own bitsets, once per new set of rows
+def load_role_permissions():
+    global role_permissions, role_rows
+
+    rows = cached_value(('role-permissions',), ('role',), lambda: [
+        tuple(row) for row in db.session.query(Role.id, Role.name, Role.permissions)])
+    if rows is role_rows:
+        return
+
+    compiled = {}
+    for role_id, name, permissions in rows:
+        if permissions is None:
+            permissions = DEFAULT_ROLE_PERMISSIONS.get(name, '')
+        compiled[role_id] = (name, compile_permissions(permissions))
+
+    role_permissions = compiled
+    role_rows = rows
+
+# the user's current (role id, doctor id), or None for a user that no longer
+# exists; read from the result cache rather than the token, so a changed
+# role applies at once instead of when the token expires
+def user_account(user_id):
+    accounts = cached_value(('user-accounts',), ('user',), lambda: {
+        id: (role_id, doctor_id) for id, role_id, doctor_id in db.session.query(User.id, User.role_id, User.doctor_id)})
+    return accounts.get(user_id)
+
+
+class CurrentUser(object):
+    def __init__(self, id, role_id, doctor_id=None):
+        self.id = id
+        self.role_id = role_id
+        self.doctor_id = doctor_id
+        self.role, self.permissions = role_permissions.get(role_id, (None, 0))
+
+    def can(self, name):
+        bit = permission_bit(name)
+        return self.permissions & bit == bit
+
+
+def token_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        # EventSource cannot set headers, so streams pass the token in the query string
+        token = request.headers.get('Authorization') or request.args.get('token')
+
+        if not token:
+            return jsonify({'message': 'Token is missing!'}), 401
+
+        try:
+            data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
+        except:
+            return jsonify({'message': 'Token is invalid!'}), 401
+
+        # limit each identity before any work is done on its behalf
+        limited = check_rate_limit(data['id'])
+        if limited:
+            return limited
+
+        account = user_account(data['id'])
+        if account is None:
+            return jsonify({'message': 'Token is invalid!'}), 401
+        load_role_permissions()
+
+        current_user = CurrentUser(data['id'], *account)
+
+        return f(current_user, *args, **kwargs)
+
+    return decorated
+
+def permission_required(*names):
+    mask = 0
+    for name in names:
+        mask |= permission_bit(name)
+
+    def decorator(f):
+        @wraps(f)
+        def decorated(current_user, *args, **kwargs):
+            if current_user.permissions & mask != mask:
+                return jsonify({'message': 'You do not have permission to perform this action'})
+            return f(current_user, *args, **kwargs)
+
+        return decorated
+
+    return decorator
+
@@ -0,0 +1,347 @@
+import bisect
+import datetime
+import math
+import random
+import time
+from flask import current_app
+
+from hospital.extensions import db
+from hospital.models import DoctorAvailability, OperationTheatreBooking
+
+ONE_DAY = datetime.timedelta(days=1)
+
+
+# Theater planning
+# a batch of surgery requests is packed into theater sessions (one theater on
+# one day) to leave as little idle theater time as possible. Times are whole
+# minutes of the day. Every case starts at the earliest minute its theater
+# and its surgeon are both free, so a session only has gaps where a surgeon's
+# hours force one and the planner's work is choosing sessions: a greedy best
+# fit builds a plan, cases left out make room by moving one of their
+# surgeon's other cases, the least loaded sessions are emptied into the others
+# wherever their cases fit, and until the time budget runs out the cases are
+# packed again in shuffled orders, keeping the best plan
+
+def minutes(time):
+    return time.hour * 60 + time.minute
+
+def clock(minute):
+    return '%02d:%02d' % divmod(minute, 60)
+
+
+# the opening hours of a theater: its availability when written as
+# 'HH:MM-HH:MM', else OT_SESSION_HOURS
+def session_hours(theater):
+    try:
+        start, end = (datetime.datetime.strptime(part.strip(), '%H:%M').time()
+                      for part in (theater.availability or '').split('-'))
+    except ValueError:
+        start, end = (datetime.datetime.strptime(part, '%H:%M').time()
+                      for part in current_app.config['OT_SESSION_HOURS'])
+    return minutes(start), minutes(end) or 24 * 60
+
+
+# the free parts of [start, end) around sorted (start, end, case) busy times
+def free_intervals(start, end, busy):
+    free = []
+    for busy_start, busy_end, case in busy:
+        if busy_start > start:
+            free.append((start, min(busy_start, end)))
+        start = max(start, busy_end)
+    if end > start:
+        free.append((start, end))
+    return free
+
+
+class Case(object):
+    def __init__(self, id, doctor_id, duration, earliest, latest):
+        self.id = id
+        self.doctor_id = doctor_id
+        self.duration = duration
+        self.earliest = earliest
+        self.latest = latest
+        # sessions in the case's date range on days its surgeon works long enough
+        self.sessions = []
+
+
+class Session(object):
+    def __init__(self, theater_id, date, open, close):
+        self.theater_id = theater_id
+        self.date = date
+        self.open = open
+        self.close = close
+        self.length = close - open
+        # (start, end, case) of the planned cases, turnover included
+        self.busy = []
+
+    def used(self):
+        return sum(end - start for start, end, case in self.busy)
+
+
+# one candidate plan; sessions hold its theater bookings, surgeon_busy the
+# surgeons' side of them
+class Plan(object):
+    def __init__(self, planner):
+        self.planner = planner
+        # case -> (session, start)
+        self.placed = {}
+        # (doctor_id, date) -> sorted (start, end, case)
+        self.surgeon_busy = {}
+
+    # earliest start of case in session, or None
+    def fit(self, case, session):
+        turnover = self.planner.turnover
+        key = (case.doctor_id, session.date)
+        surgeon = self.planner.surgeon_free(key, self.surgeon_busy.get(key, ()))
+        # the turnover after the last case may run past closing time
+        for theater_start, theater_end in free_intervals(session.open, session.close + turnover, session.busy):
+            for surgeon_start, surgeon_end in surgeon:
+                start = max(theater_start, surgeon_start)
+                if start + case.duration + turnover <= theater_end and start + case.duration <= surgeon_end:
+                    return start
+        return None
+
+    # busy times never overlap, so their starts alone keep them in order
+    def place(self, case, session, start):
+        bisect.insort(session.busy, (start, start + case.duration + self.planner.turnover, case))
+        bisect.insort(self.surgeon_busy.setdefault((case.doctor_id, session.date), []),
+                      (start, start + case.duration, case))
+        self.placed[case] = (session, start)
+
+    def remove(self, case):
+        session, start = self.placed.pop(case)
+        session.busy = [busy for busy in session.busy if busy[2] is not case]
+        key = (case.doctor_id, session.date)
+        self.surgeon_busy[key] = [busy for busy in self.surgeon_busy[key] if busy[2] is not case]
+        return session, start
+
+    # put case where it leaves an open session fullest, else (unless
+    # open_only) open the session of the earliest day it fits in; False when
+    # it fits nowhere
+    def insert(self, case, exclude=None, open_only=False):
+        best = None
+        # empty sessions with the same day and hours are interchangeable
+        empty_tried = set()
+        for session in case.sessions:
+            if session is exclude or (open_only and not session.busy):
+                continue
+            if not session.busy:
+                if (session.date, session.open, session.close) in empty_tried:
+                    continue
+                empty_tried.add((session.date, session.open, session.close))
+            start = self.fit(case, session)
+            if start is None:
+                continue
+            cost = (not session.busy, session.length - session.used() - case.duration, session.date, start)
+            if best is None or cost < best[0]:
+                best = (cost, session, start)
+        if best is None:
+            return False
+        self.place(case, best[1], best[2])
+        return True
+
+    def sessions(self):
+        return {session for session, start in self.placed.values()}
+
+    # fewer cases left out first, then less idle time in the sessions used
+    def score(self):
+        idle = sum(session.length for session in self.sessions()) - sum(case.duration for case in self.placed)
+        return len(self.planner.cases) - len(self.placed), idle
+
+
+class Planner(object):
+    def __init__(self, cases, theaters, turnover):
+        self.cases = cases
+        self.turnover = turnover
+        first = min(case.earliest for case in cases)
+        days = [first + ONE_DAY * n for n in range((max(case.latest for case in cases) - first).days + 1)]
+        self.days = [day for day in days if day.weekday() in current_app.config['OT_SESSION_DAYS']]
+        self.sessions = [Session(theater.id, day, *session_hours(theater)) for day in self.days for theater in theaters]
+        # (doctor_id, weekday) -> merged working hours
+        self.windows = {}
+        # (doctor_id, date) -> operations booked before this plan
+        self.booked = {}
+        # (doctor_id, date) -> working hours around the booked operations
+        self.free = {}
+
+    def load(self):
+        doctor_ids = sorted({case.doctor_id for case in self.cases})
+        windows = {}
+        for doctor_id, weekday, start, end in db.session.query(
+                DoctorAvailability.doctor_id, DoctorAvailability.day_of_week,
+                DoctorAvailability.start_time, DoctorAvailability.end_time) \
+                .filter(DoctorAvailability.doctor_id.in_(doctor_ids)):
+            windows.setdefault((doctor_id, weekday % 7), []).append((minutes(start), minutes(end) or 24 * 60))
+        for key, intervals in windows.items():
+            merged = []
+            for start, end in sorted(intervals):
+                if merged and start <= merged[-1][1]:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+                elif end > start:
+                    merged.append((start, end))
+            self.windows[key] = merged
+
+        if self.days:
+            for doctor_id, date, start, end in db.session.query(
+                    OperationTheatreBooking.doctor_id, OperationTheatreBooking.date,
+                    OperationTheatreBooking.start_time, OperationTheatreBooking.end_time) \
+                    .filter(OperationTheatreBooking.doctor_id.in_(doctor_ids),
+                            OperationTheatreBooking.date >= self.days[0], OperationTheatreBooking.date <= self.days[-1]):
+                if start is not None and end is not None:
+                    self.booked.setdefault((doctor_id, date), []).append((minutes(start), minutes(end) or 24 * 60, None))
+            for busy in self.booked.values():
+                busy.sort(key=lambda busy: busy[:2])
+
+        for case in self.cases:
+            case.sessions = [session for session in self.sessions
+                             if case.earliest <= session.date <= case.latest and session.length >= case.duration
+                             and any(end - start >= case.duration
+                                     for start, end in self.surgeon_free((case.doctor_id, session.date), ()))]
+
+    # a surgeon's free time on a day, around the cases planned so far
+    def surgeon_free(self, key, planned):
+        if key not in self.free:
+            doctor_id, date = key
+            self.free[key] = [interval for start, end in self.windows.get((doctor_id, date.weekday()), ())
+                              for interval in free_intervals(start, end, self.booked.get(key, ()))]
+        if not planned:
+            return self.free[key]
+        return [interval for start, end in self.free[key] for interval in free_intervals(start, end, planned)]
+
+    def build(self, order):
+        for session in self.sessions:
+            session.busy = []
+        plan = Plan(self)
+        for case in order:
+            plan.insert(case)
+        return plan
+
+    # move the cases of the least loaded sessions into the other sessions,
+    # keeping the moves only when a whole session empties
+    def compact(self, plan, deadline):
+        improved = True
+        while improved and time.monotonic() < deadline:
+            improved = False
+            for session in sorted(plan.sessions(), key=Session.used):
+                if time.monotonic() >= deadline:
+                    break
+                removed = [(busy[2], plan.remove(busy[2])) for busy in list(session.busy)]
+                moved = []
+                for case, where in sorted(removed, key=lambda item: -item[0].duration):
+                    if not plan.insert(case, exclude=session, open_only=True):
+                        break
+                    moved.append(case)
+                if len(moved) == len(removed):
+                    improved = True
+                    break
+                for case in moved:
+                    plan.remove(case)
+                for case, (where, start) in removed:
+                    plan.place(case, where, start)
+
+    # place the cases left out by moving one of the same surgeon's cases in
+    # their date range elsewhere, to make room
+    def repair(self, plan, deadline):
+        for case in self.cases:
+            if case in plan.placed or not case.sessions or time.monotonic() >= deadline:
+                continue
+            if plan.insert(case):
+                continue
+            for other in [other for other, (session, start) in plan.placed.items()
+                          if other.doctor_id == case.doctor_id and case.earliest <= session.date <= case.latest]:
+                where, start = plan.remove(other)
+                if plan.insert(case):
+                    if plan.insert(other):
+                        break
+                    plan.remove(case)
+                plan.place(other, where, start)
+
+    # fewest sessions any plan holding cases could use
+    def sessions_lower_bound(self, cases):
+        longest = max((session.length for session in self.sessions), default=0)
+        work = sum(case.duration + self.turnover for case in cases)
+        return math.ceil(work / (longest + self.turnover)) if longest else 0
+
+    # best (placed, sessions used) found within time_budget seconds
+    def run(self, time_budget, seed=0):
+        deadline = time.monotonic() + time_budget
+        rng = random.Random(seed)
+        self.load()
+        bound = self.sessions_lower_bound([case for case in self.cases if case.sessions])
+        unplaceable = sum(1 for case in self.cases if not case.sessions)
+
+        # longest and least flexible cases first
+        order = sorted(self.cases, key=lambda case: (-case.duration, len(case.sessions)))
+        best, best_score, self.iterations = {}, None, 0
+        while True:
+            plan = self.build(order)
+            self.repair(plan, deadline)
+            self.compact(plan, deadline)
+            self.iterations += 1
+            score = plan.score()
+            if best_score is None or score < best_score:
+                best, best_score = dict(plan.placed), score
+            # nothing left to gain once every placeable case is in and the
+            # sessions are down to the bound
+            used = len({session for session, start in best.values()})
+            if time.monotonic() >= deadline or (best_score[0] == unplaceable and used <= bound):
+                break
+            # roughly longest first, shuffled
+            order = sorted(self.cases, key=lambda case: -case.duration * rng.uniform(0.5, 1.5))
+        return best
+
+
+# pack cases (dicts of id, doctor_id, duration in minutes and earliest and
+# latest dates) into sessions of the theaters; returns the schedule, the
+# cases left out with the reason and quality metrics
+def plan_theaters(cases, theaters, time_budget):
+    started = time.monotonic()
+    turnover = current_app.config['OT_TURNOVER_MINUTES']
+    cases = [Case(case['id'], case['doctor_id'], case['duration'], case['earliest'], case['latest']) for case in cases]
+    planner = Planner(cases, theaters, turnover)
+    placed = planner.run(time_budget)
+
+    schedule = [{
+        'case_id': case.id,
+        'doctor_id': case.doctor_id,
+        'theater_id': session.theater_id,
+        'date': session.date.isoformat(),
+        'start_time': clock(start),
+        'end_time': clock(start + case.duration),
+    } for case, (session, start) in placed.items()]
+    schedule.sort(key=lambda item: (item['date'], item['theater_id'], item['start_time']))
+
+    unscheduled = [{
+        'case_id': case.id,
+        'reason': 'no free theater time' if case.sessions else 'surgeon not available long enough on a theater day in range',
+    } for case in cases if case not in placed]
+
+    by_session = {}
+    for case, (session, start) in placed.items():
+        by_session.setdefault(session, []).append((start, case.duration))
+    session_minutes = sum(session.length for session in by_session)
+    booked_minutes = sum(case.duration for case in placed)
+    # idle time between the first and the last case of each session
+    gap_minutes = sum(max(start + duration for start, duration in booked) - min(start for start, duration in booked)
+                      - sum(duration for start, duration in booked) - turnover * (len(booked) - 1)
+                      for booked in by_session.values())
+
+    return {
+        'schedule': schedule,
+        'unscheduled': unscheduled,
+        'metrics': {
+            'cases': len(cases),
+            'scheduled': len(placed),
+            'sessions_used': len(by_session),
+            'sessions_lower_bound': planner.sessions_lower_bound(placed),
+            'session_minutes': session_minutes,
+            'booked_minutes': booked_minutes,
+            'turnover_minutes': turnover * len(placed),
+            'idle_minutes': session_minutes - booked_minutes,
+            'gap_minutes': gap_minutes,
+            'utilization': round(booked_minutes / session_minutes, 4) if session_minutes else 0.0,
+            'iterations': planner.iterations,
+            'time_budget': time_budget,
+            'elapsed_seconds': round(time.monotonic() - started, 3),
+        },
+    }
@@ -0,0 +1,85 @@
+from sqlalchemy import func
+
+from hospital.extensions import db
+from hospital.models import HospitalStaff, PatientTestRecord, Payment, StaffAttendance
+from hospital.sharding import patient_shard, scatter, sum_by_key
+
+
+# Reports
+# the long running reports, as plain functions of their string parameters
+# returning JSON-ready data, so they can be answered inline or run as a job
+# (see hospital.jobs)
+
+# present/absent counts per staff member over an optional date range
+def staff_attendance_report(start_date=None, end_date=None):
+    query = db.session.query(StaffAttendance.staff_id, StaffAttendance.status, func.count(StaffAttendance.id))
+    if start_date:
+        query = query.filter(StaffAttendance.date >= start_date)
+    if end_date:
+        query = query.filter(StaffAttendance.date <= end_date)
+
+    # one grouped query instead of one per staff member
+    attendance_report = {staff_id: {} for staff_id, in db.session.query(HospitalStaff.id)}
+    for staff_id, status, count in query.group_by(StaffAttendance.staff_id, StaffAttendance.status):
+        attendance_report.setdefault(staff_id, {})[status] = count
+
+    return {'attendance_report': attendance_report}
+
+
+# total, per payment type and per month revenue, optionally filtered by date
+def hospital_revenues(date_start=None, date_end=None):
+    def payments():
+        query = Payment.query
+        if date_start:
+            query = query.filter(Payment.payment_date >= date_start)
+        if date_end:
+            query = query.filter(Payment.payment_date <= date_end)
+        return query
+
+    # get the total revenue
+    totals = [total for total in scatter(lambda shard: payments().with_entities(func.sum(Payment.amount)).scalar()) if total is not None]
+    total_revenue = sum(totals) if totals else None
+
+    # get the revenue for each payment type
+    payment_types = sum_by_key(scatter(lambda shard: payments().with_entities(Payment.payment_type, func.sum(Payment.amount)).group_by(Payment.payment_type).all()))
+
+    # get the revenue for each month
+    month = func.strftime('%Y-%m', Payment.payment_date)
+    revenues = sum_by_key(scatter(lambda shard: payments().with_entities(month, func.sum(Payment.amount)).group_by(month).all()))
+
+    return {
+        'total_revenue': total_revenue,
+        'payment_types': [{'type': payment_type, 'revenue': revenue} for payment_type, revenue in payment_types],
+        'monthly': [{'date': date, 'revenue': revenue} for date, revenue in revenues]
+    }
+
+
+# patient test records filtered by patient, test and date range
+def patient_test_records(patient_id=None, test_type=None, test_date_start=None, test_date_end=None):
+    def find_records(shard):
+        query = db.session.query(PatientTestRecord.id, PatientTestRecord.patient_id,
+                                 PatientTestRecord.test_name, PatientTestRecord.test_date)
+        if patient_id:
+            query = query.filter(PatientTestRecord.patient_id == patient_id)
+        if test_type:
+            query = query.filter(PatientTestRecord.test_name == test_type)
+        if test_date_start:
+            query = query.filter(PatientTestRecord.test_date >= test_date_start)
+        if test_date_end:
+            query = query.filter(PatientTestRecord.test_date <= test_date_end)
+        return query.order_by(PatientTestRecord.id).all()
+
+    # one patient's records are on their shard
+    records = [record for records in scatter(find_records, [patient_shard(patient_id)] if patient_id else None)
+               for record in records]
+
+    return [{'id': id, 'patient_id': record_patient_id, 'test_type': test_name, 'test_date': test_date}
+            for id, record_patient_id, test_name, test_date in records]
+
+
+# report name -> (function, permission needed to run it or read its result)
+REPORTS = {
+    'staff-attendance': (staff_attendance_report, 'staff-attendance:read'),
+    'hospital-revenues': (hospital_revenues, 'analytics:hospital-revenues'),
+    'patient-test-records': (patient_test_records, 'analytics:patient-test-records'),
+}
@@ -0,0 +1,53 @@
+import contextlib
+import contextvars
+from flask_sqlalchemy.session import Session
+from sqlalchemy import inspect
+from sqlalchemy.sql.util import find_tables
+
+# tables partitioned by patient; every other table lives in the main database
+SHARDED_TABLES = {
+    'patient', 'patient_match_key', 'appointment', 'admission', 'patient_test', 'lab_result', 'payment',
+    'patient_test_record', 'patient_history', 'patient_version', 'patient_history_version', 'patient_summary',
+    'appointment_archive', 'admission_archive', 'patient_test_archive', 'archive_state', 'census_snapshot',
+}
+
+# the shard that sharded tables are read from and written to in this context
+current_shard = contextvars.ContextVar('current_shard', default=None)
+
+
+class ShardingError(Exception):
+    pass
+
+
+@contextlib.contextmanager
+def use_shard(shard):
+    token = current_shard.set(shard)
+    try:
+        yield shard
+    finally:
+        current_shard.reset(token)
+
+
+def shard_engine_key(shard):
+    return 'shard%d' % shard
+
+
+def touches_sharded_table(mapper, clause):
+    if mapper is not None:
+        return inspect(mapper).local_table.name in SHARDED_TABLES
+    if clause is not None:
+        return any(getattr(table, 'name', None) in SHARDED_TABLES for table in find_tables(clause, include_crud=True))
+    return False
+
+
+# db.session: statements on sharded tables go to the engine of the current
+# shard, everything else to the main database. Without shard engines
+# configured it behaves exactly like the stock session
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and shard_engine_key(0) in self._db.engines and touches_sharded_table(mapper, clause):
+            shard = current_shard.get()
+            if shard is None:
+                raise ShardingError('Sharded table used outside use_shard(); scatter the query over the shards')
+            return self._db.engines[shard_engine_key(shard)]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
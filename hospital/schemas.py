@@ -0,0 +1,231 @@
+import datetime
+import math
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer, Numeric, Time
+from sqlalchemy.orm.attributes import QueryableAttribute
+
+from hospital.listing import bad_request, date_part, time_part
+
+MISSING = object()
+
+
+# Write schemas
+# the write side of an endpoint's field map, the same public name -> column
+# map its listings use (see hospital.listing). A schema is compiled once, at
+# import, into a flat list of (field, attribute, parser, required, nullable)
+# picked from the column definitions, so checking a payload is one pass of
+# dict lookups and cheap parsers; every bad field is reported, not just the
+# first. Fields mapped to the date and time parts of one DateTime column are
+# joined back together. Primary keys the database assigns and computed
+# fields are read only
+
+def parse_integer(value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            pass
+    raise ValueError('must be an integer')
+
+def parse_float(value):
+    if isinstance(value, (int, float, str)) and not isinstance(value, bool):
+        try:
+            value = float(value)
+        except ValueError:
+            pass
+        else:
+            if math.isfinite(value):
+                return value
+    raise ValueError('must be a number')
+
+def parse_boolean(value):
+    if isinstance(value, bool):
+        return value
+    raise ValueError('must be true or false')
+
+def parse_date(value):
+    if isinstance(value, str):
+        try:
+            return datetime.date.fromisoformat(value)
+        except ValueError:
+            pass
+    raise ValueError('must be a date (YYYY-MM-DD)')
+
+def parse_time(value):
+    if isinstance(value, str):
+        try:
+            time = datetime.time.fromisoformat(value)
+        except ValueError:
+            pass
+        else:
+            if time.tzinfo is None:
+                return time
+    raise ValueError('must be a time (HH:MM:SS)')
+
+def parse_datetime(value):
+    if isinstance(value, str):
+        try:
+            date_time = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            pass
+        else:
+            if date_time.tzinfo is None:
+                return date_time
+    raise ValueError('must be a date and time (YYYY-MM-DD HH:MM:SS)')
+
+def string_parser(length):
+    def parse_string(value):
+        if not isinstance(value, str):
+            raise ValueError('must be a string')
+        if length is not None and len(value) > length:
+            raise ValueError('must be at most %d characters' % length)
+        return value
+    return parse_string
+
+
+def parser_for(column):
+    column_type = column.type
+    if isinstance(column_type, DateTime):
+        return parse_datetime
+    if isinstance(column_type, Date):
+        return parse_date
+    if isinstance(column_type, Time):
+        return parse_time
+    if isinstance(column_type, Boolean):
+        return parse_boolean
+    if isinstance(column_type, Integer):
+        return parse_integer
+    if isinstance(column_type, (Float, Numeric)):
+        return parse_float
+    return string_parser(getattr(column_type, 'length', None))
+
+
+# the column a field writes, or None for computed fields and ids the
+# database assigns
+def writable_column(attribute):
+    if not isinstance(attribute, QueryableAttribute):
+        return None
+    columns = getattr(attribute.property, 'columns', None)
+    if not columns:
+        return None
+    column = columns[0]
+    if column.primary_key and isinstance(column.type, Integer) and column.autoincrement is not False:
+        return None
+    return column
+
+
+class Schema(object):
+    def __init__(self, fields):
+        self.fields = []
+        # attribute -> value of optional fields left out of a bulk row
+        self.fill = {}
+        parts = {}
+        for name, spec in fields.items():
+            attribute, format = spec if isinstance(spec, tuple) else (spec, None)
+            column = writable_column(attribute)
+            if column is None:
+                continue
+            required = not column.nullable and column.default is None and column.server_default is None
+            if not required and column.server_default is None:
+                self.fill[attribute.key] = column.default.arg if column.default is not None and column.default.is_scalar else None
+            if format is date_part or format is time_part:
+                part = parts.setdefault(attribute.key, [None, None, required, column.nullable])
+                part[0 if format is date_part else 1] = name
+            else:
+                self.fields.append((name, attribute.key, parser_for(column), required, column.nullable))
+        # (attribute, date field, time field, required, nullable)
+        self.parts = [(key, date_name, time_name, required, nullable)
+                      for key, (date_name, time_name, required, nullable) in parts.items() if date_name]
+
+    # (values by model attribute, errors by field name). partial (for
+    # updates) checks only the fields present, and a date or time part given
+    # alone keeps the other part of current's value
+    def validate(self, data, partial=False, current=None):
+        if not isinstance(data, dict):
+            return {}, {'': 'must be an object'}
+
+        values = {}
+        errors = {}
+        for name, key, parse, required, nullable in self.fields:
+            value = data.get(name, MISSING)
+            if value is MISSING:
+                if required and not partial:
+                    errors[name] = 'is required'
+            elif value is None:
+                if nullable:
+                    values[key] = None
+                else:
+                    errors[name] = 'may not be null'
+            else:
+                try:
+                    values[key] = parse(value)
+                except ValueError as error:
+                    errors[name] = str(error)
+
+        for key, date_name, time_name, required, nullable in self.parts:
+            date = data.get(date_name, MISSING)
+            time = data.get(time_name, MISSING) if time_name else MISSING
+            if date is MISSING and time is MISSING:
+                if required and not partial:
+                    errors[date_name] = 'is required'
+                continue
+            if date is None:
+                if nullable:
+                    values[key] = None
+                else:
+                    errors[date_name] = 'may not be null'
+                continue
+
+            existing = getattr(current, key, None) if current is not None else None
+            try:
+                date = parse_date(date) if date is not MISSING else existing.date() if existing else None
+                if date is None:
+                    raise ValueError('is required')
+            except ValueError as error:
+                errors[date_name] = str(error)
+            try:
+                # a date alone is midnight, or the time it already had
+                time = parse_time(time) if time not in (MISSING, None) else \
+                    existing.time() if existing and time is MISSING else datetime.time()
+            except ValueError as error:
+                errors[time_name] = str(error)
+            if date_name not in errors and time_name not in errors:
+                values[key] = datetime.datetime.combine(date, time)
+
+        return values, errors
+
+    # validated values of a payload, or a 400 listing what is wrong with it
+    def load(self, data, partial=False, current=None):
+        values, errors = self.validate(data, partial, current)
+        if errors:
+            bad_request('Invalid request', errors=errors)
+        return values
+
+    # validated values of every row of a bulk payload, each with the same
+    # keys so they insert as one executemany; one bad row rejects the batch,
+    # with the errors of each bad row by index
+    def load_many(self, rows):
+        if not isinstance(rows, list):
+            bad_request('Invalid request', errors={'': 'must be a list'})
+        validate = self.validate
+        fill = self.fill
+        values = []
+        errors = []
+        for index, row in enumerate(rows):
+            row_values, row_errors = validate(row)
+            if row_errors:
+                errors.append({'index': index, 'errors': row_errors})
+            else:
+                values.append({**fill, **row_values})
+        if errors:
+            bad_request('Invalid request', errors=errors)
+        return values
+
+
+# set validated values on a model instance
+def assign(row, values):
+    for key, value in values.items():
+        setattr(row, key, value)
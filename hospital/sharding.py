@@ -0,0 +1,325 @@
+import concurrent.futures
+import threading
+import time
+import zlib
+import click
+from flask import current_app, request
+from flask.cli import AppGroup
+from sqlalchemy import event, func, inspect, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, object_session
+
+from hospital.extensions import db
+from hospital.models import (Admission, Appointment, AppointmentSlot, IdBlock, LabResult, Patient, PatientDirectory,
+                             PatientHistory, PatientTest, PatientTestRecord, Payment)
+from hospital.routing import SHARDED_TABLES, current_shard, shard_engine_key, use_shard
+
+# models whose ids are handed out by allocate_id, so they are unique across shards
+GLOBAL_ID_MODELS = (Patient, Appointment, Admission, PatientTest, Payment, PatientHistory, LabResult, PatientTestRecord)
+
+
+def shard_count():
+    return len(current_app.config['SHARD_URIS']) or 1
+
+def sharding_enabled():
+    return bool(current_app.config['SHARD_URIS'])
+
+def is_sharded(model):
+    return model.__table__.name in SHARDED_TABLES
+
+
+# run function(shard) on every shard (or the given ones) in parallel, each in
+# its own app context and session, and return the results in shard order.
+# With a single database it runs inline
+def scatter(function, shards=None):
+    shards = list(range(shard_count())) if shards is None else list(shards)
+    if not sharding_enabled():
+        with use_shard(0):
+            return [function(shard) for shard in shards]
+
+    app = current_app._get_current_object()
+
+    def run(shard):
+        with app.app_context(), use_shard(shard):
+            return function(shard)
+
+    return list(shard_executor(app).map(run, shards))
+
+shard_executor_lock = threading.Lock()
+
+def shard_executor(app):
+    # created on first use, so a preloading master never starts threads
+    with shard_executor_lock:
+        if 'shard_executor' not in app.extensions:
+            app.extensions['shard_executor'] = concurrent.futures.ThreadPoolExecutor(
+                app.config['SHARD_SCATTER_THREADS'], thread_name_prefix='shard-scatter')
+        return app.extensions['shard_executor']
+
+
+# Patient directory
+# a patient stays on the shard recorded for them; new patients are placed by
+# a hash of their id, so changing the shard count never moves existing charts
+directory_cache = {}
+
+def patient_shard(patient_id):
+    if not sharding_enabled():
+        return 0
+    patient_id = int(patient_id)
+    shard = directory_cache.get(patient_id)
+    if shard is None:
+        shard = db.session.query(PatientDirectory.shard).filter(PatientDirectory.patient_id == patient_id).scalar()
+        if shard is None:
+            return hash_shard(patient_id)
+        if len(directory_cache) >= current_app.config['SHARD_DIRECTORY_CACHE_SIZE']:
+            directory_cache.clear()
+        directory_cache[patient_id] = shard
+    return shard
+
+# {shard: [patient ids]} for a request about several patients
+def patients_by_shard(patient_ids):
+    groups = {}
+    for patient_id in patient_ids:
+        groups.setdefault(patient_shard(patient_id), []).append(patient_id)
+    return groups
+
+def hash_shard(patient_id):
+    return zlib.crc32(str(patient_id).encode()) % shard_count()
+
+# id and shard for a patient about to be registered; the directory row is
+# committed together with the patient
+def place_new_patient():
+    if not sharding_enabled():
+        return None, 0
+    patient_id = allocate_id('patient')
+    shard = hash_shard(patient_id)
+    db.session.add(PatientDirectory(patient_id=patient_id, shard=shard))
+    return patient_id, shard
+
+
+# the shard holding the row of model with this id (or its archived copy), None
+# if no shard has it. The shard the row was last seen on, then the shard of
+# patient_id when the caller knows the row's patient, are tried first; every
+# shard is asked only when neither has the row
+row_shards = {}
+
+def locate(model, id, archive_model=None, patient_id=None):
+    if not sharding_enabled():
+        return 0
+
+    def has_row(shard):
+        return any(db.session.query(source.id).filter(source.id == id).first() is not None
+                   for source in (model, archive_model) if source is not None)
+
+    key = (model.__table__.name, id)
+    guesses = [row_shards.get(key)]
+    if patient_id is not None:
+        guesses.append(patient_shard(patient_id))
+    for shard in dict.fromkeys(guess for guess in guesses if guess is not None):
+        with use_shard(shard):
+            if has_row(shard):
+                remember_row(key, shard)
+                return shard
+
+    found = [shard for shard, present in enumerate(scatter(has_row)) if present]
+    if not found:
+        return None
+    remember_row(key, found[0])
+    return found[0]
+
+# the patient_id of a JSON request body, as a hint for locate
+def request_patient_id():
+    body = request.get_json(silent=True)
+    patient_id = body.get('patient_id') if isinstance(body, dict) else None
+    if isinstance(patient_id, int) and not isinstance(patient_id, bool) and 0 < patient_id < 2 ** 63:
+        return patient_id
+    return None
+
+def remember_row(key, shard):
+    if len(row_shards) >= current_app.config['SHARD_DIRECTORY_CACHE_SIZE']:
+        row_shards.clear()
+    row_shards[key] = shard
+
+def row_inserted(mapper, connection, target):
+    shard = current_shard.get()
+    if shard is not None and sharding_enabled():
+        remember_row((mapper.local_table.name, target.id), shard)
+
+
+# rows stay on the shard they were written to, so one cannot be moved to a
+# patient living on another shard
+def other_shard(patient_id, shard):
+    return patient_id is not None and patient_shard(patient_id) != shard
+
+
+# Id allocation
+# ids of sharded rows come from blocks reserved in the main database, one
+# short write per block, so they never collide between shards. Blocks are
+# reserved before a flush (reserve_flush_ids) rather than inside it, where
+# the session may already hold a write lock the reservation would wait on
+id_blocks = {}
+id_blocks_lock = threading.Lock()
+
+def allocate_id(table_name):
+    return take_ids(table_name, 1)[0]
+
+# count ids from the local block of table_name, reserving a larger block
+# first if this one has fewer left
+def take_ids(table_name, count):
+    with id_blocks_lock:
+        next_id, limit = id_blocks.get(table_name, (0, 0))
+        if limit - next_id < count:
+            next_id, limit = reserve_id_block(table_name, max(count, current_app.config['ID_BLOCK_SIZE']))
+        id_blocks[table_name] = (next_id + count, limit)
+        return list(range(next_id, next_id + count))
+
+# make sure count ids are left in the local block of table_name without taking them
+def reserve_ahead(table_name, count):
+    with id_blocks_lock:
+        next_id, limit = id_blocks.get(table_name, (0, 0))
+        if limit - next_id < count:
+            id_blocks[table_name] = reserve_id_block(table_name, max(count, current_app.config['ID_BLOCK_SIZE']))
+
+# ids for the rows of a bulk Core insert, which bypasses assign_global_id;
+# one block of exactly count ids
+def allocate_ids(table_name, count):
+    start, end = reserve_id_block(table_name, count)
+    return list(range(start, end))
+
+# a block of size ids, written on its own connection to the main database and
+# retried while another writer holds the database
+def reserve_id_block(table_name, size):
+    table = IdBlock.__table__
+    engine = db.engines[None]
+    with engine.connect() as connection:
+        known = connection.execute(select(table.c.name).where(table.c.name == table_name)).first() is not None
+    # the first block starts after the largest id already on any shard
+    start = None if known else 1 + max(shard_max_id(table_name, shard) for shard in range(shard_count()))
+
+    for attempt in range(current_app.config['ID_BLOCK_RETRIES'] + 1):
+        try:
+            with engine.begin() as connection:
+                if start is not None:
+                    connection.execute(table.insert().prefix_with('OR IGNORE').values(name=table_name, next_id=start))
+                connection.execute(table.update().where(table.c.name == table_name)
+                                   .values(next_id=table.c.next_id + size))
+                end = connection.execute(select(table.c.next_id).where(table.c.name == table_name)).scalar()
+            return end - size, end
+        except OperationalError as error:
+            if 'locked' not in str(error.orig) or attempt == current_app.config['ID_BLOCK_RETRIES']:
+                raise
+            time.sleep(0.05 * 2 ** attempt)
+
+def shard_max_id(table_name, shard):
+    with db.engines[shard_engine_key(shard)].connect() as connection:
+        return connection.execute(text('SELECT coalesce(max(id), 0) FROM %s' % table_name)).scalar()
+
+
+# before a flush, give the new rows of GLOBAL_ID_MODELS their ids and set
+# aside the ids the flush's listeners will take (the lab results mirrored
+# from patient tests)
+def reserve_flush_ids(session, flush_context, instances):
+    if current_shard.get() is None or not sharding_enabled():
+        return
+    new_rows = {}
+    for target in session.new:
+        if isinstance(target, GLOBAL_ID_MODELS) and target.id is None:
+            new_rows.setdefault(target.__table__.name, []).append(target)
+    for table_name, targets in new_rows.items():
+        for target, id in zip(targets, take_ids(table_name, len(targets))):
+            target.id = id
+
+    mirrored = sum(isinstance(target, PatientTest) for target in (*session.new, *session.dirty))
+    if mirrored:
+        reserve_ahead(LabResult.__table__.name, mirrored)
+
+# rows added during the flush itself
+def assign_global_id(mapper, connection, target):
+    if target.id is None and current_shard.get() is not None and sharding_enabled():
+        target.id = allocate_id(mapper.local_table.name)
+
+
+# Doctor slots
+# the partial unique index only sees one shard, so while sharding is on a
+# live appointment also claims its doctor slot in the main database
+def claim_slot(target):
+    session = object_session(target)
+    session.connection(bind_arguments={'bind': db.engines[None]}).execute(
+        AppointmentSlot.__table__.insert().values(doctor_id=target.doctor_id, date_time=target.date_time))
+
+def release_slot(target, doctor_id, date_time):
+    table = AppointmentSlot.__table__
+    session = object_session(target)
+    session.connection(bind_arguments={'bind': db.engines[None]}).execute(
+        table.delete().where(table.c.doctor_id == doctor_id, table.c.date_time == date_time))
+
+def appointment_inserted(mapper, connection, target):
+    if sharding_enabled() and target.status != 'Cancelled':
+        claim_slot(target)
+
+def appointment_updated(mapper, connection, target):
+    if not sharding_enabled():
+        return
+    state = inspect(target)
+    old = {}
+    for name in ('doctor_id', 'date_time', 'status'):
+        history = state.attrs[name].history
+        old[name] = history.deleted[0] if history.has_changes() and history.deleted else getattr(target, name)
+    if old == {name: getattr(target, name) for name in old}:
+        return
+
+    if old['status'] != 'Cancelled':
+        release_slot(target, old['doctor_id'], old['date_time'])
+    if target.status != 'Cancelled':
+        claim_slot(target)
+
+def appointment_deleted(mapper, connection, target):
+    if sharding_enabled() and target.status != 'Cancelled':
+        release_slot(target, target.doctor_id, target.date_time)
+
+
+# create the sharded tables in every shard database (db.create_all only
+# creates tables in the main database)
+def create_shard_tables():
+    tables = [table for table in db.metadata.sorted_tables if table.name in SHARDED_TABLES]
+    for shard in range(len(current_app.config['SHARD_URIS'])):
+        db.metadata.create_all(db.engines[shard_engine_key(shard)], tables=tables)
+
+
+def count_rows(model):
+    return sum(scatter(lambda shard: db.session.query(func.count(model.id)).scalar()))
+
+# (key, number) rows from every shard added up per key, in key order
+def sum_by_key(results):
+    totals = {}
+    for rows in results:
+        for key, value in rows:
+            totals[key] = totals.get(key, 0) + (value or 0)
+    return sorted(totals.items(), key=lambda item: (item[0] is not None, item[0]))
+
+
+shards_cli = AppGroup('shards')
+
+# flask shards init
+@shards_cli.command('init')
+def init_shards_command():
+    create_shard_tables()
+    click.echo('%d shards ready' % shard_count())
+
+
+def init_app(app):
+    # shard n is the bind 'shard<n>'; the main database keeps the default bind
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    for shard, uri in enumerate(app.config['SHARD_URIS']):
+        binds[shard_engine_key(shard)] = uri
+    app.config['SQLALCHEMY_BINDS'] = binds
+    app.cli.add_command(shards_cli)
+
+
+for model in GLOBAL_ID_MODELS:
+    event.listen(model, 'before_insert', assign_global_id)
+    event.listen(model, 'after_insert', row_inserted)
+event.listen(Session, 'before_flush', reserve_flush_ids)
+
+event.listen(Appointment, 'after_insert', appointment_inserted)
+event.listen(Appointment, 'after_update', appointment_updated)
+event.listen(Appointment, 'after_delete', appointment_deleted)
@@ -0,0 +1,187 @@
+import datetime
+import threading
+from flask import current_app
+from sqlalchemy import event, inspect, select
+
+from hospital.extensions import db
+from hospital.models import (Admission, AdmissionArchive, Appointment, Patient, PatientSummary, PatientTest,
+                             PatientTestArchive)
+from hospital.sharding import scatter
+
+
+# Patient summaries
+# every write to a patient, appointment, admission or test recomputes that
+# one part of the patient's summary row with a short query on the patient_id
+# index, on the connection of the write, so the summary changes in the same
+# transaction and on the same shard. The next appointment also goes stale as
+# time passes; refresh_expired() moves on the rows whose next appointment is
+# in the past before a list is read. Rows written by Core statements or before
+# the summaries existed are filled in by flask patients rebuild-summaries
+
+PATIENT_COLUMNS = ('first_name', 'last_name', 'date_of_birth', 'gender', 'contact_number', 'email', 'address')
+PART_COLUMNS = ('next_appointment_id', 'next_appointment_date_time', 'next_appointment_doctor_id', 'admission_id',
+                'admission_date_time', 'admission_status', 'last_test_id', 'last_test_date_time', 'last_test_type',
+                'last_test_result')
+
+
+def next_appointment(connection, patient_id, now):
+    table = Appointment.__table__
+    row = connection.execute(select(table.c.id, table.c.date_time, table.c.doctor_id).where(
+        table.c.patient_id == patient_id, table.c.status != 'Cancelled', table.c.date_time >= now)
+        .order_by(table.c.date_time, table.c.id).limit(1)).first()
+    return {
+        'next_appointment_id': row.id if row else None,
+        'next_appointment_date_time': row.date_time if row else None,
+        'next_appointment_doctor_id': row.doctor_id if row else None,
+    }
+
+# the newest row of the patient by time_column, live or archived
+def newest(connection, models, time_column, columns, patient_id):
+    rows = []
+    for model in models:
+        table = model.__table__
+        row = connection.execute(select(table.c.id, table.c[time_column], *[table.c[name] for name in columns])
+                                 .where(table.c.patient_id == patient_id)
+                                 .order_by(table.c[time_column].desc(), table.c.id.desc()).limit(1)).first()
+        if row is not None:
+            rows.append(row)
+    return max(rows, key=lambda row: (row[1], row[0])) if rows else None
+
+def latest_admission(connection, patient_id, now):
+    row = newest(connection, (Admission, AdmissionArchive), 'registration_date_time', ['status'], patient_id)
+    return {
+        'admission_id': row.id if row else None,
+        'admission_date_time': row.registration_date_time if row else None,
+        'admission_status': row.status if row else None,
+    }
+
+def last_test(connection, patient_id, now):
+    row = newest(connection, (PatientTest, PatientTestArchive), 'test_date_time', ['test_type', 'test_result'], patient_id)
+    return {
+        'last_test_id': row.id if row else None,
+        'last_test_date_time': row.test_date_time if row else None,
+        'last_test_type': row.test_type if row else None,
+        'last_test_result': row.test_result if row else None,
+    }
+
+# model -> the part of the summary its rows decide
+SUMMARY_PARTS = {
+    Appointment: next_appointment,
+    Admission: latest_admission,
+    PatientTest: last_test,
+}
+
+
+def refresh_part(connection, model, patient_id):
+    table = PatientSummary.__table__
+    values = SUMMARY_PARTS[model](connection, patient_id, datetime.datetime.now())
+    connection.execute(table.update().where(table.c.id == patient_id).values(**values))
+
+# the patients whose part changed: the row's patient, and its old patient
+# when it was moved to another
+def part_written(mapper, connection, target):
+    patient_ids = {target.patient_id}
+    history = inspect(target).attrs['patient_id'].history
+    patient_ids.update(patient_id for patient_id in history.deleted if patient_id is not None)
+    for patient_id in patient_ids:
+        refresh_part(connection, mapper.class_, patient_id)
+
+
+def patient_inserted(mapper, connection, target):
+    connection.execute(PatientSummary.__table__.insert().values(
+        id=target.id, **{name: getattr(target, name) for name in PATIENT_COLUMNS}))
+
+def patient_updated(mapper, connection, target):
+    state = inspect(target)
+    changed = {name: getattr(target, name) for name in PATIENT_COLUMNS if state.attrs[name].history.has_changes()}
+    if changed:
+        table = PatientSummary.__table__
+        connection.execute(table.update().where(table.c.id == target.id).values(**changed))
+
+def patient_deleted(mapper, connection, target):
+    table = PatientSummary.__table__
+    connection.execute(table.delete().where(table.c.id == target.id))
+
+
+# Expired next appointments
+# at most once per PATIENT_SUMMARY_REFRESH seconds per worker, every shard
+# moves the rows whose next appointment has started on to the one after;
+# the index on next_appointment_date_time finds them without a scan
+last_refresh = {'at': None}
+last_refresh_lock = threading.Lock()
+
+def refresh_expired():
+    interval = current_app.config['PATIENT_SUMMARY_REFRESH']
+    with last_refresh_lock:
+        now = datetime.datetime.now()
+        if last_refresh['at'] is not None and (now - last_refresh['at']).total_seconds() < interval:
+            return
+        last_refresh['at'] = now
+    scatter(lambda shard: refresh_shard_expired(now))
+
+def refresh_shard_expired(now):
+    expired = [patient_id for patient_id, in db.session.query(PatientSummary.id)
+               .filter(PatientSummary.next_appointment_date_time < now)]
+    if not expired:
+        return
+    connection = db.session.connection(bind_arguments={'mapper': PatientSummary.__mapper__})
+    for patient_id in expired:
+        refresh_part(connection, Appointment, patient_id)
+    db.session.commit()
+
+
+# Rebuild
+# the summaries of every patient from the live and archived rows, one shard
+# at a time; each table is read once in order and the row wanted for each
+# patient kept, instead of a query per patient
+def rebuild_summaries(batch_size=1000):
+    return sum(scatter(lambda shard: rebuild_shard_summaries(batch_size)))
+
+# the archive is read before the live table, so a row is newer than the one
+# kept when its (time, id) is not smaller
+def is_newer(time, id, summary, time_key, id_key):
+    return summary[time_key] is None or (time, id) >= (summary[time_key], summary[id_key])
+
+def rebuild_shard_summaries(batch_size):
+    now = datetime.datetime.now()
+    summaries = {}
+    for row in db.session.query(Patient.id, *[getattr(Patient, name) for name in PATIENT_COLUMNS]).yield_per(batch_size):
+        summaries[row.id] = dict(zip(('id',) + PATIENT_COLUMNS, row), **dict.fromkeys(PART_COLUMNS))
+
+    # latest last: the earliest upcoming appointment and the newest admission and test win
+    for row in db.session.query(Appointment.patient_id, Appointment.id, Appointment.date_time, Appointment.doctor_id) \
+            .filter(Appointment.status != 'Cancelled', Appointment.date_time >= now) \
+            .order_by(Appointment.date_time.desc(), Appointment.id.desc()).yield_per(batch_size):
+        if row.patient_id in summaries:
+            summaries[row.patient_id].update(next_appointment_id=row.id, next_appointment_date_time=row.date_time,
+                                             next_appointment_doctor_id=row.doctor_id)
+    for model in (AdmissionArchive, Admission):
+        for row in db.session.query(model.patient_id, model.id, model.registration_date_time, model.status) \
+                .order_by(model.registration_date_time, model.id).yield_per(batch_size):
+            summary = summaries.get(row.patient_id)
+            if summary is not None and is_newer(row.registration_date_time, row.id, summary, 'admission_date_time', 'admission_id'):
+                summary.update(admission_id=row.id, admission_date_time=row.registration_date_time, admission_status=row.status)
+    for model in (PatientTestArchive, PatientTest):
+        for row in db.session.query(model.patient_id, model.id, model.test_date_time, model.test_type, model.test_result) \
+                .order_by(model.test_date_time, model.id).yield_per(batch_size):
+            summary = summaries.get(row.patient_id)
+            if summary is not None and is_newer(row.test_date_time, row.id, summary, 'last_test_date_time', 'last_test_id'):
+                summary.update(last_test_id=row.id, last_test_date_time=row.test_date_time, last_test_type=row.test_type,
+                               last_test_result=row.test_result)
+
+    db.session.query(PatientSummary).delete()
+    rows = list(summaries.values())
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(PatientSummary.__table__.insert(), rows[start:start + batch_size])
+    db.session.commit()
+    return len(rows)
+
+
+for model in SUMMARY_PARTS:
+    event.listen(model, 'after_insert', part_written)
+    event.listen(model, 'after_update', part_written)
+    event.listen(model, 'after_delete', part_written)
+
+event.listen(Patient, 'after_insert', patient_inserted)
+event.listen(Patient, 'after_update', patient_updated)
+event.listen(Patient, 'after_delete', patient_deleted)
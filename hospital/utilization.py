@@ -0,0 +1,244 @@
+import numpy as np
+from flask import current_app
+from sqlalchemy import Integer, cast, event, func, inspect
+from sqlalchemy.orm import object_session
+
+from hospital.archive import ARCHIVES
+from hospital.extensions import db
+from hospital.models import Appointment, DoctorAvailability, DoctorDayBookings
+from hospital.sharding import scatter
+
+
+# Doctor utilization
+# everything is laid out on a grid of appointment slots: a boolean array of
+# doctors x days x slots of the day for the available time and another for
+# the booked time, so every figure is a few whole-array operations however
+# many doctors and days are asked for. Availability windows are snapped
+# inwards to slot boundaries, since a slot only partly inside a window
+# cannot be booked
+
+# the slot grid of each doctor's weekly availability: doctors x 7 x slots
+def weekly_availability(doctor_ids, slot_minutes):
+    slots = 24 * 60 // slot_minutes
+    index = {doctor_id: n for n, doctor_id in enumerate(doctor_ids)}
+    week = np.zeros((len(doctor_ids), 7, slots + 1), dtype=np.int8)
+
+    windows = db.session.query(DoctorAvailability.doctor_id, DoctorAvailability.day_of_week,
+                               DoctorAvailability.start_time, DoctorAvailability.end_time) \
+        .filter(DoctorAvailability.doctor_id.in_(doctor_ids)).all()
+    if windows:
+        doctor, weekday, start, end = zip(*windows)
+        doctor = np.array([index[doctor_id] for doctor_id in doctor])
+        weekday = np.array(weekday) % 7
+        start = np.array([-(-(time.hour * 60 + time.minute) // slot_minutes) for time in start])
+        end = np.array([(time.hour * 60 + time.minute) // slot_minutes for time in end])
+        # an end of 00:00 closes the window at midnight
+        end = np.where(end == 0, slots, end)
+        keep = end > start
+        # +1 where a window opens and -1 where it closes, summed along the day;
+        # overlapping windows simply count twice
+        np.add.at(week, (doctor[keep], weekday[keep], start[keep]), 1)
+        np.add.at(week, (doctor[keep], weekday[keep], end[keep]), -1)
+
+    return np.cumsum(week, axis=2)[:, :, :slots] > 0
+
+
+# Booked slots
+# the doctor x day rows of DoctorDayBookings stand in for the appointments
+# table: a year of a few hundred doctors is some tens of thousands of short
+# strings instead of millions of appointment rows, and the strings go
+# straight into a numpy array. They live in the main database next to the
+# doctors, are kept current by the appointment listeners below and survive
+# archiving, which moves appointments without changing them. After a change
+# of APPOINTMENT_SLOT_MINUTES, or to fill them in for existing appointments,
+# run flask analytics rebuild-utilization
+
+def slot_count():
+    return 24 * 60 // current_app.config['APPOINTMENT_SLOT_MINUTES']
+
+def slot_of(date_time):
+    return (date_time.hour * 60 + date_time.minute) // current_app.config['APPOINTMENT_SLOT_MINUTES']
+
+
+# set or clear the slot of one appointment, creating the doctor's day
+def mark_slot(target, doctor_id, date_time, booked):
+    table = DoctorDayBookings.__table__
+    day = date_time.date()
+    position = slot_of(date_time)
+    # written to the main database whichever shard the appointment is on
+    connection = object_session(target).connection(bind_arguments={'bind': db.engines[None]})
+    connection.execute(table.insert().prefix_with('OR IGNORE').values(
+        doctor_id=doctor_id, day=day, slots='0' * slot_count()))
+    slots = func.substr(table.c.slots, 1, position, type_=db.String) \
+        + ('1' if booked else '0') + func.substr(table.c.slots, position + 2, type_=db.String)
+    connection.execute(table.update().where(table.c.doctor_id == doctor_id, table.c.day == day).values(slots=slots))
+
+
+def appointment_inserted(mapper, connection, target):
+    if target.status != 'Cancelled':
+        mark_slot(target, target.doctor_id, target.date_time, True)
+
+def appointment_updated(mapper, connection, target):
+    state = inspect(target)
+    old = {}
+    for name in ('doctor_id', 'date_time', 'status'):
+        history = state.attrs[name].history
+        old[name] = history.deleted[0] if history.has_changes() and history.deleted else getattr(target, name)
+    if old == {name: getattr(target, name) for name in old}:
+        return
+
+    if old['status'] != 'Cancelled':
+        mark_slot(target, old['doctor_id'], old['date_time'], False)
+    if target.status != 'Cancelled':
+        mark_slot(target, target.doctor_id, target.date_time, True)
+
+def appointment_deleted(mapper, connection, target):
+    if target.status != 'Cancelled':
+        mark_slot(target, target.doctor_id, target.date_time, False)
+
+
+# drop the booked slots and build them again from the live and archived
+# appointments of every shard
+def rebuild_bookings():
+    slots = slot_count()
+    model, archive_model = ARCHIVES['appointment'][:2]
+    days = {}
+
+    def read(shard):
+        rows = []
+        for source in (model, archive_model):
+            rows += db.session.query(source.doctor_id, source.date_time).filter(source.status != 'Cancelled').all()
+        return rows
+
+    for rows in scatter(read):
+        for doctor_id, date_time in rows:
+            day = days.setdefault((doctor_id, date_time.date()), bytearray(b'0' * slots))
+            day[slot_of(date_time)] = ord('1')
+
+    db.session.query(DoctorDayBookings).delete()
+    if days:
+        db.session.execute(DoctorDayBookings.__table__.insert(), [
+            {'doctor_id': doctor_id, 'day': day, 'slots': marks.decode()}
+            for (doctor_id, day), marks in days.items()])
+    db.session.commit()
+    return len(days)
+
+
+# doctors x days x slots of the booked time in [start_date, end_date]. Each
+# doctor comes back as one row: the day offsets and the slot strings of all
+# their days concatenated in the same order, read along the primary key
+def booked_slots(doctor_ids, start_date, end_date):
+    slots = slot_count()
+    booked = np.zeros((len(doctor_ids), (end_date - start_date).days + 1, slots), dtype=bool)
+
+    day = cast(func.julianday(DoctorDayBookings.day) - func.julianday(start_date), Integer)
+    rows = db.session.query(DoctorDayBookings.doctor_id, func.group_concat(day),
+                            func.group_concat(DoctorDayBookings.slots, '')) \
+        .filter(DoctorDayBookings.doctor_id.in_(doctor_ids),
+                DoctorDayBookings.day >= start_date, DoctorDayBookings.day <= end_date,
+                # days written before a change of slot size are left out until a rebuild
+                func.length(DoctorDayBookings.slots) == slots) \
+        .group_by(DoctorDayBookings.doctor_id).all()
+    if rows:
+        index = {doctor_id: n for n, doctor_id in enumerate(doctor_ids)}
+        days = np.fromstring(','.join(row[1] for row in rows), dtype=np.int64, sep=',')
+        doctor = np.repeat([index[row[0]] for row in rows], [len(row[2]) // slots for row in rows])
+        marks = np.frombuffer(''.join(row[2] for row in rows).encode(), dtype=np.uint8).reshape(len(days), slots)
+        booked[doctor, days] = marks == ord('1')
+    return booked
+
+
+# runs of True along the last axis: (row, start, length) arrays
+def runs(mask):
+    rows = mask.reshape(-1, mask.shape[-1]).astype(np.int8)
+    edges = np.diff(np.pad(rows, ((0, 0), (1, 1))), axis=1)
+    row, starts = np.nonzero(edges == 1)
+    ends = np.nonzero(edges == -1)[1]
+    return row, starts, ends - starts
+
+
+def ratio(booked, available):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(available > 0, booked / np.maximum(available, 1), 0.0).round(4)
+
+
+# booked against available minutes per doctor and day (or ISO week) over
+# [start_date, end_date], with the distribution of idle gaps on working days
+# and weekday x hour heatmaps
+def doctor_utilization(doctor_ids, start_date, end_date, group='day'):
+    slot_minutes = current_app.config['APPOINTMENT_SLOT_MINUTES']
+    slots = 24 * 60 // slot_minutes
+    days = (end_date - start_date).days + 1
+    weekdays = (np.arange(days) + start_date.weekday()) % 7
+
+    # doctors x days x slots
+    available = weekly_availability(doctor_ids, slot_minutes)[:, weekdays, :]
+    booked = booked_slots(doctor_ids, start_date, end_date)
+
+    in_hours = booked & available
+    available_per_day = available.sum(axis=2) * slot_minutes
+    booked_per_day = in_hours.sum(axis=2) * slot_minutes
+
+    day_dates = np.arange(np.datetime64(start_date), np.datetime64(start_date) + days)
+    if group == 'week':
+        # each ISO week starts on a Monday; the first may be cut short
+        period_starts = np.flatnonzero((weekdays == 0) | (np.arange(days) == 0))
+        available_per_period = np.add.reduceat(available_per_day, period_starts, axis=1)
+        booked_per_period = np.add.reduceat(booked_per_day, period_starts, axis=1)
+        periods = day_dates[period_starts]
+    else:
+        available_per_period, booked_per_period, periods = available_per_day, booked_per_day, day_dates
+
+    # idle gaps: free runs inside the available time of days with bookings
+    working = in_hours.any(axis=2)
+    free = available & ~booked & working[:, :, None]
+    row, gap_starts, gap_lengths = runs(free)
+    gap_doctor = row // days
+    gap_counts = np.bincount(gap_doctor, minlength=len(doctor_ids))
+    gap_minutes = np.bincount(gap_doctor, weights=gap_lengths, minlength=len(doctor_ids)) * slot_minutes
+    lengths, counts = np.unique(gap_lengths * slot_minutes, return_counts=True)
+
+    # weekday x hour of the day, summed over doctors and weeks
+    hour_of_slot = np.arange(slots) * slot_minutes // 60
+    cell = (weekdays[:, None] * 24 + hour_of_slot[None, :]).ravel()
+    booked_heat = np.bincount(cell, weights=in_hours.sum(axis=0).ravel(), minlength=7 * 24) * slot_minutes
+    available_heat = np.bincount(cell, weights=available.sum(axis=0).ravel(), minlength=7 * 24) * slot_minutes
+
+    outside = (booked & ~available).sum(axis=(1, 2)) * slot_minutes
+    total_available = available_per_day.sum(axis=1)
+    total_booked = booked_per_day.sum(axis=1)
+
+    return {
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'group': group,
+        'slot_minutes': slot_minutes,
+        'periods': [str(period) for period in periods],
+        'doctors': {
+            doctor_id: {
+                'available_minutes': available_per_period[n].tolist(),
+                'booked_minutes': booked_per_period[n].tolist(),
+                'utilization': ratio(booked_per_period[n], available_per_period[n]).tolist(),
+                'total': {
+                    'available_minutes': int(total_available[n]),
+                    'booked_minutes': int(total_booked[n]),
+                    'utilization': float(ratio(total_booked[n], total_available[n])),
+                    'outside_availability_minutes': int(outside[n]),
+                    'idle_gaps': int(gap_counts[n]),
+                    'mean_idle_gap_minutes': float(ratio(gap_minutes[n], gap_counts[n])),
+                },
+            }
+            for n, doctor_id in enumerate(doctor_ids)
+        },
+        'idle_gaps': {'minutes': lengths.tolist(), 'count': counts.tolist()},
+        'heatmap': {
+            'booked_minutes': booked_heat.reshape(7, 24).astype(int).tolist(),
+            'available_minutes': available_heat.reshape(7, 24).astype(int).tolist(),
+            'utilization': ratio(booked_heat, available_heat).reshape(7, 24).tolist(),
+        },
+    }
+
+
+event.listen(Appointment, 'after_insert', appointment_inserted)
+event.listen(Appointment, 'after_update', appointment_updated)
+event.listen(Appointment, 'after_delete', appointment_deleted)
@@ -0,0 +1,115 @@
+import datetime
+from flask import request
+from sqlalchemy import and_, event, inspect, literal, or_, select
+
+from hospital.extensions import db
+from hospital.listing import bad_request
+from hospital.models import Patient, PatientHistory, PatientHistoryVersion, PatientVersion
+from hospital.sharding import scatter
+
+
+# Temporal versions
+# every flush that writes a patient or a history entry closes its current
+# version and opens one with the new values, on the connection of the write,
+# so the version lands on the same shard in the same transaction. The state
+# at a past moment is then read with one seek on the (id, valid_from) key
+# instead of being pieced together from the change log
+
+def copied_columns(version_model):
+    return [column.name for column in version_model.__table__.columns if column.name not in ('id', 'valid_from', 'valid_to')]
+
+# model -> (version model, columns copied into each version)
+VERSIONED = {
+    Patient: (PatientVersion, copied_columns(PatientVersion)),
+    PatientHistory: (PatientHistoryVersion, copied_columns(PatientHistoryVersion)),
+}
+
+
+def close_version(connection, table, id, now):
+    # a version opened in this same instant was never in force
+    connection.execute(table.delete().where(table.c.id == id, table.c.valid_from == now))
+    connection.execute(table.update().where(table.c.id == id, table.c.valid_to.is_(None)).values(valid_to=now))
+
+def open_version(connection, table, columns, target, now):
+    connection.execute(table.insert().values(id=target.id, valid_from=now,
+                                             **{name: getattr(target, name) for name in columns}))
+
+
+def row_inserted(mapper, connection, target):
+    version_model, columns = VERSIONED[mapper.class_]
+    open_version(connection, version_model.__table__, columns, target, datetime.datetime.utcnow())
+
+def row_updated(mapper, connection, target):
+    version_model, columns = VERSIONED[mapper.class_]
+    state = inspect(target)
+    if not any(state.attrs[name].history.has_changes() for name in columns):
+        return
+    now = datetime.datetime.utcnow()
+    close_version(connection, version_model.__table__, target.id, now)
+    open_version(connection, version_model.__table__, columns, target, now)
+
+def row_deleted(mapper, connection, target):
+    version_model, columns = VERSIONED[mapper.class_]
+    close_version(connection, version_model.__table__, target.id, datetime.datetime.utcnow())
+
+
+# Reading
+# ?as_of= as a UTC moment: a date (its midnight) or a date and time, down to
+# the microsecond; a time with an offset is converted to UTC
+def as_of_arg():
+    value = request.args.get('as_of')
+    if not value:
+        return None
+    try:
+        moment = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        bad_request('as_of must be a date or a date and time (YYYY-MM-DD HH:MM:SS)')
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return moment
+
+# valid_from <= moment < valid_to
+def in_force(version_model, moment):
+    return and_(version_model.valid_from <= moment,
+                or_(version_model.valid_to.is_(None), version_model.valid_to > moment))
+
+# fields (public name -> column of model, see hospital.listing) pointed at
+# the same columns of the version model
+def version_fields(fields, version_model):
+    result = {}
+    for name, spec in fields.items():
+        column, format = spec if isinstance(spec, tuple) else (spec, None)
+        column = getattr(version_model, column.key)
+        result[name] = (column, format) if format else column
+    return result
+
+# query (over version_model) narrowed to the version of row id in force at
+# moment; newest first, so the seek stops at the first version it reads
+def version_as_of(query, version_model, id, moment):
+    return query.filter(version_model.id == id, in_force(version_model, moment)) \
+        .order_by(version_model.valid_from.desc()).first()
+
+
+# open a version, valid from now, for every row written before versioning
+# was on (or behind its back, by a Core statement), on every shard
+def open_missing_versions():
+    return sum(scatter(lambda shard: open_shard_missing_versions()))
+
+def open_shard_missing_versions():
+    now = datetime.datetime.utcnow()
+    opened = 0
+    for model, (version_model, columns) in VERSIONED.items():
+        source = model.__table__
+        table = version_model.__table__
+        current = select(table.c.id).where(table.c.valid_to.is_(None))
+        rows = select(source.c.id, literal(now, db.DateTime), *[source.c[name] for name in columns]) \
+            .where(source.c.id.not_in(current))
+        opened += db.session.execute(table.insert().from_select(['id', 'valid_from'] + columns, rows)).rowcount
+    db.session.commit()
+    return opened
+
+
+for model in VERSIONED:
+    event.listen(model, 'after_insert', row_inserted)
+    event.listen(model, 'after_update', row_updated)
+    event.listen(model, 'after_delete', row_deleted)
@@ -0,0 +1,54 @@
+import datetime
+import jwt
+import pytest
+from werkzeug.security import generate_password_hash
+
+from hospital import create_app
+from hospital.extensions import db
+from hospital.models import Role, User
+
+SECRET_KEY = 'test-secret-key-of-at-least-32-bytes'
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SECRET_KEY': SECRET_KEY,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///%s' % (tmp_path / 'hospital.db'),
+        # every request sees the writes of the one before
+        'RESULT_CACHE_SYNC_INTERVAL': 0,
+        'RATE_LIMITS': {},
+        'JOB_STORE': str(tmp_path / 'jobs.db'),
+    })
+    with app.app_context():
+        # the main database only; shard binds registered by other apps share db.metadatas
+        db.create_all(bind_key=None)
+        db.session.add_all([
+            Role(id=1, name='admin'),
+            Role(id=2, name='staff'),
+            User(id=1, username='admin', password=generate_password_hash('admin-password'), role_id=1),
+            User(id=2, username='clerk', password=generate_password_hash('clerk-password'), role_id=2),
+        ])
+        db.session.commit()
+    yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def token(user_id, **claims):
+    return jwt.encode(dict(claims, id=user_id, exp=datetime.datetime.utcnow() + datetime.timedelta(minutes=5)),
+                      SECRET_KEY, algorithm='HS256')
+
+
+@pytest.fixture
+def admin():
+    return {'Authorization': token(1)}
+
+
+@pytest.fixture
+def clerk():
+    return {'Authorization': token(2)}
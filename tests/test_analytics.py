@@ -0,0 +1,87 @@
+import datetime
+import pickle
+import pytest
+from sqlalchemy import text
+
+from hospital.cache import SQLiteStore
+from hospital.extensions import db
+from hospital.models import (Admission, Doctor, DoctorAvailability, HospitalStaff, OperationTheatreBooking,
+                             StaffAttendance, StaffAvailability)
+
+PATIENT = {'first_name': 'Ada', 'last_name': 'Byron', 'gender': 'F', 'date_of_birth': '1980-01-01',
+           'phone': '5550000', 'email': 'ada@example.org', 'address': '1 Road'}
+
+
+def staff_names(client, headers, **args):
+    rows = client.get('/analytics/hospital-staff', query_string=args, headers=headers).get_json()
+    return [row['last_name'] for row in rows]
+
+
+def test_cached_until_a_write(app, client, admin):
+    client.post('/hospital-staff', json={'first_name': 'Ann', 'last_name': 'Able', 'designation': 'Nurse'}, headers=admin)
+    assert staff_names(client, admin) == ['Able']
+
+    # a write outside the ORM does not invalidate, so the cached result is served
+    with app.app_context():
+        db.session.execute(text("INSERT INTO hospital_staff (first_name, last_name, job_title) "
+                                "VALUES ('Bob', 'Baker', 'Porter')"))
+        db.session.commit()
+    assert staff_names(client, admin) == ['Able']
+
+    # a write through the ORM drops it
+    client.post('/hospital-staff', json={'first_name': 'Cy', 'last_name': 'Cole', 'designation': 'Nurse'}, headers=admin)
+    assert staff_names(client, admin) == ['Able', 'Baker', 'Cole']
+    assert staff_names(client, admin, job_title='Nurse', name='ann') == ['Able']
+
+
+
+def test_store_hits_rarely_write(tmp_path):
+    store = SQLiteStore(str(tmp_path / 'cache.db'), 1024 * 1024, touch_interval=60)
+    store.put('key', pickle.dumps('value'), ('patient',), 0, None)
+
+    def used():
+        return store.connection().execute('SELECT used FROM cache_entry').fetchone()[0]
+
+    stored = used()
+    assert store.get('key')[0] == 'value' and used() == stored
+    store.touch_interval = 0
+    store.get('key')
+    assert used() > stored
+
+
+def test_aggregates(app, client, admin):
+    patient_id = client.post('/patients', json=PATIENT, headers=admin).get_json()['id']
+    client.post('/patients', json=dict(PATIENT, email='eve@example.org', phone='5550001', first_name='Eve'), headers=admin)
+    with app.app_context():
+        db.session.add_all([
+            Doctor(id=1, first_name='Gregory', last_name='House', specialization='Diagnostics'),
+            DoctorAvailability(doctor_id=1, day_of_week=0, start_time=datetime.time(9), end_time=datetime.time(12)),
+            DoctorAvailability(doctor_id=1, day_of_week=0, start_time=datetime.time(13), end_time=datetime.time(17)),
+            HospitalStaff(id=1, first_name='Ann', last_name='Able', job_title='Nurse'),
+            StaffAvailability(staff_id=1, start_time=datetime.datetime(2024, 6, 3, 8), end_time=datetime.datetime(2024, 6, 3, 16)),
+            StaffAttendance(staff_id=1, date=datetime.date(2024, 6, 3), status='Present'),
+            StaffAttendance(staff_id=1, date=datetime.date(2024, 6, 4), status='Absent'),
+            OperationTheatreBooking(patient_id=patient_id, doctor_id=1, operation_type='Appendectomy', date=datetime.date(2024, 6, 3),
+                                    start_time=datetime.time(9), end_time=datetime.time(10)),
+            Admission(patient_id=patient_id, registration_date_time=datetime.datetime(2024, 6, 1, 8), status='Admitted'),
+        ])
+        db.session.commit()
+
+    status = client.get('/analytics/patient-status', headers=admin).get_json()
+    assert status == {'total_patients': 2, 'statuses': [{'status': None, 'count': 1}, {'status': 'Admitted', 'count': 1}]}
+
+    doctors = client.get('/analytics/doctor-availability', headers=admin).get_json()
+    assert doctors['availabilities'] == [{'day_of_week': 0, 'available_doctors': 1}]
+
+    staff = client.get('/analytics/staff-availability', headers=admin).get_json()
+    assert staff['availabilities'] == [{'date': '2024-06-03', 'available_staff': 1}]
+    assert staff['attendances'] == [{'staff_id': 1, 'days_present': 1}]
+
+    bookings = client.get('/analytics/operation-theatre-bookings?doctor_id=1&date_start=2024-06-03', headers=admin).get_json()
+    assert [(booking['patient_id'], booking['date'], booking['start_time']) for booking in bookings] == [(patient_id, '2024-06-03', '09:00:00')]
+    assert client.get('/analytics/operation-theatre-bookings?date_start=2024-06-04', headers=admin).get_json() == []
+
+
+@pytest.mark.parametrize('query', ['doctor_id=x', 'patient_id=1.5', 'date_start=June', 'date_end=2024-13-01'])
+def test_bad_booking_filters(client, admin, query):
+    assert client.get('/analytics/operation-theatre-bookings?' + query, headers=admin).status_code == 400
@@ -0,0 +1,72 @@
+from hospital.extensions import db
+from hospital.models import Role
+
+from conftest import token
+
+
+def test_login_returns_a_usable_token(client):
+    response = client.post('/login', json={'username': 'admin', 'password': 'admin-password'})
+    assert response.status_code == 200
+
+    response = client.get('/users', headers={'Authorization': response.get_json()['token']})
+    assert response.status_code == 200
+
+
+def test_login_rejects_a_wrong_password(client):
+    response = client.post('/login', json={'username': 'admin', 'password': 'wrong'})
+    assert response.status_code == 401
+
+
+def test_missing_and_invalid_tokens(client):
+    assert client.get('/users').status_code == 401
+    assert client.get('/users', headers={'Authorization': 'not-a-token'}).status_code == 401
+
+
+def test_permission_required(client, admin, clerk):
+    payload = {'username': 'nurse', 'password': 'nurse-password', 'role_id': 2}
+    response = client.post('/users', json=payload, headers=clerk)
+    assert response.get_json() == {'message': 'You do not have permission to perform this action'}
+
+    response = client.post('/users', json=payload, headers=admin)
+    assert response.get_json() == {'message': 'User created'}
+    assert client.post('/login', json={'username': 'nurse', 'password': 'nurse-password'}).status_code == 200
+
+
+def test_role_claim_in_token_is_not_trusted(client):
+    # the clerk claims the admin role
+    headers = {'Authorization': token(2, role_id=1)}
+    response = client.post('/users', json={'username': 'x', 'password': 'x', 'role_id': 1}, headers=headers)
+    assert response.get_json() == {'message': 'You do not have permission to perform this action'}
+
+
+def test_role_change_applies_to_existing_tokens(client, admin, clerk):
+    payload = {'username': 'nurse', 'password': 'nurse-password', 'role_id': 2}
+    assert client.post('/users', json=payload, headers=clerk).get_json()['message'].startswith('You do not')
+
+    client.put('/users/2', json={'role_id': 1}, headers=admin)
+    assert client.post('/users', json=payload, headers=clerk).get_json() == {'message': 'User created'}
+
+    client.put('/users/2', json={'role_id': 2}, headers=admin)
+    assert client.post('/users', json=dict(payload, username='other'), headers=clerk).get_json()['message'].startswith('You do not')
+
+
+def test_role_permission_change_applies_at_once(app, client, clerk):
+    payload = {'username': 'nurse', 'password': 'nurse-password', 'role_id': 2}
+    assert client.post('/users', json=payload, headers=clerk).get_json()['message'].startswith('You do not')
+
+    with app.app_context():
+        db.session.get(Role, 2).permissions = 'users:write'
+        db.session.commit()
+    assert client.post('/users', json=payload, headers=clerk).get_json() == {'message': 'User created'}
+
+
+def test_deleted_user_token_is_rejected(client, admin, clerk):
+    client.delete('/users/2', headers=admin)
+    assert client.get('/users', headers=clerk).status_code == 401
+
+
+def test_user_writes_are_validated(client, admin):
+    assert client.post('/users', json={'username': 'x'}, headers=admin).status_code == 400
+    assert client.post('/users', json={'username': 'x', 'password': 'x', 'role_id': 9}, headers=admin).status_code == 400
+    assert client.post('/users', json={'username': 'clerk', 'password': 'x', 'role_id': 2}, headers=admin).status_code == 400
+    assert client.put('/users/2', json={'role_id': 'admin'}, headers=admin).status_code == 400
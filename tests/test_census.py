@@ -0,0 +1,67 @@
+import datetime
+import pytest
+
+from hospital.extensions import db
+from hospital.models import Admission
+
+
+@pytest.fixture
+def admissions(app):
+    with app.app_context():
+        db.session.add_all([
+            Admission(patient_id=1, registration_date_time=datetime.datetime(2024, 1, 1, 10),
+                      discharge_date_time=datetime.datetime(2024, 1, 3, 12), status='Completed'),
+            Admission(patient_id=2, registration_date_time=datetime.datetime(2024, 1, 2, 8),
+                      discharge_date_time=None, status='Admitted'),
+            Admission(patient_id=3, registration_date_time=datetime.datetime(2024, 1, 2, 9),
+                      discharge_date_time=None, status='Cancelled'),
+        ])
+        db.session.commit()
+
+
+def occupancy(client, headers, query):
+    response = client.get('/analytics/bed-census?' + query, headers=headers)
+    assert response.status_code == 200
+    return [point['occupancy'] for point in response.get_json()['census']]
+
+
+def test_bed_census_takes_bare_dates(client, admin, admissions):
+    assert occupancy(client, admin, 'start=2024-01-01&end=2024-01-04&step=1440') == [0, 1, 2, 1]
+
+
+def test_bed_census_takes_times(client, admin, admissions):
+    assert occupancy(client, admin, 'start=2024-01-02 07:00&end=2024-01-02 09:00') == [1, 2, 2]
+    assert occupancy(client, admin, 'start=2024-01-03 12:00:00&end=2024-01-03 12:00:00') == [1]
+
+
+@pytest.mark.parametrize('query', [
+    '',
+    'end=2024-01-02',
+    'start=2024-01-01',
+    'start=yesterday&end=2024-01-02',
+    'start=2024-01-01&end=2024-13-01',
+    'start=2024-01-02&end=2024-01-01',
+    'start=2024-01-01&end=2024-01-02&step=0',
+    'start=2024-01-01&end=2024-01-02&step=hourly',
+    'start=2024-01-01&end=2024-01-02&step=99999999999999',
+    'start=2024-01-01&end=2024-01-02&step=-99999999999999',
+    'start=2000-01-01&end=2024-01-01&step=1',
+])
+def test_bad_bed_census_requests(client, admin, query):
+    assert client.get('/analytics/bed-census?' + query, headers=admin).status_code == 400
+
+
+def test_list_date_arguments_are_checked(client, admin):
+    assert client.get('/admissions?start=not-a-date', headers=admin).status_code == 400
+
+
+def test_bed_census_counts_archived_stays(app, client, admin, admissions):
+    before = occupancy(client, admin, 'start=2024-01-01&end=2024-01-05&step=720')
+
+    from hospital.archive import archive_all
+    from hospital.census import rebuild_snapshots
+    with app.app_context():
+        assert archive_all(horizon_days=30)['admission'] == 2
+        assert occupancy(client, admin, 'start=2024-01-01&end=2024-01-05&step=720') == before
+        rebuild_snapshots()
+    assert occupancy(client, admin, 'start=2024-01-01&end=2024-01-05&step=720') == before
@@ -0,0 +1,38 @@
+import datetime
+
+from hospital.extensions import db
+from hospital.models import ChangeLog
+
+PATIENT = {'first_name': 'Ada', 'last_name': 'Byron', 'gender': 'F', 'date_of_birth': '1980-01-01',
+           'phone': '5550000', 'email': 'ada@example.org', 'address': '1 Road'}
+
+
+def changes(client, headers):
+    return client.get('/changes', headers=headers).get_json()['changes']
+
+
+def test_changes_log_integer_keyed_rows(client, admin):
+    id = client.post('/patients', json=PATIENT, headers=admin).get_json()['id']
+    assert {'entity': 'patient', 'id': id, 'operation': 'insert'} in [
+        {name: change[name] for name in ('entity', 'id', 'operation')} for change in changes(client, admin)]
+    assert all(isinstance(change['id'], int) for change in changes(client, admin))
+
+
+def test_changes_skip_rows_without_an_integer_key(client, admin):
+    before = changes(client, admin)
+    client.put('/reference-ranges/sodium', json={'low': 135, 'high': 145}, headers=admin)
+    assert client.get('/reference-ranges', headers=admin).get_json()['reference_ranges'][0]['test_type'] == 'sodium'
+    assert changes(client, admin) == before
+
+
+def test_archive_run_prunes_old_changes(app, client, admin):
+    for n in range(3):
+        client.post('/patients', json=dict(PATIENT, email='p%d@example.org' % n), headers=admin)
+    before = changes(client, admin)
+    with app.app_context():
+        ChangeLog.query.update({'changed_at': datetime.datetime(2000, 1, 1)})
+        db.session.commit()
+
+    output = app.test_cli_runner().invoke(args=['archive', 'run']).output
+    assert 'change_log: %d rows pruned' % (len(before) - 1) in output
+    assert changes(client, admin) == before[-1:]
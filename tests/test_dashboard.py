@@ -0,0 +1,32 @@
+import concurrent.futures
+import json
+
+from hospital import dashboard
+from hospital.dashboard import get_broadcaster
+
+
+def test_broadcaster_survives_a_failed_tick(app, monkeypatch):
+    app.config['DASHBOARD_PUSH_INTERVAL'] = 0.01
+    calls = []
+
+    def flaky_stats():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError('database is locked')
+        return {'patient_count': 0}
+
+    monkeypatch.setattr(dashboard, 'dashboard_stats', flaky_stats)
+    broadcaster = get_broadcaster(app)
+    subscriber = broadcaster.subscribe()
+    try:
+        event = subscriber.get(timeout=5)
+    finally:
+        broadcaster.unsubscribe(subscriber)
+    assert json.loads(event.split('data: ')[1]) == {'patient_count': 0}
+    assert len(calls) == 2
+
+
+def test_one_broadcaster_per_app(app):
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        broadcasters = set(map(id, executor.map(lambda n: get_broadcaster(app), range(32))))
+    assert len(broadcasters) == 1
@@ -0,0 +1,71 @@
+import pytest
+
+from hospital import create_app
+from hospital.jobs import WORKER_STOPPED, get_job_runner
+from hospital.reports import REPORTS
+
+
+def broken_report(reason=None):
+    raise ValueError('no data for %s' % reason)
+
+
+@pytest.fixture
+def broken(monkeypatch):
+    monkeypatch.setitem(REPORTS, 'broken', (broken_report, 'staff-attendance:read'))
+
+
+def submit(client, headers, report='staff-attendance', **params):
+    return client.post('/jobs', json={'report': report, 'params': params}, headers=headers)
+
+
+def test_job_lifecycle(client, admin):
+    response = submit(client, admin, start_date='2024-01-01')
+    assert response.status_code == 202
+    id = response.get_json()['id']
+
+    job = client.get('/jobs/%s?wait=10' % id, headers=admin).get_json()
+    assert job['status'] == 'done'
+    assert client.get('/jobs/%s/result' % id, headers=admin).get_json() == {'attendance_report': {}}
+
+    # an identical submission gets the finished job back
+    again = submit(client, admin, start_date='2024-01-01')
+    assert again.status_code == 200
+    assert again.get_json()['id'] == id
+    assert again.get_json()['created'] is False
+
+
+def test_failed_report_result(client, admin, broken):
+    id = submit(client, admin, 'broken', reason='june').get_json()['id']
+    assert client.get('/jobs/%s?wait=10' % id, headers=admin).get_json()['status'] == 'failed'
+
+    response = client.get('/jobs/%s/result' % id, headers=admin)
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'failed'
+    assert response.get_json()['error'] == 'no data for june'
+
+    # a failed job is run again on the next submission
+    assert submit(client, admin, 'broken', reason='june').status_code == 202
+
+
+def test_jobs_are_shared_between_workers(app, client, admin):
+    # a second app on the same store stands in for another worker
+    other = create_app(dict(app.config)).test_client()
+    id = submit(client, admin).get_json()['id']
+
+    assert other.get('/jobs/%s?wait=10' % id, headers=admin).get_json()['status'] == 'done'
+    assert other.get('/jobs/%s/result' % id, headers=admin).get_json() == {'attendance_report': {}}
+    assert submit(other, admin).get_json()['id'] == id
+
+
+def test_jobs_of_a_stopped_worker_fail(app, client, admin):
+    store = get_job_runner(app).store
+    job, created = store.submit('staff-attendance', {})
+    store.connection().execute('UPDATE report_job SET worker = ? WHERE id = ?', (2 ** 22 + 1, job.id))
+
+    response = client.get('/jobs/%s' % job.id, headers=admin).get_json()
+    assert (response['status'], response['error']) == ('failed', WORKER_STOPPED)
+
+
+def test_unknown_job(client, admin):
+    assert client.get('/jobs/missing', headers=admin).status_code == 404
+    assert client.get('/jobs/missing/result', headers=admin).status_code == 404
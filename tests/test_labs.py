@@ -0,0 +1,56 @@
+import datetime
+import pytest
+
+from hospital.extensions import db
+from hospital.models import LabResult, Patient
+
+
+@pytest.fixture
+def patient(app):
+    with app.app_context():
+        db.session.add(Patient(id=1, first_name='Ann', last_name='Lee', gender='F', date_of_birth=datetime.date(1980, 1, 1),
+                               contact_number='555', email='ann@example.org', address='1 Road'))
+        db.session.commit()
+
+
+def result(value, day, patient_id=1):
+    return {'patient_id': patient_id, 'test_type': 'potassium', 'taken_at': '2024-01-%02d 08:00:00' % day, 'value': value}
+
+
+def test_record_results_and_trend(client, admin, patient):
+    response = client.post('/lab-results', json=[result(3.2, 1), result(4.0, 2), result(5.6, 3)], headers=admin)
+    assert response.get_json() == {'message': 'Lab results recorded', 'count': 3}
+    assert client.put('/reference-ranges/potassium', json={'low': 3.5, 'high': 5.1}, headers=admin).status_code == 200
+
+    trend = client.get('/lab-results/trend?patient_id=1&test_type=potassium', headers=admin).get_json()
+    series = trend['patients']['1']
+    assert series['value'] == [3.2, 4.0, 5.6]
+    assert series['flag'] == ['L', None, 'H']
+    assert series['summary']['out_of_range'] == 2
+
+
+def test_unknown_patient_is_rejected(app, client, admin, patient):
+    response = client.post('/lab-results', json=[result(4.0, 1), result(4.0, 1, patient_id=2)], headers=admin)
+    assert response.status_code == 400
+    assert response.get_json()['patient_ids'] == [2]
+    with app.app_context():
+        assert LabResult.query.count() == 0
+
+
+@pytest.mark.parametrize('payload', [
+    {'low': 'low'},
+    {'high': [5]},
+    {'low': 6, 'high': 5},
+    {'unit': 5},
+    [],
+])
+def test_bad_reference_ranges(client, admin, payload):
+    assert client.put('/reference-ranges/potassium', json=payload, headers=admin).status_code == 400
+
+
+def test_reference_range_update_keeps_the_other_bound(client, admin):
+    client.put('/reference-ranges/potassium', json={'low': 3.5, 'high': 5.1}, headers=admin)
+    assert client.put('/reference-ranges/potassium', json={'high': 3.0}, headers=admin).status_code == 400
+    client.put('/reference-ranges/potassium', json={'high': 5.0}, headers=admin)
+    ranges = client.get('/reference-ranges', headers=admin).get_json()['reference_ranges']
+    assert ranges == [{'test_type': 'potassium', 'low': 3.5, 'high': 5.0, 'unit': None}]
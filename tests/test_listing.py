@@ -0,0 +1,77 @@
+import datetime
+import pytest
+
+from hospital.extensions import db
+from hospital.models import Patient
+
+
+@pytest.fixture
+def patients(app):
+    with app.app_context():
+        for id, last_name in ((1, 'Smith'), (2, 'Smithers'), (3, 'Jones'), (12, 'Brown')):
+            db.session.add(Patient(id=id, first_name='P%d' % id, last_name=last_name, gender='F',
+                                   date_of_birth=datetime.date(1980, 1, id), contact_number='555%04d' % id,
+                                   email='p%d@example.org' % id, address='1 Road'))
+        db.session.commit()
+
+
+def ids(client, headers, query):
+    response = client.get('/patients?fields=id&' + query, headers=headers)
+    assert response.status_code == 200, response.get_json()
+    return [patient['id'] for patient in response.get_json()['patients']]
+
+
+def test_filters(client, admin, patients):
+    assert ids(client, admin, 'filter=last_name:prefix:Smith') == [1, 2]
+    assert ids(client, admin, 'filter=last_name:eq:Jones') == [3]
+    assert ids(client, admin, 'filter=id:in:1|12') == [1, 12]
+    assert ids(client, admin, 'filter=id:gte:2&filter=id:lt:12') == [2, 3]
+    assert ids(client, admin, 'filter=date_of_birth:lte:1980-01-02') == [1, 2]
+
+
+def test_sort_and_page(client, admin, patients):
+    assert ids(client, admin, 'sort=-last_name') == [2, 1, 3, 12]
+    response = client.get('/patients?fields=id&sort=id&page=2&per_page=3', headers=admin).get_json()
+    assert [patient['id'] for patient in response['patients']] == [12]
+
+
+def test_lists_are_paged_by_default(app, client, admin, patients):
+    app.config['LIST_PER_PAGE'] = 3
+    response = client.get('/patients?fields=id&sort=id', headers=admin).get_json()
+    assert [patient['id'] for patient in response['patients']] == [1, 2, 3]
+    assert response['has_more']
+
+
+def test_per_page_all_opts_out_of_paging(app, client, admin, patients):
+    app.config['LIST_PER_PAGE'] = 3
+    assert ids(client, admin, 'sort=id&per_page=all') == [1, 2, 3, 12]
+    app.config['LIST_UNPAGED'] = False
+    assert client.get('/patients?per_page=all', headers=admin).status_code == 400
+
+
+@pytest.mark.parametrize('query', [
+    'filter=nickname:eq:x',
+    'filter=last_name:like:Smith',
+    'filter=last_name',
+    'filter=id:prefix:1',
+    'filter=date_of_birth:prefix:1980',
+    'filter=id:eq:one',
+    'filter=id:in:1|two',
+    'filter=date_of_birth:eq:yesterday',
+    'sort=email',
+    'sort=nickname',
+    'fields=nickname',
+    'page=0',
+    'page=abc',
+    'page=-1',
+    'per_page=-1',
+    'per_page=2.5',
+    'per_page=all&page=2',
+])
+def test_bad_list_arguments(client, admin, patients, query):
+    assert client.get('/patients?' + query, headers=admin).status_code == 400
+
+
+def test_prefix_mismatch_lists_the_text_fields(client, admin):
+    body = client.get('/patients?filter=id:prefix:1', headers=admin).get_json()
+    assert 'last_name' in body['filterable'] and 'id' not in body['filterable']
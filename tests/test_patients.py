@@ -0,0 +1,112 @@
+import datetime
+import pytest
+
+from hospital.extensions import db
+from hospital.models import Appointment, Doctor, Role, User
+
+from conftest import token
+
+PATIENT = {'first_name': 'Ada', 'last_name': 'Byron', 'gender': 'F', 'date_of_birth': '1980-01-01',
+           'phone': '5550000', 'email': 'ada@example.org', 'address': '1 Road'}
+FORBIDDEN = {'message': 'You do not have permission to perform this action'}
+
+
+def create_patient(client, headers, **changes):
+    return client.post('/patients', json=dict(PATIENT, **changes), headers=headers).get_json()['id']
+
+
+def now():
+    return datetime.datetime.utcnow().isoformat()
+
+
+def test_as_of_reads(client, admin):
+    before = now()
+    id = create_patient(client, admin)
+    created = now()
+    client.post('/patients/%d/history' % id, json={'diagnosis': 'Flu', 'treatment_date': '2024-01-02'}, headers=admin)
+    client.put('/patients/%d' % id, json={'last_name': 'Lovelace'}, headers=admin)
+
+    assert client.get('/patients/%d' % id, headers=admin).get_json()['patient']['last_name'] == 'Lovelace'
+    assert client.get('/patients/%d?as_of=%s' % (id, created), headers=admin).get_json()['patient']['last_name'] == 'Byron'
+    assert client.get('/patients/%d?as_of=%s' % (id, before), headers=admin).get_json() == {'message': 'Patient not found'}
+
+    # the chart as it stood: the old name and no history entry yet
+    chart = client.get('/patient/%d?as_of=%s' % (id, created), headers=admin).get_json()
+    assert (chart['last_name'], chart['history']) == ('Byron', [])
+    chart = client.get('/patient/%d' % id, headers=admin).get_json()
+    assert (chart['last_name'], [entry['diagnosis'] for entry in chart['history']]) == ('Lovelace', ['Flu'])
+
+
+@pytest.mark.parametrize('as_of', ['yesterday', '2024-13-01'])
+def test_bad_as_of(client, admin, as_of):
+    assert client.get('/patients/1?as_of=' + as_of, headers=admin).status_code == 400
+
+
+@pytest.fixture
+def doctor(app):
+    # the doctor's user id (3) is not their doctor id (1)
+    with app.app_context():
+        db.session.add_all([
+            Role(id=3, name='doctor'),
+            Doctor(id=1, first_name='Gregory', last_name='House', specialization='Diagnostics'),
+            Doctor(id=3, first_name='James', last_name='Wilson', specialization='Oncology'),
+            User(id=3, username='house', password='x', role_id=3, doctor_id=1),
+        ])
+        db.session.commit()
+    return {'Authorization': token(3)}
+
+
+def book(app, patient_id, doctor_id):
+    with app.app_context():
+        db.session.add(Appointment(patient_id=patient_id, doctor_id=doctor_id, date_time=datetime.datetime(2024, 6, 3, 9)))
+        db.session.commit()
+
+
+def test_doctor_reads_their_patients(app, client, admin, doctor):
+    own = create_patient(client, admin)
+    other = create_patient(client, admin, email='eve@example.org', phone='5550001')
+    book(app, own, 1)
+    # booked with doctor 3, whose id is only the user's id
+    book(app, other, 3)
+
+    assert client.get('/patient/%d' % own, headers=doctor).get_json()['last_name'] == 'Byron'
+    assert client.get('/patient/%d' % other, headers=doctor).get_json() == FORBIDDEN
+
+
+def test_user_without_doctor_reads_no_charts(app, client, admin, doctor):
+    id = create_patient(client, admin)
+    book(app, id, 1)
+    client.put('/users/3', json={'doctor_id': None}, headers=admin)
+    assert client.get('/patient/%d' % id, headers=doctor).get_json() == FORBIDDEN
+
+
+def test_user_doctor_must_exist(client, admin, doctor):
+    response = client.put('/users/3', json={'doctor_id': 99}, headers=admin)
+    assert response.status_code == 400
+    assert response.get_json()['errors'] == {'doctor_id': 'is not a doctor'}
+
+
+def test_doctor_reads_only_their_patients_history(app, client, admin, doctor):
+    own = create_patient(client, admin)
+    other = create_patient(client, admin, email='eve@example.org', phone='5550001')
+    book(app, own, 1)
+    for id in (own, other):
+        client.post('/patients/%d/history' % id, json={'diagnosis': 'Flu', 'treatment_date': '2024-01-02'}, headers=admin)
+
+    assert [entry['diagnosis'] for entry in client.get('/patients/%d/history' % own, headers=doctor).get_json()['history']] == ['Flu']
+    assert client.get('/patients/%d/history' % other, headers=doctor).get_json() == FORBIDDEN
+    assert client.get('/patients/%d/history?as_of=%s' % (other, now()), headers=doctor).get_json() == FORBIDDEN
+
+
+def test_match(client, admin):
+    id = create_patient(client, admin)
+    response = client.post('/patients/match', json={'first_name': 'Ada', 'last_name': 'Byron', 'date_of_birth': '1980-01-01', 'phone': None}, headers=admin)
+    assert [match['id'] for match in response.get_json()['possible_duplicates']] == [id]
+    response = client.post('/patients/match', json={'first_name': 'Ada', 'last_name': 'Byron', 'date_of_birth': '1980-01-01', 'id': id}, headers=admin)
+    assert response.get_json()['possible_duplicates'] == []
+
+
+@pytest.mark.parametrize('body', [None, [], 'Byron', {'date_of_birth': '12/01/1990'}, {'last_name': 7}, {'id': 'me'}])
+def test_bad_match_requests(client, admin, body):
+    response = client.post('/patients/match', json=body, headers=admin)
+    assert response.status_code == 400
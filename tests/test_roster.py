@@ -0,0 +1,51 @@
+import datetime
+import pytest
+
+from hospital.extensions import db
+from hospital.models import Duty, HospitalStaff, StaffAvailability
+
+
+@pytest.fixture
+def staff(app):
+    with app.app_context():
+        for id in (1, 2):
+            db.session.add(HospitalStaff(id=id, first_name='S%d' % id, last_name='Staff', job_title='Nurse'))
+            db.session.add(StaffAvailability(staff_id=id, start_time=datetime.datetime(2024, 3, 1),
+                                             end_time=datetime.datetime(2024, 4, 1)))
+        db.session.commit()
+
+
+def test_generate_roster(app, client, admin, staff):
+    response = client.post('/generate_roster', headers=admin,
+                           json={'start_date': '2024-03-01', 'end_date': '2024-03-04', 'staff_per_day': 1})
+    assert response.status_code == 200
+    assert response.get_json()['assigned'] == 4
+    with app.app_context():
+        counts = sorted(count for count, in db.session.query(db.func.count(Duty.id)).group_by(Duty.staff_id))
+    assert counts == [2, 2]
+
+
+def test_dry_run_writes_nothing(app, client, admin, staff):
+    response = client.post('/generate_roster', headers=admin,
+                           json={'start_date': '2024-03-01', 'end_date': '2024-03-02', 'dry_run': True})
+    assert len(response.get_json()['duties']) == 2
+    with app.app_context():
+        assert Duty.query.count() == 0
+
+
+@pytest.mark.parametrize('payload', [
+    None,
+    [],
+    {'end_date': '2024-03-01'},
+    {'start_date': '2024-03-01', 'end_date': 'tomorrow'},
+    {'start_date': 20240301, 'end_date': '2024-03-02'},
+    {'start_date': '2024-03-02', 'end_date': '2024-03-01'},
+    {'start_date': '2024-01-01', 'end_date': '2030-01-01'},
+    {'start_date': '2024-03-01', 'end_date': '2024-03-02', 'staff_per_day': 0},
+    {'start_date': '2024-03-01', 'end_date': '2024-03-02', 'max_duties_per_staff': 'two'},
+    {'start_date': '2024-03-01', 'end_date': '2024-03-02', 'dry_run': 'yes'},
+])
+def test_bad_roster_requests(client, admin, payload):
+    response = client.post('/generate_roster', headers=admin, json=payload) if payload is not None else \
+        client.post('/generate_roster', headers=admin, data='not json', content_type='application/json')
+    assert response.status_code == 400
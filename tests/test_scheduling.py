@@ -0,0 +1,64 @@
+import concurrent.futures
+import threading
+import pytest
+
+from hospital.extensions import db
+from hospital.models import Doctor
+
+PATIENT = {'first_name': 'Ada', 'last_name': 'Byron', 'gender': 'F', 'date_of_birth': '1980-01-01',
+           'phone': '5550000', 'email': 'ada@example.org', 'address': '1 Road'}
+SLOT = {'doctor_id': 1, 'appointment_date': '2030-01-07', 'appointment_time': '09:00:00'}
+
+
+@pytest.fixture
+def patient_id(app, client, admin):
+    with app.app_context():
+        db.session.add(Doctor(id=1, first_name='Gregory', last_name='House', specialization='Diagnostics'))
+        db.session.commit()
+    return client.post('/patients', json=PATIENT, headers=admin).get_json()['id']
+
+
+def book(client, headers, patient_id, **changes):
+    return client.post('/appointments', json=dict(SLOT, patient_id=patient_id, **changes), headers=headers)
+
+
+def test_slot_booked_once(client, admin, patient_id):
+    first = book(client, admin, patient_id)
+    assert first.status_code == 200
+    second = book(client, admin, patient_id)
+    assert second.status_code == 409
+    assert second.get_json()['date_time'] == '2030-01-07 09:00:00'
+
+    # the doctor's next slot is still free
+    assert book(client, admin, patient_id, appointment_time='09:30:00').status_code == 200
+
+
+def test_parallel_bookings_of_one_slot(app, admin, patient_id):
+    threads = 16
+    barrier = threading.Barrier(threads)
+
+    def attempt(n):
+        client = app.test_client()
+        barrier.wait()
+        return book(client, admin, patient_id).status_code
+
+    with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        statuses = list(executor.map(attempt, range(threads)))
+    assert sorted(statuses) == [200] + [409] * (threads - 1)
+
+
+def test_cancelling_frees_the_slot(client, admin, patient_id):
+    id = book(client, admin, patient_id).get_json()['id']
+    assert client.put('/appointments/%d' % id, json={'status': 'Cancelled'}, headers=admin).status_code == 200
+    rebooked = book(client, admin, patient_id)
+    assert rebooked.status_code == 200
+
+    # a cancelled appointment cannot be revived over the new booking
+    assert client.put('/appointments/%d' % id, json={'status': 'Confirmed'}, headers=admin).status_code == 409
+
+    client.delete('/appointments/%d' % rebooked.get_json()['id'], headers=admin)
+    assert book(client, admin, patient_id).status_code == 200
+
+
+def test_off_slot_time(client, admin, patient_id):
+    assert book(client, admin, patient_id, appointment_time='09:10:00').status_code == 400
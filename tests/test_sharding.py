@@ -0,0 +1,128 @@
+import datetime
+import pytest
+
+from hospital import create_app
+from hospital.extensions import db
+from hospital import sharding
+from hospital.models import Admission, LabResult, PatientTest, PatientTestRecord, Role, User
+from hospital.routing import use_shard
+from hospital.sharding import create_shard_tables, patient_shard, scatter
+
+from conftest import SECRET_KEY
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SECRET_KEY': SECRET_KEY,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///%s' % (tmp_path / 'hospital.db'),
+        'SHARD_URIS': ['sqlite:///%s' % (tmp_path / ('shard%d.db' % n)) for n in range(2)],
+        'ID_BLOCK_SIZE': 2,
+        'RESULT_CACHE_SYNC_INTERVAL': 0,
+        'RATE_LIMITS': {},
+    })
+    with app.app_context():
+        db.create_all(bind_key=None)
+        create_shard_tables()
+        db.session.add_all([Role(id=1, name='admin'), User(id=1, username='admin', password='x', role_id=1)])
+        db.session.commit()
+    yield app
+
+
+def create_patients(client, headers, count):
+    ids = []
+    for n in range(count):
+        response = client.post('/patients', headers=headers, json={
+            'first_name': 'P%d' % n, 'last_name': 'Shard%d' % n, 'gender': 'F', 'date_of_birth': '1980-01-%02d' % (n + 1),
+            'phone': '555%04d' % n, 'email': 'p%d@example.org' % n, 'address': '%d Road' % n})
+        ids.append(response.get_json()['id'])
+    return ids
+
+
+def all_ids(model):
+    return [id for ids in scatter(lambda shard: [id for id, in db.session.query(model.id)]) for id in ids]
+
+
+def test_patients_spread_over_shards(app, client, admin):
+    ids = create_patients(client, admin, 6)
+    with app.app_context():
+        assert {patient_shard(id) for id in ids} == {0, 1}
+
+
+def test_lab_result_ids_are_unique_across_shards(app, client, admin):
+    ids = create_patients(client, admin, 6)
+    payload = [{'patient_id': id, 'test_type': 'sodium', 'taken_at': '2024-01-0%d 08:00:00' % day, 'value': 140}
+               for id in ids for day in (1, 2)]
+    assert client.post('/lab-results', json=payload, headers=admin).get_json()['count'] == 12
+
+    # results mirrored from patient tests take ids from the same blocks
+    with app.app_context():
+        for id in ids:
+            with use_shard(patient_shard(id)):
+                db.session.add(PatientTest(patient_id=id, test_type='sodium', test_date_time=datetime.datetime(2024, 1, 3),
+                                           test_result='141'))
+                db.session.commit()
+        lab_result_ids = all_ids(LabResult)
+    assert len(lab_result_ids) == 18
+    assert len(set(lab_result_ids)) == 18
+
+
+def test_patient_test_record_ids_are_unique_across_shards(app, client, admin):
+    ids = create_patients(client, admin, 6)
+    with app.app_context():
+        for id in ids:
+            with use_shard(patient_shard(id)):
+                db.session.add(PatientTestRecord(patient_id=id, test_name='x-ray', test_date='2024-01-01', test_result='ok'))
+                db.session.commit()
+        record_ids = all_ids(PatientTestRecord)
+    assert len(set(record_ids)) == 6
+
+
+def test_ids_are_reserved_before_the_flush(app, client, admin, monkeypatch):
+    ids = create_patients(client, admin, 1)
+    reserve_id_block = sharding.reserve_id_block
+    writing = []
+
+    # whether the session has written anything yet, and so holds a database's write lock
+    def record(table_name, size):
+        transaction = db.session().get_transaction()
+        connections = transaction._connections.values() if transaction else ()
+        writing.append(any(entry[0].connection.dbapi_connection.in_transaction for entry in connections))
+        return reserve_id_block(table_name, size)
+
+    monkeypatch.setattr(sharding, 'reserve_id_block', record)
+    with app.app_context(), use_shard(patient_shard(ids[0])):
+        db.session.add_all([PatientTestRecord(patient_id=ids[0], test_name='x-ray %d' % n, test_date='2024-01-01',
+                                              test_result='ok') for n in range(5)])
+        db.session.add_all([PatientTest(patient_id=ids[0], test_type='sodium', test_result=str(140 + n),
+                                        test_date_time=datetime.datetime(2024, 1, 1 + n)) for n in range(5)])
+        db.session.commit()
+        assert db.session.query(LabResult).count() == 5
+    assert writing and not any(writing)
+
+
+def test_locate_asks_one_shard_for_a_known_row(app, client, admin, monkeypatch):
+    patient_id, = create_patients(client, admin, 1)
+    with app.app_context(), use_shard(patient_shard(patient_id)):
+        admission = Admission(patient_id=patient_id, registration_date_time=datetime.datetime(2024, 1, 1))
+        db.session.add(admission)
+        db.session.commit()
+        admission_id = admission.id
+
+    def no_scatter(function, shards=None):
+        raise AssertionError('scattered')
+
+    monkeypatch.setattr(sharding, 'scatter', no_scatter)
+    payload = {'patient_id': patient_id, 'status': 'Admitted'}
+    assert client.put('/admissions/%d' % admission_id, json=payload, headers=admin).status_code == 200
+
+    # another worker has not seen the row; the patient in the body points at its shard
+    sharding.row_shards.clear()
+    assert client.put('/admissions/%d' % admission_id, json=payload, headers=admin).status_code == 200
+
+    monkeypatch.undo()
+    sharding.row_shards.clear()
+    response = client.put('/admissions/%d' % admission_id, json={'status': 'Completed'}, headers=admin)
+    assert response.status_code == 200
+    assert client.delete('/admissions/999999', headers=admin).get_json() == {'message': 'Admission not found'}
@@ -0,0 +1,131 @@
+import concurrent.futures
+import datetime
+import threading
+import pytest
+
+from hospital.extensions import db
+from hospital.models import DoctorAvailability, OperationTheater
+
+BOOKING = {'patient_id': 1, 'doctor_id': 1, 'operation_type': 'Appendectomy', 'date': '2024-06-03',
+           'start_time': '09:00:00', 'end_time': '10:30:00'}
+CASE = {'doctor_id': 1, 'duration': 60, 'earliest': '2024-06-03', 'latest': '2024-06-07'}
+
+
+def test_bookings_need_a_token(client):
+    assert client.get('/operation-theatre-bookings').status_code == 401
+    assert client.post('/operation-theatre-bookings', json=BOOKING).status_code == 401
+    assert client.put('/operation-theatre-bookings/1', json={'notes': 'x'}).status_code == 401
+    assert client.delete('/operation-theatre-bookings/1').status_code == 401
+
+
+def test_bookings_need_permission(client, clerk):
+    response = client.post('/operation-theatre-bookings', json=BOOKING, headers=clerk)
+    assert response.get_json() == {'message': 'You do not have permission to perform this action'}
+
+
+def test_booking_lifecycle(client, admin):
+    assert client.post('/operation-theatre-bookings', json=BOOKING, headers=admin).status_code == 200
+    bookings = client.get('/operation-theatre-bookings', headers=admin).get_json()['operation_theatre_bookings']
+    assert [booking['operation_type'] for booking in bookings] == ['Appendectomy']
+
+    id = bookings[0]['id']
+    client.put('/operation-theatre-bookings/%d' % id, json={'notes': 'fasting'}, headers=admin)
+    bookings = client.get('/operation-theatre-bookings', headers=admin).get_json()['operation_theatre_bookings']
+    assert bookings[0]['notes'] == 'fasting'
+
+    client.delete('/operation-theatre-bookings/%d' % id, headers=admin)
+    assert client.get('/operation-theatre-bookings', headers=admin).get_json()['operation_theatre_bookings'] == []
+
+
+def test_missing_booking(client, admin):
+    response = client.put('/operation-theatre-bookings/99', json={'notes': 'x'}, headers=admin)
+    assert response.get_json() == {'message': 'Operation theatre booking not found'}
+    response = client.delete('/operation-theatre-bookings/99', headers=admin)
+    assert response.get_json() == {'message': 'Operation theatre booking not found'}
+
+
+@pytest.fixture
+def theater(app):
+    with app.app_context():
+        db.session.add(OperationTheater(id=1, name='OT1', theater_name='Main', location='B1', availability='08:00-18:00'))
+        db.session.commit()
+
+
+def test_plan(client, admin, theater):
+    response = client.post('/operation-theaters/plan', json={'cases': [CASE], 'time_budget': 0.1}, headers=admin)
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('body', [
+    [CASE],
+    'cases',
+    {'cases': [CASE], 'time_budget': 'nan'},
+    {'cases': [CASE], 'time_budget': 'inf'},
+    {'cases': [CASE], 'time_budget': '-Infinity'},
+    {'cases': [CASE], 'time_budget': 'soon'},
+])
+def test_bad_plan_requests(client, admin, theater, body):
+    assert client.post('/operation-theaters/plan', json=body, headers=admin).status_code == 400
+
+
+# NaN and Infinity are accepted by the JSON parser
+@pytest.mark.parametrize('body', [
+    '{"cases": [{"doctor_id": 1, "duration": 60, "earliest": "2024-06-03", "latest": "2024-06-07"}], "time_budget": NaN}',
+    '{"cases": [{"doctor_id": 1, "duration": Infinity, "earliest": "2024-06-03", "latest": "2024-06-07"}]}',
+])
+def test_non_finite_json_numbers(client, admin, theater, body):
+    response = client.post('/operation-theaters/plan', data=body, content_type='application/json', headers=admin)
+    assert response.status_code == 400
+
+
+@pytest.fixture
+def monday_mornings(app):
+    with app.app_context():
+        db.session.add(DoctorAvailability(doctor_id=1, day_of_week=0, start_time=datetime.time(8), end_time=datetime.time(12)))
+        db.session.commit()
+
+
+def test_book_operation_theater(client, admin, monday_mornings):
+    # 2024-06-03 is a Monday
+    response = client.post('/operation-theater-booking', json=BOOKING, headers=admin)
+    assert response.status_code == 200
+    bookings = client.get('/operation-theatre-bookings', headers=admin).get_json()['operation_theatre_bookings']
+    assert [booking['id'] for booking in bookings] == [response.get_json()['id']]
+
+    overlapping = dict(BOOKING, start_time='10:00:00', end_time='11:00:00')
+    assert client.post('/operation-theater-booking', json=overlapping, headers=admin).status_code == 409
+    back_to_back = dict(BOOKING, start_time='10:30:00', end_time='11:30:00')
+    assert client.post('/operation-theater-booking', json=back_to_back, headers=admin).status_code == 200
+
+
+def test_parallel_overlapping_bookings(app, admin, monday_mornings):
+    threads = 8
+    barrier = threading.Barrier(threads)
+
+    def attempt(n):
+        client = app.test_client()
+        barrier.wait()
+        booking = dict(BOOKING, start_time='09:%02d:00' % (n * 5), end_time='10:%02d:00' % (n * 5))
+        return client.post('/operation-theater-booking', json=booking, headers=admin).status_code
+
+    with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        statuses = list(executor.map(attempt, range(threads)))
+    assert sorted(statuses) == [200] + [409] * (threads - 1)
+
+
+@pytest.mark.parametrize('changes, status', [
+    ({'date': '2024-06-04'}, 409),
+    ({'start_time': '11:00:00', 'end_time': '13:00:00'}, 409),
+    ({'doctor_id': 2}, 409),
+    ({'end_time': '08:30:00'}, 400),
+    ({'date': None}, 400),
+    ({'start_time': 'nine'}, 400),
+])
+def test_book_operation_theater_rejects(client, admin, monday_mornings, changes, status):
+    response = client.post('/operation-theater-booking', json=dict(BOOKING, **changes), headers=admin)
+    assert response.status_code == status
+
+
+def test_book_operation_theater_needs_permission(client, clerk, monday_mornings):
+    response = client.post('/operation-theater-booking', json=BOOKING, headers=clerk)
+    assert response.get_json() == {'message': 'You do not have permission to perform this action'}
@@ -0,0 +1,4 @@
+# entry point for pre-fork servers, e.g. gunicorn -c gunicorn.conf.py wsgi:app
+from hospital import create_app
+
+app = create_app()